@@ -0,0 +1,61 @@
+# bot/admin_registry.py
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+
+from db.session import AsyncSession
+from db.models import Admin
+
+
+@dataclass(frozen=True, slots=True)
+class AdminInfo:
+    id: int
+    username: Optional[str]
+
+
+class AdminRegistry:
+    """
+    Админы бота в памяти процесса — их единицы, поэтому таблица читается целиком при
+    старте. Проверка «админ ли это» и username — без запроса к БД. Кто меняет
+    таблицу admins, тот вызывает put и публикует ADMIN_CHANGED в cache_bus.
+    """
+
+    def __init__(self):
+        self._admins: dict[int, AdminInfo] = {}
+
+    def __len__(self):
+        return len(self._admins)
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self._admins
+
+    def get(self, user_id: int) -> Optional[AdminInfo]:
+        return self._admins.get(user_id)
+
+    def put(self, admin_id: int, username: Optional[str]) -> AdminInfo:
+        info = self._admins[admin_id] = AdminInfo(admin_id, username)
+        return info
+
+    def fallback_mention(self) -> str:
+        # Для групп без admin_username — как раньше, первый админ с юзернеймом
+        for info in self._admins.values():
+            if info.username:
+                return f"@{info.username}"
+        return "админ"
+
+    async def refresh(self, admin_id: int) -> Optional[AdminInfo]:
+        async with AsyncSession() as session:
+            admin = await session.get(Admin, admin_id)
+        if admin is None:
+            self._admins.pop(admin_id, None)
+            return None
+        return self.put(admin.id, admin.username)
+
+    async def load(self):
+        async with AsyncSession() as session:
+            rows = (await session.execute(select(Admin.id, Admin.username).order_by(Admin.id))).all()
+        self._admins = {admin_id: AdminInfo(admin_id, username) for admin_id, username in rows}
+
+
+admin_registry = AdminRegistry()
@@ -1,52 +1,176 @@
+"""
+Разовый обход: выдаёт медиа-права всем пользователям, которые могут писать.
+
+    python -m bot.allow_sending_media             # выполнить (продолжит с чекпоинта)
+    python -m bot.allow_sending_media --dry-run   # только оценить число запросов и время
+    python -m bot.allow_sending_media --reset     # начать заново, забыв чекпоинты
+    python -m bot.allow_sending_media --group -100123
+
+Пользователи читаются из БД keyset-пагинацией пачками, каждая пачка обрабатывается
+пулом из --concurrency воркеров. После каждой пачки в backfill_checkpoints
+сохраняется последний user_id, поэтому повторный запуск продолжает с места падения.
+"""
+import argparse
 import asyncio
+import os
+
 from aiogram import Bot
 from aiogram.types import ChatPermissions
-from sqlalchemy import select
-from db.session import AsyncSession
-from db.models import Group, UnblockedUserLimit
-import os
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
 from tqdm import tqdm
 
+from db.session import AsyncSession
+from db.models import Group, UnblockedUserLimit, BackfillCheckpoint
+from bot.bulk_restrict import iter_user_chunks, run_bounded, RESTRICT_CHUNK, RESTRICT_CONCURRENCY
+from bot.rate_limiter import rate_governor, RATE_LIMIT_GLOBAL
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")  # или вставьте токен напрямую
+BACKFILL_NAME = "media_permissions"
+CALLS_PER_USER = 2  # get_chat_member + restrict_chat_member
 
-async def grant_media_permissions():
-    bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
+MEDIA_PERMISSIONS = ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=True,
+    can_send_polls=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True
+)
+
+# Кому выдаём права (или ваша логика)
+can_write = UnblockedUserLimit.max_messages != 0
+
+
+async def load_checkpoints() -> dict[int, BackfillCheckpoint]:
+    async with AsyncSession() as session:
+        stmt = select(BackfillCheckpoint).where(BackfillCheckpoint.name == BACKFILL_NAME)
+        return {cp.group_id: cp for cp in (await session.execute(stmt)).scalars()}
+
+
+async def save_checkpoint(group_id: int, cursor: int, processed: int, failed: int, done: bool = False):
+    t = BackfillCheckpoint.__table__
+    values = dict(cursor=cursor, processed=processed, failed=failed, done=done)
+    stmt = insert(t).values(name=BACKFILL_NAME, group_id=group_id, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=[t.c.name, t.c.group_id], set_=values)
     async with AsyncSession() as session:
-        groups = (await session.execute(select(Group))).scalars().all()
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def reset_checkpoints():
+    async with AsyncSession() as session:
+        await session.execute(delete(BackfillCheckpoint).where(BackfillCheckpoint.name == BACKFILL_NAME))
+        await session.commit()
+
+
+async def count_remaining(group_id: int, after_user_id: int) -> int:
+    async with AsyncSession() as session:
+        stmt = select(func.count()).where(
+            UnblockedUserLimit.group_id == group_id,
+            UnblockedUserLimit.user_id > after_user_id,
+            can_write
+        )
+        return (await session.execute(stmt)).scalar_one()
+
+
+async def grant_one(bot: Bot, group_id: int, user_id: int) -> str:
+    try:
+        member = await bot.get_chat_member(group_id, user_id)
+        if member.status not in ("member", "restricted") or not getattr(member, "can_send_messages", True):
+            return "skipped"
+        await bot.restrict_chat_member(chat_id=group_id, user_id=user_id, permissions=MEDIA_PERMISSIONS)
+        return "ok"
+    except Exception as e:
+        print(f"[!] Ошибка для пользователя {user_id} в группе {group_id}: {e}")
+        return "failed"
+
+
+async def grant_group(bot: Bot, group_id: int, checkpoint: BackfillCheckpoint | None, concurrency: int):
+    cursor = checkpoint.cursor if checkpoint else 0
+    processed = checkpoint.processed if checkpoint else 0
+    failed = checkpoint.failed if checkpoint else 0
+    granted = skipped = 0
+
+    total = await count_remaining(group_id, cursor)
+    print(f"Update for group #{group_id}" + (f" (продолжаем после user_id={cursor})" if cursor else ""))
+
+    with tqdm(total=total) as progress:
+        async for user_ids in iter_user_chunks(group_id, cursor, RESTRICT_CHUNK, can_write):
+            results = await run_bounded(user_ids, lambda user_id: grant_one(bot, group_id, user_id), concurrency)
+
+            cursor = user_ids[-1]
+            processed += len(user_ids)
+            failed += results.count("failed")
+            granted += results.count("ok")
+            skipped += results.count("skipped")
+            await save_checkpoint(group_id, cursor, processed, failed)
+            progress.update(len(user_ids))
+
+    await save_checkpoint(group_id, cursor, processed, failed, done=True)
+    print(f"✅ Группа {group_id}: выдано {granted}, пропущено {skipped}, ошибок {failed}")
+
+
+async def estimate(groups: list[int], checkpoints: dict, concurrency: int):
+    users = 0
+    for group_id in groups:
+        checkpoint = checkpoints.get(group_id)
+        if checkpoint and checkpoint.done:
+            continue
+        remaining = await count_remaining(group_id, checkpoint.cursor if checkpoint else 0)
+        print(f"Группа {group_id}: осталось {remaining} пользователей")
+        users += remaining
+
+    calls = users * CALLS_PER_USER
+    # Упираемся в общий лимит бота на запросы, а не в число воркеров
+    seconds = calls / RATE_LIMIT_GLOBAL
+    print(
+        f"Итого: {users} пользователей, до {calls} запросов к API, "
+        f"~{seconds / 60:.1f} мин при {RATE_LIMIT_GLOBAL:g} запросах/с и {concurrency} воркерах"
+    )
+
+
+async def grant_media_permissions(dry_run: bool = False, reset: bool = False, group_id: int = None,
+                                  concurrency: int = RESTRICT_CONCURRENCY):
+    if reset and not dry_run:
+        await reset_checkpoints()
+
+    async with AsyncSession() as session:
+        stmt = select(Group.id).order_by(Group.id)
+        if group_id is not None:
+            stmt = stmt.where(Group.id == group_id)
+        groups = (await session.execute(stmt)).scalars().all()
+
+    checkpoints = {} if reset else await load_checkpoints()
+
+    if dry_run:
+        await estimate(groups, checkpoints, concurrency)
+        return
+
+    bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
+    bot.session.middleware(rate_governor)
+    try:
         for group in groups:
-            group_id = group.id
+            checkpoint = checkpoints.get(group)
+            if checkpoint and checkpoint.done:
+                print(f"Группа {group} уже обработана, пропускаем (--reset чтобы начать заново)")
+                continue
             try:
-                # Получаем всех пользователей из вашей базы, которые могут писать
-                stmt = select(UnblockedUserLimit).where(
-                    UnblockedUserLimit.group_id == group_id,
-                    UnblockedUserLimit.max_messages != 0  # или ваша логика
-                )
-                result = await session.execute(stmt)
-                user_limits = result.scalars().all()
-                print('Update for group #', group_id, sep='')
-                for user_limit in tqdm(user_limits):
-                    user_id = user_limit.user_id
-                    try:
-                        member = await bot.get_chat_member(group_id, user_id)
-                        if member.status in ("member", "restricted") and getattr(member, "can_send_messages", True):
-                            await bot.restrict_chat_member(
-                                chat_id=group_id,
-                                user_id=user_id,
-                                permissions=ChatPermissions(
-                                    can_send_messages=True,
-                                    can_send_media_messages=True,
-                                    can_send_polls=True,
-                                    can_send_other_messages=True,
-                                    can_add_web_page_previews=True
-                                )
-                            )
-                            print(f"✅ Media разрешения выданы для user {user_id} в группе {group_id}")
-                    except Exception as e:
-                        print(f"[!] Ошибка для пользователя {user_id} в группе {group_id}: {e}")
-                        continue
+                await grant_group(bot, group, checkpoint, concurrency)
             except Exception as e:
-                print(f"[!] Ошибка для группы {group_id}: {e}")
-    await bot.session.close()
+                print(f"[!] Ошибка для группы {group}: {e}")
+    finally:
+        await bot.session.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Выдать медиа-права пользователям групп")
+    parser.add_argument("--dry-run", action="store_true", help="только оценить число запросов и время")
+    parser.add_argument("--reset", action="store_true", help="забыть чекпоинты и начать заново")
+    parser.add_argument("--group", type=int, default=None, help="обработать только эту группу")
+    parser.add_argument("--concurrency", type=int, default=RESTRICT_CONCURRENCY, help="число воркеров")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    asyncio.run(grant_media_permissions())
\ No newline at end of file
+    args = parse_args()
+    asyncio.run(grant_media_permissions(args.dry_run, args.reset, args.group, args.concurrency))
@@ -0,0 +1,77 @@
+# bot/bench/fake_api.py
+import asyncio
+import datetime
+from collections import Counter
+from typing import AsyncGenerator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod, GetChatMember, GetMe
+from aiogram.types import Message, Chat, User, ChatMemberMember
+from sqlalchemy import event
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия Bot API без сети: отвечает правдоподобными объектами и считает вызовы
+    по методам. latency — искусственная задержка каждого ответа в секундах.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    def _message(self, chat_id) -> Message:
+        self._message_id += 1
+        chat_type = "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"
+        return Message(
+            message_id=self._message_id,
+            date=datetime.datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type=chat_type),
+        )
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="bench")
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="user"))
+
+        returning = getattr(method, "__returning__", None)
+        if returning is Message:
+            return self._message(getattr(method, "chat_id", 0))
+        if getattr(returning, "__origin__", None) is list:
+            media = getattr(method, "media", None) or [None]
+            return [self._message(getattr(method, "chat_id", 0)) for _ in media]
+        return True
+
+    async def stream_content(self, url: str, headers=None, timeout: int = 30, chunk_size: int = 65536,
+                             raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self):
+        pass
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+def fake_bot(latency: float = 0.0) -> Bot:
+    # Токен нужного формата, id бота = 42
+    return Bot(token="42:bench", session=FakeSession(latency))
+
+
+class QueryCounter:
+    """Считает SQL-запросы движка через событие before_cursor_execute."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
@@ -0,0 +1,156 @@
+"""
+Проигрывает журнал апдейтов (bot/middlewares/recorder.py) через настоящий Dispatcher
+и роутеры бота с поддельным Bot API и локальной БД (DATABASE_URL — не боевая база!).
+
+    python -m bot.bench.replay updates.jsonl.gz --rate 500 --repeat 3 --api-latency 0.05
+
+Печатает пропускную способность, p50/p95/p99 времени обработки апдейта,
+число SQL-запросов и вызовов Bot API на апдейт.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import time
+
+from sqlalchemy.dialects.postgresql import insert
+
+from bot import main as app
+from bot.bench.fake_api import fake_bot, QueryCounter
+from bot.deletion_batcher import deletion_batcher
+from bot.admin_registry import admin_registry
+from bot.group_cache import group_cache
+from bot.quota import quota_store
+from bot.timer_wheel import timer_wheel
+from db import query_stats
+from db.models import Group
+from db.session import AsyncSession, engine
+
+BENCH_ADMIN = "bench"
+
+
+def read_log(path: str) -> list[dict]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def update_chat(update: dict):
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(value.get("chat"), dict):
+            return value["chat"]
+    return None
+
+
+async def seed_groups(updates: list[dict], limit: int) -> int:
+    # Группы из журнала должны быть «своими», иначе limit_checker их отсечёт
+    chats = {}
+    for update in updates:
+        chat = update_chat(update)
+        if chat and chat.get("type") in ("group", "supergroup"):
+            chats[chat["id"]] = chat.get("title") or str(chat["id"])
+
+    if chats:
+        async with AsyncSession() as session:
+            stmt = insert(Group).values([
+                {"id": chat_id, "title": title, "admin_username": BENCH_ADMIN, "limit_msg": limit}
+                for chat_id, title in chats.items()
+            ]).on_conflict_do_nothing(index_elements=[Group.id])
+            await session.execute(stmt)
+            await session.commit()
+    return len(chats)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def replay(path: str, rate: float, repeat: int, api_latency: float, limit: int):
+    updates = read_log(path)
+    if not updates:
+        print("Журнал пуст")
+        return
+
+    bot = fake_bot(api_latency)
+    await app.prepare_database()
+    groups = await seed_groups(updates, limit)
+
+    # Те же компоненты, что в on_startup, но с поддельным ботом, без планировщика и журнала
+    dp = app.build_app(update_log="", with_metrics=False).dp
+    await group_cache.load()
+    await admin_registry.load()
+    deletion_batcher.start(bot)
+    timer_wheel.start(bot)
+    quota_store.start()
+
+    queries = QueryCounter(engine)
+    latencies: list[float] = []
+    errors = 0
+
+    async def feed(update: dict):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            errors += 1
+            print(f"[!] Ошибка обработки апдейта {update.get('update_id')}: {e}")
+        latencies.append(time.perf_counter() - started)
+
+    total = len(updates) * repeat
+    print(f"Апдейтов в журнале: {len(updates)}, групп: {groups}, всего к проигрыванию: {total}")
+
+    tasks = []
+    interval = 1 / rate if rate > 0 else 0
+    started = time.perf_counter()
+    for i in range(total):
+        update = dict(updates[i % len(updates)], update_id=i + 1)
+        tasks.append(asyncio.create_task(feed(update)))
+        if interval:
+            # Держим заданный темп относительно старта, а не от апдейта к апдейту
+            delay = started + (i + 1) * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % 100 == 99:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    # Хвосты фоновых записей тоже считаем: это запросы, порождённые апдейтами
+    timer_wheel.stop()
+    await deletion_batcher.stop()
+    await quota_store.stop()
+    api_calls = bot.session.total_calls()
+
+    print(f"Время: {elapsed:.2f} с, пропускная способность: {total / elapsed:.1f} апдейтов/с, ошибок: {errors}")
+    print(
+        "Обработка апдейта, мс: "
+        f"p50 {percentile(latencies, 0.50) * 1000:.2f}, "
+        f"p95 {percentile(latencies, 0.95) * 1000:.2f}, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.2f}"
+    )
+    print(f"SQL-запросов на апдейт: {queries.count / total:.2f} (всего {queries.count})")
+    print(f"Вызовов Bot API на апдейт: {api_calls / total:.2f} (всего {api_calls})")
+    for method, count in bot.session.calls.most_common():
+        print(f"  {method}: {count}")
+    print("SQL-запросов на апдейт по хендлерам:")
+    for handler, (handled, count, seconds) in sorted(query_stats.per_handler.items(), key=lambda item: -item[1][1]):
+        print(f"  {handler or 'без хендлера'}: {count / handled:.2f} ({seconds / handled * 1000:.2f} мс в БД, апдейтов {handled})")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Проиграть журнал апдейтов через роутеры бота")
+    parser.add_argument("log", help="журнал .jsonl или .jsonl.gz")
+    parser.add_argument("--rate", type=float, default=0, help="апдейтов в секунду (0 — как можно быстрее)")
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз проиграть журнал")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--limit", type=int, default=5, help="лимит сообщений для групп, созданных под замер")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(replay(args.log, args.rate, args.repeat, args.api_latency, args.limit))
@@ -0,0 +1,199 @@
+"""
+Нагрузочный замер планировщика рассылок на локальной БД (DATABASE_URL — не боевая база!).
+
+    python -m bot.bench.scheduler_bench --posts 20000 --window 60 --api-latency 0.05
+
+Создаёт посты (интервальные и по дате, альбомы, закреп/откреп/удаление) в тестовых
+группах, запускает start_scheduler со «сжатым временем»: все посты наступают в
+ближайшие --window секунд. Печатает время старта, память на задание, опоздание
+срабатываний и число SQL-запросов на отправку. Созданное удаляется в конце (--keep — оставить).
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import tracemalloc
+
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from sqlalchemy import delete, insert
+
+from bot import main as app
+from bot import scheduler as post_scheduler
+from bot.bench.fake_api import fake_bot, QueryCounter
+from bot.bench.replay import percentile
+from bot.deletion_batcher import deletion_batcher
+from bot.send_plan import compile_plan
+from db.models import Group, ScheduledPost, PostTarget, ScheduledTask
+from db.session import AsyncSession, engine
+
+BENCH_GROUP_BASE = -100999000000  # id тестовых групп: BENCH_GROUP_BASE - i
+BENCH_ADMIN = "bench"
+INSERT_CHUNK = 1000
+
+
+def rss_kb() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4
+
+
+def random_media(rnd: random.Random) -> str:
+    kind = rnd.random()
+    if kind < 0.4:
+        return json.dumps([{"type": "text", "file_id": None}])
+    if kind < 0.7:
+        return json.dumps([{"type": "photo", "file_id": f"bench-photo-{rnd.randrange(10**6)}"}])
+    count = rnd.randint(2, 10)
+    return json.dumps([{"type": rnd.choice(("photo", "video")), "file_id": f"bench-{i}"} for i in range(count)])
+
+
+def random_post(rnd: random.Random, group_id: int, run_at: datetime.datetime, interval_share: float) -> dict:
+    media = random_media(rnd)
+    content = "Тестовый пост " + "x" * rnd.randint(0, 200)
+    pin = rnd.random() < 0.3
+    unpin_after = rnd.choice((None, 5, 60)) if pin else None
+    delete_type = rnd.choice(("none", "immediately", "after", "after_unpin" if unpin_after else "none"))
+    post = {
+        "group_id": group_id,
+        "content": content,
+        "media_file_id": media,
+        "send_plan": compile_plan(content, media),
+        "pin": pin,
+        "unpin_after_minutes": unpin_after,
+        "delete_type": delete_type,
+        "delete_after_minutes": rnd.choice((1, 30)) if delete_type == "after" else None,
+        "next_run_at": run_at,
+    }
+    # Одинаковый набор ключей у всех строк — одна пачка INSERT
+    if rnd.random() < interval_share:
+        post.update(type="interval", interval_minutes=rnd.choice((30, 60, 1440)), repeat_count=rnd.choice((0, 3)),
+                    scheduled_datetime=None)
+    else:
+        post.update(type="datetime", interval_minutes=None, repeat_count=None, scheduled_datetime=run_at)
+    return post
+
+
+async def seed(posts: int, groups: int, interval_share: float, lead: float, window: float, seed_value: int) -> list[int]:
+    rnd = random.Random(seed_value)
+    group_ids = [BENCH_GROUP_BASE - i for i in range(groups)]
+    start = datetime.datetime.now() + datetime.timedelta(seconds=lead)
+
+    async with AsyncSession() as session:
+        await session.execute(insert(Group), [
+            {"id": group_id, "title": f"bench {i}", "admin_username": BENCH_ADMIN, "limit_msg": 0}
+            for i, group_id in enumerate(group_ids)
+        ])
+        for offset in range(0, posts, INSERT_CHUNK):
+            rows = [
+                random_post(
+                    rnd, rnd.choice(group_ids),
+                    start + datetime.timedelta(seconds=rnd.random() * window), interval_share
+                )
+                for _ in range(min(INSERT_CHUNK, posts - offset))
+            ]
+            result = await session.execute(
+                insert(ScheduledPost).returning(ScheduledPost.id, ScheduledPost.group_id), rows
+            )
+            await session.execute(insert(PostTarget), [
+                {"post_id": post_id, "group_id": group_id} for post_id, group_id in result.all()
+            ])
+        await session.commit()
+    return group_ids
+
+
+async def cleanup(group_ids: list[int]):
+    async with AsyncSession() as session:
+        await session.execute(delete(ScheduledTask).where(ScheduledTask.chat_id.in_(group_ids)))
+        await session.execute(delete(PostTarget).where(PostTarget.group_id.in_(group_ids)))
+        await session.execute(delete(ScheduledPost).where(ScheduledPost.group_id.in_(group_ids)))
+        await session.execute(delete(Group).where(Group.id.in_(group_ids)))
+        await session.commit()
+
+
+async def bench(posts: int, groups: int, interval_share: float, window: float, lead: float,
+                api_latency: float, keep: bool, seed_value: int):
+    if window / 60 > post_scheduler.SCHEDULER_HORIZON:
+        print(f"[!] Окно {window} с больше горизонта {post_scheduler.SCHEDULER_HORIZON} мин — часть постов не встанет")
+
+    await app.prepare_database()
+    started = time.perf_counter()
+    group_ids = await seed(posts, groups, interval_share, lead, window, seed_value)
+    print(f"Создано постов: {posts} в {groups} группах за {time.perf_counter() - started:.1f} с")
+
+    bot = fake_bot(api_latency)
+    deletion_batcher.start(bot)
+    lateness: list[float] = []
+
+    def on_submitted(event):
+        if event.job_id == "refill_horizon":
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for run_time in event.scheduled_run_times:
+            lateness.append((now - run_time).total_seconds())
+
+    post_scheduler.scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+
+    try:
+        # Старт: загрузка горизонта из БД и регистрация заданий
+        tracemalloc.start()
+        rss_before = rss_kb()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        await post_scheduler.start_scheduler(bot)
+        startup = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0] - memory_before
+        rss = rss_kb() - rss_before
+        tracemalloc.stop()
+
+        jobs = len(post_scheduler.scheduler.get_jobs()) - 1  # без refill_horizon
+        print(f"Старт планировщика: {startup:.2f} с, заданий: {jobs}")
+        if jobs:
+            print(f"Память на задание: {memory / jobs:.0f} Б (tracemalloc), RSS +{rss} КБ всего")
+
+        # Окно срабатываний
+        queries = QueryCounter(engine)
+        calls_before = bot.session.total_calls()
+        deadline = time.monotonic() + lead + window + 60
+        while len(lateness) < jobs and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+        # Дожидаемся отправок, которые уже начались
+        while post_scheduler._sending and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        fires = len(lateness)
+        print(f"Срабатываний: {fires} из {jobs}")
+        if fires:
+            print(
+                "Опоздание срабатывания, мс: "
+                f"p50 {percentile(lateness, 0.50) * 1000:.1f}, "
+                f"p95 {percentile(lateness, 0.95) * 1000:.1f}, "
+                f"p99 {percentile(lateness, 0.99) * 1000:.1f}, "
+                f"max {max(lateness) * 1000:.1f}"
+            )
+            print(f"SQL-запросов на отправку: {queries.count / fires:.2f} (всего {queries.count})")
+            print(f"Вызовов Bot API на отправку: {(bot.session.total_calls() - calls_before) / fires:.2f}")
+    finally:
+        post_scheduler.scheduler.shutdown(wait=False)
+        await deletion_batcher.stop()
+        if not keep:
+            await cleanup(group_ids)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный замер планировщика рассылок")
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--interval-share", type=float, default=0.5, help="доля интервальных постов")
+    parser.add_argument("--window", type=float, default=60, help="за сколько секунд наступают все посты")
+    parser.add_argument("--lead", type=float, default=10, help="пауза до первого поста, с (на загрузку)")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", action="store_true", help="не удалять созданные посты и группы")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(bench(args.posts, args.groups, args.interval_share, args.window, args.lead,
+                      args.api_latency, args.keep, args.seed))
@@ -0,0 +1,244 @@
+# bot/bulk_restrict.py
+import asyncio
+import os
+import time
+
+from aiogram import Bot
+from aiogram.types import ChatPermissions
+from sqlalchemy import select, update, func
+
+from db.session import AsyncSession
+from db.models import UnblockedUserLimit, RestrictJob
+from bot.member_cache import member_cache
+
+RESTRICT_CONCURRENCY = int(os.getenv("RESTRICT_CONCURRENCY", "10"))
+RESTRICT_CHUNK = int(os.getenv("RESTRICT_CHUNK", "500"))
+PROGRESS_EVERY = 3  # секунды между правками сообщения с прогрессом
+
+# Этих пользователей ограничивать бессмысленно (или невозможно)
+SKIP_STATUSES = ("administrator", "creator", "left", "kicked")
+
+_tasks: dict[int, asyncio.Task] = {}  # group_id -> задача
+
+
+async def iter_user_chunks(group_id: int, after_user_id: int = 0, chunk: int = RESTRICT_CHUNK, *where):
+    """Keyset-пагинация по unblocked_limits группы: отдаёт списки user_id по возрастанию."""
+    while True:
+        async with AsyncSession() as session:
+            stmt = (
+                select(UnblockedUserLimit.user_id)
+                .where(
+                    UnblockedUserLimit.group_id == group_id,
+                    UnblockedUserLimit.user_id > after_user_id,
+                    *where
+                )
+                .order_by(UnblockedUserLimit.user_id)
+                .limit(chunk)
+            )
+            user_ids = (await session.execute(stmt)).scalars().all()
+
+        if not user_ids:
+            return
+        yield user_ids
+        if len(user_ids) < chunk:
+            return
+        after_user_id = user_ids[-1]
+
+
+async def run_bounded(items, worker, concurrency: int = RESTRICT_CONCURRENCY) -> list:
+    """Выполняет worker(item) для всех items, не больше concurrency одновременно."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+def _permissions(can_send: bool) -> ChatPermissions:
+    return ChatPermissions(can_send_messages=can_send)
+
+
+def _needs_change(can_send: bool):
+    return UnblockedUserLimit.can_send.is_distinct_from(can_send)
+
+
+def _progress_text(job: RestrictJob) -> str:
+    action = "Снимаем ограничения" if job.can_send else "Ограничиваем пользователей"
+    if job.status == "done":
+        head = "✅ Права применены"
+    elif job.status == "cancelled":
+        head = "⏹ Применение прав остановлено"
+    else:
+        head = f"⏳ {action}"
+    return (
+        f"{head} в группе <code>{job.group_id}</code>\n"
+        f"Обработано: {job.processed} из {job.total}\n"
+        f"Пропущено: {job.skipped}, ошибок: {job.failed}"
+    )
+
+
+async def _show_progress(bot: Bot, job: RestrictJob):
+    if not job.progress_chat_id or not job.progress_message_id:
+        return
+    try:
+        await bot.edit_message_text(
+            _progress_text(job),
+            chat_id=job.progress_chat_id,
+            message_id=job.progress_message_id
+        )
+    except Exception as e:
+        print(f"[!] Не удалось обновить прогресс задачи {job.id}: {e}")
+
+
+async def start_restrict_job(bot: Bot, group_id: int, can_send: bool, progress_chat_id: int = None) -> int:
+    """Ставит фоновую задачу применения прав ко всем пользователям группы."""
+    old = _tasks.pop(group_id, None)
+    if old is not None:
+        old.cancel()
+
+    async with AsyncSession() as session:
+        await session.execute(
+            update(RestrictJob)
+            .where(RestrictJob.group_id == group_id, RestrictJob.status == "running")
+            .values(status="cancelled")
+        )
+
+        base = select(func.count()).where(UnblockedUserLimit.group_id == group_id)
+        everyone = (await session.execute(base)).scalar_one()
+        total = (await session.execute(base.where(_needs_change(can_send)))).scalar_one()
+
+        job = RestrictJob(
+            group_id=group_id,
+            can_send=can_send,
+            status="running",
+            cursor=0,
+            total=total,
+            processed=0,
+            skipped=everyone - total,  # права уже совпадают
+            failed=0,
+            progress_chat_id=progress_chat_id,
+        )
+        session.add(job)
+        await session.commit()
+
+    if progress_chat_id:
+        try:
+            progress = await bot.send_message(progress_chat_id, _progress_text(job))
+            job.progress_message_id = progress.message_id
+            async with AsyncSession() as session:
+                await session.execute(
+                    update(RestrictJob).where(RestrictJob.id == job.id)
+                    .values(progress_message_id=progress.message_id)
+                )
+                await session.commit()
+        except Exception as e:
+            print(f"[!] Не удалось отправить прогресс задачи {job.id}: {e}")
+
+    _spawn(bot, job.id, group_id)
+    return job.id
+
+
+def _spawn(bot: Bot, job_id: int, group_id: int):
+    task = asyncio.create_task(run_restrict_job(bot, job_id))
+    _tasks[group_id] = task
+    task.add_done_callback(lambda t: _tasks.get(group_id) is t and _tasks.pop(group_id))
+
+
+async def _current_status(job_id: int):
+    async with AsyncSession() as session:
+        return (await session.execute(select(RestrictJob.status).where(RestrictJob.id == job_id))).scalar_one_or_none()
+
+
+async def run_restrict_job(bot: Bot, job_id: int):
+    async with AsyncSession() as session:
+        job = await session.get(RestrictJob, job_id)
+    if job is None or job.status != "running":
+        return
+
+    group_id = job.group_id
+    permissions = _permissions(job.can_send)
+    last_progress = 0.0
+
+    async def apply(user_id: int):
+        # Только то, что уже известно: массовый проход не должен искажать статистику кэша
+        if member_cache.peek(group_id, user_id) in SKIP_STATUSES:
+            return "skipped"
+        try:
+            await bot.restrict_chat_member(chat_id=group_id, user_id=user_id, permissions=permissions)
+            return "ok"
+        except Exception as e:
+            print(f"[!] Ошибка рестрикта user_id={user_id}: {e}")
+            return "failed"
+
+    try:
+        # Чекпоинт — cursor: после рестарта продолжаем со следующего user_id
+        async for user_ids in iter_user_chunks(group_id, job.cursor, RESTRICT_CHUNK, _needs_change(job.can_send)):
+            # Задачу могли отменить или заменить новой — в т.ч. из другого воркера
+            status = await _current_status(job.id)
+            if status != "running":
+                job.status = status or "cancelled"
+                break
+            results = await run_bounded(user_ids, apply)
+            applied = [user_id for user_id, result in zip(user_ids, results) if result == "ok"]
+
+            job.cursor = user_ids[-1]
+            job.processed += len(user_ids)
+            job.skipped += results.count("skipped")
+            job.failed += results.count("failed")
+
+            async with AsyncSession() as session:
+                if applied:
+                    await session.execute(
+                        update(UnblockedUserLimit)
+                        .where(UnblockedUserLimit.group_id == group_id, UnblockedUserLimit.user_id.in_(applied))
+                        .values(can_send=job.can_send)
+                    )
+                await session.execute(
+                    update(RestrictJob).where(RestrictJob.id == job.id).values(
+                        cursor=job.cursor,
+                        processed=job.processed,
+                        skipped=job.skipped,
+                        failed=job.failed,
+                    )
+                )
+                await session.commit()
+
+            if time.monotonic() - last_progress >= PROGRESS_EVERY:
+                last_progress = time.monotonic()
+                await _show_progress(bot, job)
+        else:
+            job.status = "done"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        # Задача остаётся running и продолжится с чекпоинта после рестарта
+        print(f"[!] Задача применения прав {job.id} прервана: {e}")
+    finally:
+        async with AsyncSession() as session:
+            # Отменённую задачу уже пометили в start_restrict_job; отмену во время
+            # последней пачки «done» не перезаписывает
+            if job.status == "done":
+                await session.execute(
+                    update(RestrictJob)
+                    .where(RestrictJob.id == job.id, RestrictJob.status == "running")
+                    .values(status="done")
+                )
+                await session.commit()
+        if job.status != "running":
+            await _show_progress(bot, job)
+
+
+async def resume_restrict_jobs(bot: Bot):
+    async with AsyncSession() as session:
+        stmt = select(RestrictJob.id, RestrictJob.group_id).where(RestrictJob.status == "running")
+        jobs = (await session.execute(stmt)).all()
+
+    for job_id, group_id in jobs:
+        _spawn(bot, job_id, group_id)
+
+
+def stats() -> dict:
+    return {"running": len(_tasks)}
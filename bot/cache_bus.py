@@ -0,0 +1,66 @@
+# bot/cache_bus.py
+from bot.admin_registry import admin_registry
+from bot.group_cache import group_cache
+from bot.quota import quota_store
+
+# Что поменялось (аргументы — id группы и пользователя)
+GROUP_CHANGED = "group"
+GROUP_DROPPED = "group_drop"
+QUOTA_CHANGED = "quota"
+QUOTA_GROUP_CHANGED = "quota_group"
+ADMIN_CHANGED = "admin"
+# Для процесса с планировщиком (bot/scheduler.py): новый пост / задание удалённого поста
+POST_SCHEDULED = "post_scheduled"
+POST_UNSCHEDULED = "post_unscheduled"
+
+
+class CacheBus:
+    """
+    Рассылка инвалидаций кэшей между процессами в режиме воркеров (bot/workers.py).
+    Вызывающий сам обновляет локальный кэш и публикует событие — остальные воркеры
+    применяют его у себя. В обычном однопроцессном режиме publish ничего не делает.
+    """
+
+    def __init__(self):
+        self.worker_id = None
+        self._outbox = None
+        self.published = 0
+        self.applied = 0
+
+    def attach(self, worker_id: int, outbox):
+        self.worker_id = worker_id
+        self._outbox = outbox
+
+    def publish(self, kind: str, *args):
+        if self._outbox is None:
+            return
+        self.published += 1
+        self._outbox.put(("invalidate", self.worker_id, kind, args))
+
+    async def apply(self, kind: str, args: tuple):
+        self.applied += 1
+        if kind == GROUP_CHANGED:
+            await group_cache.refresh(*args)
+        elif kind == GROUP_DROPPED:
+            group_cache.drop(*args)
+        elif kind == QUOTA_CHANGED:
+            quota_store.invalidate(*args)
+        elif kind == QUOTA_GROUP_CHANGED:
+            quota_store.invalidate_group(*args)
+        elif kind == ADMIN_CHANGED:
+            await admin_registry.refresh(*args)
+        elif kind in (POST_SCHEDULED, POST_UNSCHEDULED):
+            # bot.scheduler сам импортирует cache_bus, поэтому импорт здесь
+            from bot import scheduler
+            if kind == POST_SCHEDULED:
+                await scheduler.schedule_post(*args)
+            else:
+                scheduler.remove_post_job(*args)
+        else:
+            print(f"[!] Неизвестная инвалидация кэша: {kind}")
+
+    def stats(self) -> dict:
+        return {"published": self.published, "applied": self.applied}
+
+
+cache_bus = CacheBus()
@@ -0,0 +1,164 @@
+# bot/delayed_actions.py
+import asyncio
+import datetime
+import os
+
+from aiogram import Bot
+from sqlalchemy import select, delete, update
+
+from db.session import AsyncSession
+from db.models import ScheduledTask
+from bot.deletion_batcher import deletion_batcher
+
+DELAYED_ACTIONS_POLL = float(os.getenv("DELAYED_ACTIONS_POLL", "5"))  # секунды
+DELAYED_ACTIONS_BATCH = int(os.getenv("DELAYED_ACTIONS_BATCH", "100"))
+MAX_ATTEMPTS = 3
+RETRY_DELAY = datetime.timedelta(seconds=2)
+CLAIM_LEASE = datetime.timedelta(seconds=120)  # через сколько забранное, но не завершённое действие вернётся в очередь
+
+ACTION_DELETE = "delete"
+ACTION_UNPIN = "unpin"
+
+
+def add_action(session, chat_id: int, message_id: int, run_at: datetime.datetime, action: str = ACTION_DELETE):
+    # Только добавляет строку в сессию — коммит делает вызывающий вместе со своими изменениями
+    session.add(ScheduledTask(chat_id=chat_id, message_id=message_id, run_at=run_at, action=action))
+    delayed_actions.wake_if_due(run_at)
+
+
+async def schedule_action(chat_id: int, message_id: int, run_at: datetime.datetime, action: str = ACTION_DELETE):
+    async with AsyncSession() as session:
+        add_action(session, chat_id, message_id, run_at, action)
+        await session.commit()
+
+
+class DelayedActionWorker:
+    """
+    Очередь отложенных действий (удалить / открепить сообщение) в таблице scheduled_tasks.
+    Воркер забирает созревшие строки пачками (FOR UPDATE SKIP LOCKED + аренда на
+    CLAIM_LEASE, короткой транзакцией), выполняет их без открытой транзакции и удаляет.
+    После рестарта просроченные строки просто выполняются первыми.
+    """
+
+    def __init__(self, poll: float = DELAYED_ACTIONS_POLL, batch: int = DELAYED_ACTIONS_BATCH):
+        self.poll = poll
+        self.batch = batch
+        self._bot = None
+        self._task = None
+        self._wake = asyncio.Event()
+        self._next_poll_at = None
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+
+    def wake_if_due(self, run_at: datetime.datetime):
+        # Не ждём следующего опроса, если действие созреет раньше
+        if self._next_poll_at is not None and run_at < self._next_poll_at:
+            self._next_poll_at = run_at
+            self._wake.set()
+
+    async def _execute(self, task):
+        # task — строка из _claim (id, chat_id, message_id, action, attempts)
+        if task.action == ACTION_UNPIN:
+            await self._bot.unpin_chat_message(chat_id=task.chat_id, message_id=task.message_id)
+        elif not await deletion_batcher.delete(task.chat_id, task.message_id):
+            raise RuntimeError("сообщение не удалено")
+
+    async def _claim(self, now: datetime.datetime) -> list:
+        # Созревшие строки забираем арендой: run_at сдвигается на CLAIM_LEASE и коммитится
+        # сразу, поэтому ни транзакция, ни соединение не держатся на время вызовов Bot API.
+        # Если процесс упадёт, строки снова созреют после аренды
+        due = (
+            select(ScheduledTask.id)
+            .where(ScheduledTask.run_at <= now)
+            .order_by(ScheduledTask.run_at)
+            .limit(self.batch)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSession() as session:
+            tasks = (await session.execute(
+                update(ScheduledTask)
+                .where(ScheduledTask.id.in_(due))
+                .values(run_at=now + CLAIM_LEASE)
+                .returning(ScheduledTask.id, ScheduledTask.chat_id, ScheduledTask.message_id,
+                           ScheduledTask.action, ScheduledTask.attempts)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await session.commit()
+        return tasks
+
+    async def run_once(self) -> int:
+        now = datetime.datetime.now()
+        tasks = await self._claim(now)
+        if not tasks:
+            return 0
+
+        results = await asyncio.gather(*(self._execute(task) for task in tasks), return_exceptions=True)
+
+        finished, retry = [], []
+        for task, result in zip(tasks, results):
+            if not isinstance(result, Exception):
+                finished.append(task.id)
+                continue
+
+            # Удаление обычно падает, когда сообщения уже нет — повторять бессмысленно
+            if task.action == ACTION_UNPIN and (task.attempts or 0) + 1 < MAX_ATTEMPTS:
+                retry.append(task.id)
+            else:
+                finished.append(task.id)
+                self.failed += 1
+                print(f"[!] Отложенное действие {task.action} для {task.message_id} в {task.chat_id} не выполнено: {result}")
+
+        async with AsyncSession() as session:
+            if finished:
+                await session.execute(delete(ScheduledTask).where(ScheduledTask.id.in_(finished)))
+            if retry:
+                await session.execute(
+                    update(ScheduledTask)
+                    .where(ScheduledTask.id.in_(retry))
+                    .values(run_at=datetime.datetime.now() + RETRY_DELAY, attempts=ScheduledTask.attempts + 1)
+                )
+            await session.commit()
+
+        self.done += len(finished)
+        self.retried += len(retry)
+        return len(tasks)
+
+    async def _loop(self):
+        while True:
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                print(f"[!] Ошибка обработки отложенных действий: {e}")
+                claimed = 0
+
+            # Полная пачка — значит есть долг (например, после рестарта), берём следующую сразу
+            if claimed >= self.batch:
+                continue
+
+            self._next_poll_at = datetime.datetime.now() + datetime.timedelta(seconds=self.poll)
+            while True:
+                self._wake.clear()
+                timeout = (self._next_poll_at - datetime.datetime.now()).total_seconds()
+                if timeout <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"done": self.done, "failed": self.failed, "retried": self.retried}
+
+
+delayed_actions = DelayedActionWorker()
@@ -0,0 +1,135 @@
+# bot/deletion_batcher.py
+import asyncio
+import os
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+
+DELETE_BATCH_WINDOW = float(os.getenv("DELETE_BATCH_WINDOW", "0.5"))  # секунды
+MAX_BATCH = 100  # лимит deleteMessages
+
+# Ошибки deleteMessages, которые касаются отдельных сообщений пачки:
+# только после них есть смысл удалять по одному
+MESSAGE_ERRORS = ("message can't be deleted", "message to delete not found", "message_id_invalid")
+
+
+def is_message_error(error: Exception) -> bool:
+    return isinstance(error, TelegramBadRequest) and any(m in error.message.lower() for m in MESSAGE_ERRORS)
+
+
+class DeletionBatcher:
+    """
+    Копит удаления по chat_id в течение короткого окна и отправляет их одним
+    deleteMessages (до 100 id за вызов). Если пачка не прошла из-за отдельных
+    сообщений — удаляет по одному, чтобы выяснить, какие именно id не удаляются.
+    Ошибки уровня чата (нет прав, чат не найден, исчерпан RetryAfter) отбрасывают
+    пачку целиком: поштучные вызовы упёрлись бы в то же самое.
+    """
+
+    def __init__(self, window: float = DELETE_BATCH_WINDOW):
+        self.window = window
+        self._bot = None
+        # chat_id -> {message_id: Future | None}
+        self._pending: dict[int, dict[int, asyncio.Future]] = {}
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+        self.bulk_calls = 0
+        self.single_calls = 0
+        self.deleted = 0
+        self.failed = 0
+
+    def enqueue(self, chat_id: int, message_id: int):
+        self._add(chat_id, message_id, None)
+
+    async def delete(self, chat_id: int, message_id: int) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self._add(chat_id, message_id, future)
+        return await future
+
+    def _add(self, chat_id: int, message_id: int, future):
+        bucket = self._pending.setdefault(chat_id, {})
+        previous = bucket.get(message_id)
+        if previous is not None and future is not None:
+            future = _chain(previous, future)
+        bucket[message_id] = future or previous
+
+        if len(bucket) >= MAX_BATCH:
+            self._spawn(chat_id)
+        elif chat_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[chat_id] = loop.call_later(self.window, self._spawn, chat_id)
+
+    def _spawn(self, chat_id: int):
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        bucket = self._pending.pop(chat_id, None)
+        if not bucket:
+            return
+        task = asyncio.create_task(self._flush_chat(chat_id, bucket))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _flush_chat(self, chat_id: int, bucket: dict):
+        message_ids = list(bucket)
+        for i in range(0, len(message_ids), MAX_BATCH):
+            chunk = message_ids[i:i + MAX_BATCH]
+            results = await self._delete_chunk(chat_id, chunk)
+            for message_id, ok in zip(chunk, results):
+                future = bucket[message_id]
+                if future is not None and not future.done():
+                    future.set_result(ok)
+
+    async def _delete_chunk(self, chat_id: int, chunk: list) -> list:
+        if len(chunk) > 1:
+            try:
+                self.bulk_calls += 1
+                await self._bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+                self.deleted += len(chunk)
+                return [True] * len(chunk)
+            except Exception as e:
+                if not is_message_error(e):
+                    print(f"[!] Пакетное удаление в {chat_id} не прошло ({e}), пачка отброшена")
+                    self.failed += len(chunk)
+                    return [False] * len(chunk)
+                print(f"[!] Пакетное удаление в {chat_id} не прошло ({e}), удаляем по одному")
+
+        results = []
+        for message_id in chunk:
+            try:
+                self.single_calls += 1
+                await self._bot.delete_message(chat_id=chat_id, message_id=message_id)
+                self.deleted += 1
+                results.append(True)
+            except Exception:
+                self.failed += 1
+                results.append(False)
+        return results
+
+    def start(self, bot: Bot):
+        self._bot = bot
+
+    async def stop(self):
+        for chat_id in list(self._pending):
+            self._spawn(chat_id)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(len(bucket) for bucket in self._pending.values()),
+            "chats": len(self._pending),
+            "bulk_calls": self.bulk_calls,
+            "single_calls": self.single_calls,
+            "deleted": self.deleted,
+            "failed": self.failed,
+        }
+
+
+def _chain(first: asyncio.Future, second: asyncio.Future) -> asyncio.Future:
+    # Один и тот же id поставили дважды — результат получат оба ожидающих
+    first.add_done_callback(lambda f: second.done() or second.set_result(f.result()))
+    return first
+
+
+deletion_batcher = DeletionBatcher()
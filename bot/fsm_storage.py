@@ -0,0 +1,201 @@
+# bot/fsm_storage.py
+import asyncio
+import datetime
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+
+from db.session import AsyncSession
+from db.models import FsmState
+
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))  # секунды простоя, после которых диалог забывается
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+FSM_CLEANUP_INTERVAL = float(os.getenv("FSM_CLEANUP_INTERVAL", "600"))  # секунды
+
+EMPTY = "{}"
+
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+def _encode(data: Dict[str, Any]) -> str:
+    # Падает на не-JSON значениях (Message, date) сразу, а не после рестарта
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SQLStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states: состояние и данные диалога (компактный JSON)
+    переживают рестарт и видны любому процессу. Горячие ключи лежат в LRU-кэше,
+    запись сквозная: кэш обновляется сразу, строка в БД — следом. Диалоги без
+    изменений дольше FSM_TTL считаются брошенными и удаляются фоновой чисткой.
+    """
+
+    def __init__(self, ttl: int = FSM_TTL, cache_size: int = FSM_CACHE_SIZE,
+                 cleanup_interval: float = FSM_CLEANUP_INTERVAL):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cleanup_interval = cleanup_interval
+        # key -> [state, data_json, touched (monotonic)]
+        self._cache: OrderedDict[str, list] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.expired = 0
+
+    # --- кэш ---
+
+    def _cached(self, k: str) -> Optional[list]:
+        entry = self._cache.get(k)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[2] > self.ttl:
+            del self._cache[k]
+            return None
+        self._cache.move_to_end(k)
+        return entry
+
+    def _remember(self, k: str, state: Optional[str], data: str, touched: float) -> list:
+        entry = [state, data, touched]
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def _entry(self, k: str) -> list:
+        entry = self._cached(k)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        async with AsyncSession() as session:
+            row = (await session.execute(
+                select(FsmState.state, FsmState.data, FsmState.updated_at).where(FsmState.key == k)
+            )).first()
+
+        # Пока ждали БД, ключ мог записать другой обработчик — его значение новее
+        entry = self._cached(k)
+        if entry is not None:
+            return entry
+
+        if row is None:
+            return self._remember(k, None, EMPTY, time.monotonic())
+        state, data, updated_at = row
+        idle = (datetime.datetime.now() - updated_at).total_seconds()
+        if idle > self.ttl:
+            return self._remember(k, None, EMPTY, time.monotonic())
+        return self._remember(k, state, data, time.monotonic() - idle)
+
+    # --- запись ---
+
+    async def _write(self, k: str, state: Optional[str], data: str):
+        self.writes += 1
+        lock = self._locks.setdefault(k, asyncio.Lock())
+        try:
+            async with lock:
+                # Под замком пишем самое свежее значение — запись, ждавшая замка, не затрёт более новую
+                entry = self._cache.get(k)
+                if entry is not None:
+                    state, data = entry[0], entry[1]
+
+                async with AsyncSession() as session:
+                    if state is None and data == EMPTY:
+                        await session.execute(delete(FsmState).where(FsmState.key == k))
+                    else:
+                        stmt = insert(FsmState).values(
+                            key=k, state=state, data=data, updated_at=datetime.datetime.now()
+                        )
+                        stmt = stmt.on_conflict_do_update(
+                            index_elements=[FsmState.key],
+                            set_={
+                                "state": stmt.excluded.state,
+                                "data": stmt.excluded.data,
+                                "updated_at": stmt.excluded.updated_at,
+                            },
+                        )
+                        await session.execute(stmt)
+                    await session.commit()
+        finally:
+            if not lock.locked() and self._locks.get(k) is lock:
+                del self._locks[k]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        entry = await self._entry(k)
+        entry[0] = state.state if isinstance(state, State) else state
+        entry[2] = time.monotonic()
+        await self._write(k, entry[0], entry[1])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(_key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = _key(key)
+        encoded = _encode(data)
+        entry = await self._entry(k)
+        # Кэш меняется до первого await записи — update_data из соседних задач видит свежие данные
+        entry[1] = encoded
+        entry[2] = time.monotonic()
+        await self._write(k, entry[0], encoded)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return json.loads((await self._entry(_key(key)))[1])
+
+    # --- чистка ---
+
+    async def expire(self) -> int:
+        deadline = datetime.datetime.now() - datetime.timedelta(seconds=self.ttl)
+        async with AsyncSession() as session:
+            result = await session.execute(
+                delete(FsmState).where(FsmState.updated_at < deadline).returning(FsmState.key)
+            )
+            keys = result.scalars().all()
+            await session.commit()
+
+        for k in keys:
+            self._cache.pop(k, None)
+        self.expired += len(keys)
+        return len(keys)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await self.expire()
+                if removed:
+                    print(f"FSM: удалено брошенных диалогов: {removed}")
+            except Exception as e:
+                print(f"[!] Ошибка чистки FSM: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "expired": self.expired,
+        }
+
+
+fsm_storage = SQLStorage()
@@ -0,0 +1,81 @@
+# bot/group_cache.py
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+
+from db.session import AsyncSession
+from db.models import Group
+
+
+@dataclass(frozen=True, slots=True)
+class GroupSettings:
+    id: int
+    title: Optional[str]
+    description: Optional[str]
+    welcome_template: Optional[str]
+    limit_exceeded_template: Optional[str]
+    limit_msg: Optional[int]
+    admin_username: Optional[str]
+    admin_mention: Optional[str]  # {admin} в приветствии
+
+    @classmethod
+    def from_model(cls, group: Group) -> "GroupSettings":
+        return cls(
+            id=group.id,
+            title=group.title,
+            description=group.description,
+            welcome_template=group.welcome_template,
+            limit_exceeded_template=group.limit_exceeded_template,
+            limit_msg=group.limit_msg,
+            admin_username=group.admin_username,
+            admin_mention=f"@{group.admin_username}" if group.admin_username else None,
+        )
+
+
+class GroupCache:
+    """Настройки управляемых групп в памяти процесса. Заполняется целиком при старте."""
+
+    def __init__(self):
+        self._groups: dict[int, GroupSettings] = {}
+        self.managed_chat_ids: set[int] = set()
+
+    def __len__(self):
+        return len(self._groups)
+
+    def is_managed(self, chat_id: int) -> bool:
+        return chat_id in self.managed_chat_ids
+
+    def get(self, group_id: int) -> Optional[GroupSettings]:
+        return self._groups.get(group_id)
+
+    def put(self, group: Group) -> GroupSettings:
+        settings = GroupSettings.from_model(group)
+        self._groups[settings.id] = settings
+        self.managed_chat_ids.add(settings.id)
+        return settings
+
+    def drop(self, group_id: int):
+        self._groups.pop(group_id, None)
+        self.managed_chat_ids.discard(group_id)
+
+    async def refresh(self, group_id: int) -> Optional[GroupSettings]:
+        async with AsyncSession() as session:
+            group = await session.get(Group, group_id)
+        if group is None:
+            self.drop(group_id)
+            return None
+        return self.put(group)
+
+    async def load(self):
+        groups: dict[int, GroupSettings] = {}
+        async with AsyncSession() as session:
+            result = await session.stream_scalars(select(Group))
+            async for group in result:
+                groups[group.id] = GroupSettings.from_model(group)
+
+        self._groups = groups
+        self.managed_chat_ids = set(groups)
+
+
+group_cache = GroupCache()
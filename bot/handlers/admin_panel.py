@@ -1,24 +1,38 @@
+from html import escape
 from pprint import pprint
+from typing import Optional
 
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, ChatPermissions
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import any_state
-from sqlalchemy import select
-from db.session import AsyncSession
-from db.models import Group, Admin, ScheduledPost
-from bot.keyboards.panel import groups_keyboard, group_panel_keyboard
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession as DbSession
+from db.models import Group, ScheduledPost, PostTarget
+from bot.keyboards.panel import (
+    groups_keyboard, group_panel_keyboard, post_saved_keyboard, post_targets_keyboard, post_actions_keyboard,
+    planned_posts_keyboard, PAGE_SIZE, POSTS_PAGE_SIZE
+)
+from db.groups import admin_groups_page
+from db.posts import group_posts_page
 from bot.states import EditWelcome, IntervalMailingState, TimedMailingState, MailingMenuState, EditLimitMessage, EditLimit, DeleteGroup
-from bot.scheduler import add_post_to_schedule
+from bot.scheduler import add_post_to_schedule, announce_post, unschedule_post
+from bot.send_plan import send_plans, compile_plan, PlanError, PREVIEW_CONCURRENCY
+from bot.quota import quota_store
+from bot.cache_bus import cache_bus, GROUP_CHANGED, GROUP_DROPPED, QUOTA_GROUP_CHANGED
+from bot.group_cache import group_cache
+from bot.admin_registry import admin_registry
+from bot.bulk_restrict import start_restrict_job, run_bounded
+from bot.middlewares.album import AlbumItem, album_item
 from aiogram import Bot
 import datetime
 from db.models import UnblockedUserLimit
-from aiogram.utils.media_group import MediaGroupBuilder
-from asyncio import sleep
 
 router = Router()
 
+MESSAGE_LIMIT = 4096  # символов в одном сообщении Telegram
+
 
 @router.message(F.text == "/cancel", StateFilter("*"))
 async def cancel_state(msg: Message, state: FSMContext):
@@ -37,60 +51,55 @@ async def cancel_state(msg: Message, state: FSMContext):
 
 
 @router.message(F.text == "Мои группы", StateFilter("*"))
-async def admin_panel(msg: Message, state: FSMContext):
-    async with AsyncSession() as session:
-        await state.clear()
-        admin = await session.get(Admin, msg.from_user.id)
-        if not admin:
-            return
+async def admin_panel(msg: Message, state: FSMContext, session: DbSession):
+    await state.clear()
+    admin = admin_registry.get(msg.from_user.id)
+    if not admin:
+        return
 
-        groups = await get_admin_groups(session, admin.username)
-        if not groups:
-            await msg.answer("У вас нет групп.")
-            return
+    page = await admin_groups_page(session, admin.username, PAGE_SIZE)
+    if not page.groups:
+        await msg.answer("У вас нет групп.")
+        return
 
-        await msg.answer("Ваши группы:", reply_markup=groups_keyboard(groups, page=0))
+    await msg.answer("Ваши группы:", reply_markup=groups_keyboard(page))
 
 
 @router.message(CommandStart())
 async def start(msg: Message):
-    async with AsyncSession() as session:
-        admin = await session.get(Admin, msg.from_user.id)
-
-        if not admin:
-            reply_kb = ReplyKeyboardMarkup(
-                keyboard=[[KeyboardButton(text="📱 Поделиться номером телефона", request_contact=True)]],
-                resize_keyboard=True,
-                one_time_keyboard=True
-            )
-            await msg.answer(
-                "У вас нет прав для управления ботом.\n\nЧтобы получить доступ, поделитесь своим номером телефона:",
-                reply_markup=reply_kb
-            )
-            return
-
+    if not admin_registry.is_admin(msg.from_user.id):
         reply_kb = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="Мои группы")]],
-            resize_keyboard=True
+            keyboard=[[KeyboardButton(text="📱 Поделиться номером телефона", request_contact=True)]],
+            resize_keyboard=True,
+            one_time_keyboard=True
         )
-
         await msg.answer(
-            "Добро пожаловать, модератор!\n\nНажмите на кнопку ниже, чтобы перейти к управлению группами.",
+            "У вас нет прав для управления ботом.\n\nЧтобы получить доступ, поделитесь своим номером телефона:",
             reply_markup=reply_kb
         )
+        return
+
+    reply_kb = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text="Мои группы")]],
+        resize_keyboard=True
+    )
+
+    await msg.answer(
+        "Добро пожаловать, модератор!\n\nНажмите на кнопку ниже, чтобы перейти к управлению группами.",
+        reply_markup=reply_kb
+    )
 
 
 @router.callback_query(F.data.startswith("groups_page_"))
-async def paginate_groups(cb: CallbackQuery):
-    page = int(cb.data.split("_")[-1])
+async def paginate_groups(cb: CallbackQuery, session: DbSession):
+    cursor = cb.data.split("_")[-1]
 
-    async with AsyncSession() as session:
-        admin = await session.get(Admin, cb.from_user.id)
-        if not admin:
-            return
+    admin = admin_registry.get(cb.from_user.id)
+    if not admin:
+        return
 
-        groups = await get_admin_groups(session, admin.username)
-        await cb.message.edit_text("Ваши группы:", reply_markup=groups_keyboard(groups, page=page))
+    page = await admin_groups_page(session, admin.username, PAGE_SIZE, cursor)
+    await cb.message.edit_text("Ваши группы:", reply_markup=groups_keyboard(page))
 
 
 @router.callback_query(F.data.startswith("group_settings_"))
@@ -115,18 +124,19 @@ async def edit_welcome(cb: CallbackQuery, state: FSMContext):
 
 
 @router.message(EditWelcome.waiting_for_welcome_text)
-async def save_new_welcome_text(msg: Message, state: FSMContext):
+async def save_new_welcome_text(msg: Message, state: FSMContext, session: DbSession):
     data = await state.get_data()
     group_id = data.get("group_id")
 
-    async with AsyncSession() as session:
-        group = await session.get(Group, group_id)
-        if not group:
-            await msg.answer("⚠️ Группа не найдена.")
-            return
+    group = await session.get(Group, group_id)
+    if not group:
+        await msg.answer("⚠️ Группа не найдена.")
+        return
 
-        group.welcome_template = msg.html_text
-        await session.commit()
+    group.welcome_template = msg.html_text
+    await session.commit()
+    group_cache.put(group)
+    cache_bus.publish(GROUP_CHANGED, group_id)
 
     await state.clear()
     await msg.answer(
@@ -162,39 +172,73 @@ async def delete_group(cb: CallbackQuery, state: FSMContext):
         await cb.message.answer(text)
 
 
-from sqlalchemy import delete
-from bot.scheduler import scheduler
+from sqlalchemy import delete, or_
+
+
+async def drop_group_posts(session, group_id: int) -> list:
+    """
+    Убирает группу из рассылок. Пост, у которого не осталось групп, удаляется;
+    пост, созданный из этой группы, но уходящий и в другие, переезжает в одну из них.
+    Возвращает (id, type) удалённых постов.
+    """
+    targeted = select(PostTarget.post_id).where(PostTarget.group_id == group_id)
+    affected = (await session.execute(
+        select(ScheduledPost.id).where(or_(ScheduledPost.group_id == group_id, ScheduledPost.id.in_(targeted)))
+    )).scalars().all()
+    await session.execute(delete(PostTarget).where(PostTarget.group_id == group_id))
+    if not affected:
+        return []
+
+    has_targets = select(PostTarget.post_id).where(PostTarget.post_id == ScheduledPost.id).exists()
+    dropped = (await session.execute(
+        delete(ScheduledPost)
+        .where(ScheduledPost.id.in_(affected), ~has_targets)
+        .returning(ScheduledPost.id, ScheduledPost.type)
+        .execution_options(synchronize_session=False)
+    )).all()
+    await session.execute(
+        update(ScheduledPost)
+        .where(ScheduledPost.group_id == group_id)
+        .values(group_id=select(func.min(PostTarget.group_id))
+                .where(PostTarget.post_id == ScheduledPost.id)
+                .scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    return dropped
 
 
 @router.message(DeleteGroup.waiting_for_confirm)
-async def confirm_delete_group(msg: Message, state: FSMContext):
+async def confirm_delete_group(msg: Message, state: FSMContext, session: DbSession):
     data = await state.get_data()
     group_id = data.get("group_id")
     msg_group_id = msg.text.strip()
 
-    async with AsyncSession() as session:
-        group = await session.get(Group, group_id)
-        if not group:
-            await msg.answer("⚠️ Группа не найдена.")
-            return
+    group = await session.get(Group, group_id)
+    if not group:
+        await msg.answer("⚠️ Группа не найдена.")
+        return
 
-        if str(group_id) != msg_group_id:
-            await msg.answer('⚠️ Код группы не совпадает с ID группы.')
-            return
+    if str(group_id) != msg_group_id:
+        await msg.answer('⚠️ Код группы не совпадает с ID группы.')
+        return
 
-        # 1. Удаляем связанные данные вручную
-        await session.execute(delete(UnblockedUserLimit).where(UnblockedUserLimit.group_id == group_id))
-        await session.execute(delete(ScheduledPost).where(ScheduledPost.group_id == group_id))
+    # 1. Удаляем связанные данные вручную
+    await session.execute(delete(UnblockedUserLimit).where(UnblockedUserLimit.group_id == group_id))
+    dropped_posts = await drop_group_posts(session, group_id)
 
-        # 2. Удаляем саму группу
-        await session.delete(group)
+    # 2. Удаляем саму группу
+    await session.delete(group)
 
-        await session.commit()
+    await session.commit()
+    group_cache.drop(group_id)
+    quota_store.invalidate_group(group_id)
+    cache_bus.publish(GROUP_DROPPED, group_id)
+    cache_bus.publish(QUOTA_GROUP_CHANGED, group_id)
 
-    # 3. Чистим scheduler от заданий этой группы
-    for job in scheduler.get_jobs():
-        if str(group_id) in job.id:
-            scheduler.remove_job(job.id)
+    # 3. Чистим scheduler от постов, у которых не осталось групп
+    for post_id, post_type in dropped_posts:
+        unschedule_post(post_type, post_id)
+        send_plans.forget(post_id)
 
     await state.clear()
     await msg.answer(f"✅ Группа <code>{group_id}</code> и все связанные данные успешно удалены.")
@@ -212,18 +256,19 @@ async def edit_limit_msg(cb: CallbackQuery, state: FSMContext):
 
 
 @router.message(EditLimitMessage.waiting_for_limit_text)
-async def save_new_limit_text(msg: Message, state: FSMContext):
+async def save_new_limit_text(msg: Message, state: FSMContext, session: DbSession):
     data = await state.get_data()
     group_id = data.get("group_id")
 
-    async with AsyncSession() as session:
-        group = await session.get(Group, group_id)
-        if not group:
-            await msg.answer("⚠️ Группа не найдена.")
-            return
+    group = await session.get(Group, group_id)
+    if not group:
+        await msg.answer("⚠️ Группа не найдена.")
+        return
 
-        group.limit_exceeded_template = msg.html_text
-        await session.commit()
+    group.limit_exceeded_template = msg.html_text
+    await session.commit()
+    group_cache.put(group)
+    cache_bus.publish(GROUP_CHANGED, group_id)
 
     await state.clear()
     await msg.answer(
@@ -248,62 +293,47 @@ async def edit_limit(cb: CallbackQuery, state: FSMContext):
 
 
 @router.message(EditLimit.waiting_for_limit)
-async def save_new_limit(msg: Message, state: FSMContext, bot: Bot):
+async def save_new_limit(msg: Message, state: FSMContext, bot: Bot, session: DbSession):
     data = await state.get_data()
     group_id = data.get("group_id")
 
-    async with AsyncSession() as session:
-        group = await session.get(Group, group_id)
-        if not group:
-            await msg.answer("⚠️ Группа не найдена.")
-            return
-
-        raw_limit = msg.text.strip()
-        if raw_limit == '*':
-            base_limit = None
-        else:
-            try:
-                base_limit = int(raw_limit)
-            except ValueError:
-                await msg.answer("Неверный формат. Примеры: *, 0, 5")
-                return
-
-        # Обновляем лимит в таблице групп
-        group.limit_msg = base_limit
-        await session.commit()
+    group = await session.get(Group, group_id)
+    if not group:
+        await msg.answer("⚠️ Группа не найдена.")
+        return
 
-        # Обновляем лимиты всех пользователей
-        stmt = select(UnblockedUserLimit).where(UnblockedUserLimit.group_id == group_id)
-        result = await session.execute(stmt)
-        limits = result.scalars().all()
-
-        for user_limit in limits:
-            user_limit.max_messages = base_limit
-
-            # Restrict/Unrestrict по лимиту
-            try:
-                if base_limit == 0:
-                    await bot.restrict_chat_member(
-                        chat_id=group_id,
-                        user_id=user_limit.user_id,
-                        permissions=ChatPermissions(can_send_messages=False)
-                    )
-                else:
-                    await bot.restrict_chat_member(
-                        chat_id=group_id,
-                        user_id=user_limit.user_id,
-                        permissions=ChatPermissions(can_send_messages=True)
-                    )
-            except Exception as e:
-                print(f"[!] Ошибка рестрикта user_id={user_limit.user_id}: {e}")
+    raw_limit = msg.text.strip()
+    if raw_limit == '*':
+        base_limit = None
+    else:
+        try:
+            base_limit = int(raw_limit)
+        except ValueError:
+            await msg.answer("Неверный формат. Примеры: *, 0, 5")
+            return
 
-        await session.commit()
+    # Обновляем лимит в таблице групп и у всех пользователей одним UPDATE
+    group.limit_msg = base_limit
+    await session.execute(
+        update(UnblockedUserLimit)
+        .where(UnblockedUserLimit.group_id == group_id)
+        .values(max_messages=base_limit)
+    )
+    await session.commit()
+    group_cache.put(group)
+    cache_bus.publish(GROUP_CHANGED, group_id)
+    quota_store.invalidate_group(group_id)
+    cache_bus.publish(QUOTA_GROUP_CHANGED, group_id)
 
     await state.clear()
     await msg.answer(
-        f"✅ Базовый лимит обновлён и применён ко всем пользователям группы <code>{group_id}</code>.",
+        f"✅ Базовый лимит обновлён для всех пользователей группы <code>{group_id}</code>.\n"
+        "Права в чате применяются в фоне, прогресс — в следующем сообщении.",
         reply_markup=group_panel_keyboard(group_id)
     )
+
+    # Restrict/Unrestrict по лимиту — фоновой задачей с чекпоинтами
+    await start_restrict_job(bot, group_id, can_send=base_limit != 0, progress_chat_id=msg.chat.id)
 # ------------------------------------------------------------
 
 @router.callback_query(F.data.startswith("mailing_menu_"))
@@ -335,80 +365,44 @@ async def interval_start(cb: CallbackQuery, state: FSMContext):
 # === interval mailing step-by-step handlers ===
 import json
 
-from aiogram.utils.media_group import MediaGroupBuilder
-from asyncio import sleep
-
-@router.message(IntervalMailingState.waiting_for_message)
-async def interval_get_message(msg: Message, state: FSMContext):
-    data = await state.get_data()
-    album_buffer = data.get("album_buffer", {})
-
-    if msg.media_group_id:
-        # Добавляем сообщение в буфер
-        group_id = msg.media_group_id
-        if "album_buffer" not in data:
-            data["album_buffer"] = {}
-        if group_id not in data["album_buffer"]:
-            data["album_buffer"][group_id] = []
-        data["album_buffer"][group_id].append(msg)
-        await state.update_data(album_buffer=data["album_buffer"])
-
-        # Ждём немного, чтобы собрать все медиа альбома
-        await sleep(0.5)
-
-        # Проверяем, что мы обрабатываем только один раз
-        current_data = await state.get_data()
-        buffer = current_data.get("album_buffer", {}).get(group_id, [])
-        if buffer and buffer[0].message_id == msg.message_id:
-            # Этот хэндлер вызван на первом сообщении альбома → собираем альбом
-            media_items = []
-            caption = None
-            for i, m in enumerate(buffer):
-                if m.photo:
-                    media_items.append({"type": "photo", "file_id": m.photo[-1].file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.video:
-                    media_items.append({"type": "video", "file_id": m.video.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.document:
-                    media_items.append({"type": "document", "file_id": m.document.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                # ... и т.д. для остальных типов
-
-            media_json = json.dumps(media_items)
-
-            await state.update_data(
-                media_file_id=media_json,
-                message=caption,
-            )
-            await state.set_state(IntervalMailingState.waiting_for_interval)
-            await msg.answer("Укажи интервал в минутах/часах/днях (например, 30, 2h, 1d):")
 
+def mailing_content(msg: Message, album: Optional[list[AlbumItem]]) -> tuple[str, Optional[str]]:
+    """(media_file_id в JSON, текст или подпись) для первого шага мастеров рассылки."""
+    if album:
+        media_items = [{"type": item.type, "file_id": item.file_id} for item in album if item.type]
+        caption = next((item.caption for item in album if item.caption), "")
+    elif msg.content_type == "text":
+        media_items = [{"type": "text", "file_id": None}]
+        caption = msg.html_text
     else:
-        # одиночное сообщение — сразу сохраняем
-        media_items = []
-        caption = None
-        if msg.content_type == "text":
-            caption = msg.html_text
-            media_items = [{"type": "text", "file_id": None}]
-        elif msg.photo:
-            media_items = [{"type": "photo", "file_id": msg.photo[-1].file_id}]
-            caption = msg.caption or msg.html_text or ""
-        elif msg.video:
-            media_items = [{"type": "video", "file_id": msg.video.file_id}]
-            caption = msg.caption or msg.html_text or ""
-
-        media_json = json.dumps(media_items)
-
-        await state.update_data(
-            media_file_id=media_json,
-            message=caption,
-        )
-        await state.set_state(IntervalMailingState.waiting_for_interval)
-        await msg.answer("Укажи интервал в минутах/часах/днях (например, 30, 2h, 1d):")
+        item = album_item(msg)
+        media_items = [{"type": item.type, "file_id": item.file_id}] if item.type else []
+        caption = item.caption
+    return json.dumps(media_items), caption
+
+
+async def check_mailing_content(msg: Message, media_json: str, caption: Optional[str]) -> bool:
+    # Неподходящие медиа отсекаем сразу, а не после всех шагов мастера; состояние не меняется
+    try:
+        compile_plan(caption, media_json)
+    except PlanError as e:
+        await msg.answer(f"⚠️ Такое сообщение нельзя разослать: {e}. Отправьте другое сообщение:")
+        return False
+    return True
+
+
+@router.message(IntervalMailingState.waiting_for_message, flags={"album": True})
+async def interval_get_message(msg: Message, state: FSMContext, album: Optional[list[AlbumItem]] = None):
+    # Альбом приходит одним вызовом от AlbumMiddleware (bot/middlewares/album.py)
+    media_json, caption = mailing_content(msg, album)
+    if not await check_mailing_content(msg, media_json, caption):
+        return
+    await state.update_data(
+        media_file_id=media_json,
+        message=caption,
+    )
+    await state.set_state(IntervalMailingState.waiting_for_interval)
+    await msg.answer("Укажи интервал в минутах/часах/днях (например, 30, 2h, 1d):")
 
 @router.message(IntervalMailingState.waiting_for_interval)
 async def interval_get_interval(msg: Message, state: FSMContext):
@@ -504,7 +498,7 @@ async def interval_get_unpin_delay(msg: Message, state: FSMContext):
 
 
 @router.message(IntervalMailingState.waiting_for_delete_option)
-async def interval_get_delete_time(msg: Message, state: FSMContext):
+async def interval_get_delete_time(msg: Message, state: FSMContext, session: DbSession):
     delete_type = "after"
     try:
         delete_delay = int(msg.text.strip())
@@ -517,14 +511,19 @@ async def interval_get_delete_time(msg: Message, state: FSMContext):
     await state.update_data(delete_type=delete_type, delete_delay=delete_delay)
 
     data = await state.get_data()
-    await add_scheduled_post(data, msg.bot)
+    try:
+        post_id = await add_scheduled_post(session, data, msg.bot)
+    except PlanError as e:
+        await state.clear()
+        await msg.answer(f"⚠️ Рассылка не сохранена: {e}")
+        return
 
     await state.clear()
-    await msg.answer("✅ Рассылка по интервалу сохранена.")
+    await msg.answer("✅ Рассылка по интервалу сохранена.", reply_markup=post_saved_keyboard(post_id))
 
 
 @router.callback_query(IntervalMailingState.waiting_for_delete_option)
-async def interval_get_delete_option(cb: CallbackQuery, state: FSMContext):
+async def interval_get_delete_option(cb: CallbackQuery, state: FSMContext, session: DbSession):
     text = cb.data
     delete_type = "none"
     delete_delay = None
@@ -544,10 +543,15 @@ async def interval_get_delete_option(cb: CallbackQuery, state: FSMContext):
     await state.update_data(delete_type=delete_type, delete_delay=delete_delay)
 
     data = await state.get_data()
-    await add_scheduled_post(data, cb.bot)
+    try:
+        post_id = await add_scheduled_post(session, data, cb.bot)
+    except PlanError as e:
+        await state.clear()
+        await cb.message.answer(f"⚠️ Рассылка не сохранена: {e}")
+        return
 
     await state.clear()
-    await cb.message.answer("✅ Рассылка по интервалу сохранена.")
+    await cb.message.answer("✅ Рассылка по интервалу сохранена.", reply_markup=post_saved_keyboard(post_id))
 
 
 @router.callback_query(F.data.startswith("add_timed_"))
@@ -558,89 +562,17 @@ async def timed_start(cb: CallbackQuery, state: FSMContext):
     await cb.message.edit_text("Введите текст рассылки (можно медиа с подписью):")
 
 
-@router.message(TimedMailingState.waiting_for_message)
-async def timed_get_message(msg: Message, state: FSMContext):
-    data = await state.get_data()
-    album_buffer = data.get("album_buffer", {})
-
-    if msg.media_group_id:
-        group_id = msg.media_group_id
-        if "album_buffer" not in data:
-            data["album_buffer"] = {}
-        if group_id not in data["album_buffer"]:
-            data["album_buffer"][group_id] = []
-        data["album_buffer"][group_id].append(msg)
-        await state.update_data(album_buffer=data["album_buffer"])
-
-        await sleep(0.5)  # ждём, пока все сообщения альбома дойдут
-
-        current_data = await state.get_data()
-        buffer = current_data.get("album_buffer", {}).get(group_id, [])
-        if buffer and buffer[0].message_id == msg.message_id:
-            media_items = []
-            caption = None
-            for m in buffer:
-                if m.photo:
-                    media_items.append({"type": "photo", "file_id": m.photo[-1].file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.video:
-                    media_items.append({"type": "video", "file_id": m.video.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.document:
-                    media_items.append({"type": "document", "file_id": m.document.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.audio:
-                    media_items.append({"type": "audio", "file_id": m.audio.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.animation:
-                    media_items.append({"type": "animation", "file_id": m.animation.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.voice:
-                    media_items.append({"type": "voice", "file_id": m.voice.file_id})
-                    if not caption:
-                        caption = m.caption or m.html_text or ""
-                elif m.sticker:
-                    media_items.append({"type": "sticker", "file_id": m.sticker.file_id})
-                    caption = ""
-
-            media_json = json.dumps(media_items)
-
-            await state.update_data(
-                media_file_id=media_json,
-                message=caption,
-            )
-            await state.set_state(TimedMailingState.waiting_for_date)
-            await msg.answer("Введите дату рассылки в формате ДД.ММ.ГГГГ:")
-
-    else:
-        media_items = []
-        caption = None
-        if msg.content_type == "text":
-            caption = msg.html_text
-            media_items = [{"type": "text", "file_id": None}]
-        elif msg.photo:
-            media_items = [{"type": "photo", "file_id": msg.photo[-1].file_id}]
-            caption = msg.caption or msg.html_text or ""
-        elif msg.video:
-            media_items = [{"type": "video", "file_id": msg.video.file_id}]
-            caption = msg.caption or msg.html_text or ""
-        elif msg.document:
-            media_items = [{"type": "document", "file_id": msg.document.file_id}]
-            caption = msg.caption or msg.html_text or ""
-
-        media_json = json.dumps(media_items)
-
-        await state.update_data(
-            media_file_id=media_json,
-            message=caption,
-        )
-        await state.set_state(TimedMailingState.waiting_for_date)
-        await msg.answer("Введите дату рассылки в формате ДД.ММ.ГГГГ:")
+@router.message(TimedMailingState.waiting_for_message, flags={"album": True})
+async def timed_get_message(msg: Message, state: FSMContext, album: Optional[list[AlbumItem]] = None):
+    media_json, caption = mailing_content(msg, album)
+    if not await check_mailing_content(msg, media_json, caption):
+        return
+    await state.update_data(
+        media_file_id=media_json,
+        message=caption,
+    )
+    await state.set_state(TimedMailingState.waiting_for_date)
+    await msg.answer("Введите дату рассылки в формате ДД.ММ.ГГГГ:")
 
 @router.message(TimedMailingState.waiting_for_date)
 async def timed_get_date(msg: Message, state: FSMContext):
@@ -649,7 +581,7 @@ async def timed_get_date(msg: Message, state: FSMContext):
         moscow_tz = pytz.timezone("Europe/Moscow")
 
         date = datetime.datetime.strptime(msg.text.strip(), "%d.%m.%Y").date()
-        await state.update_data(date=date, tzinfo=moscow_tz.zone)
+        await state.update_data(date=date.isoformat(), tzinfo=moscow_tz.zone)
         await state.set_state(TimedMailingState.waiting_for_time)
         await msg.answer("Введите время в формате ЧЧ:ММ (24 часа):")
     except Exception as e:
@@ -666,10 +598,10 @@ async def timed_get_time(msg: Message, state: FSMContext):
         data = await state.get_data()
 
         moscow_tz = pytz.timezone("Europe/Moscow")
-        local_dt = moscow_tz.localize(datetime.datetime.combine(data["date"], time))
+        local_dt = moscow_tz.localize(datetime.datetime.combine(datetime.date.fromisoformat(data["date"]), time))
         utc_dt = local_dt.astimezone(pytz.utc)
 
-        await state.update_data(scheduled_datetime=utc_dt.replace(tzinfo=None))
+        await state.update_data(scheduled_datetime=utc_dt.replace(tzinfo=None).isoformat())
         await state.set_state(TimedMailingState.waiting_for_pin)
 
         kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -726,7 +658,7 @@ async def timed_get_unpin_delay(msg: Message, state: FSMContext):
 
 
 @router.callback_query(TimedMailingState.waiting_for_delete_option)
-async def timed_get_delete_option(cb: CallbackQuery, state: FSMContext):
+async def timed_get_delete_option(cb: CallbackQuery, state: FSMContext, session: DbSession):
     text = cb.data
     delete_type = "none"
     delete_delay = None
@@ -744,13 +676,18 @@ async def timed_get_delete_option(cb: CallbackQuery, state: FSMContext):
 
     await state.update_data(delete_type=delete_type, delete_delay=delete_delay)
     data = await state.get_data()
-    await add_timed_post(data, cb.bot)
+    try:
+        post_id = await add_timed_post(session, data, cb.bot)
+    except PlanError as e:
+        await state.clear()
+        await cb.message.answer(f"⚠️ Рассылка не сохранена: {e}")
+        return
     await state.clear()
-    await cb.message.answer("✅ Отложенная рассылка сохранена.")
+    await cb.message.answer("✅ Отложенная рассылка сохранена.", reply_markup=post_saved_keyboard(post_id))
 
 
 @router.message(TimedMailingState.waiting_for_delete_delay)
-async def timed_get_delete_delay(msg: Message, state: FSMContext):
+async def timed_get_delete_delay(msg: Message, state: FSMContext, session: DbSession):
     try:
         delay = int(msg.text.strip())
         if delay < 0:
@@ -761,222 +698,320 @@ async def timed_get_delete_delay(msg: Message, state: FSMContext):
 
     await state.update_data(delete_type="after", delete_delay=delay)
     data = await state.get_data()
-    await add_timed_post(data,  msg.bot)
+    try:
+        post_id = await add_timed_post(session, data, msg.bot)
+    except PlanError as e:
+        await state.clear()
+        await msg.answer(f"⚠️ Рассылка не сохранена: {e}")
+        return
 
     await state.clear()
-    await msg.answer("✅ Отложенная рассылка сохранена.")
+    await msg.answer("✅ Отложенная рассылка сохранена.", reply_markup=post_saved_keyboard(post_id))
 
 
-@router.callback_query(F.data.startswith("planned_posts_"))
-async def planned_posts_list(cb: CallbackQuery, bot: Bot):
-    import json
-    from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
-    group_id = int(cb.data.split("_")[-1])
-    await cb.message.delete()
+def post_summary(post) -> str:
+    # Строка оглавления: без содержимого поста, только когда и как он уходит
+    if post.type == "interval":
+        repeats = post.repeat_count if post.repeat_count is not None else "∞"
+        when = f"каждые {post.interval_minutes} мин, повторов: {repeats}"
+    else:
+        when = post.scheduled_datetime.strftime('%d.%m.%Y %H:%M')
+    return f"<b>ID {post.id}</b> · {when}{' · 📌' if post.pin else ''}"
 
-    async with AsyncSession() as session:
-        stmt = select(ScheduledPost).where(ScheduledPost.group_id == group_id)
-        result = await session.execute(stmt)
-        posts = result.scalars().all()
 
-    if not posts:
-        await bot.send_message(cb.from_user.id, "📭 У вас нет запланированных постов")
-        return
+def post_details(post) -> str:
+    details = [f"📌 ID: {post.id}", f"Тип: {'По интервалу' if post.type == 'interval' else 'По дате'}"]
+    if post.type == "interval":
+        details.append(f"Интервал: {post.interval_minutes} мин")
+        details.append(f"Повторов: {post.repeat_count if post.repeat_count is not None else '∞'}")
+    else:
+        details.append(f"Дата и время: {post.scheduled_datetime.strftime('%d.%m.%Y %H:%M')}")
+
+    details.append(f"Закреплять: {'Да' if post.pin else 'Нет'}")
+    if post.unpin_after_minutes:
+        details.append(f"Открепить через: {post.unpin_after_minutes} мин")
+
+    if post.delete_type == "immediately":
+        details.append("Удалить: сразу")
+    elif post.delete_type == "after" and post.delete_after_minutes:
+        details.append(f"Удалить через: {post.delete_after_minutes} мин")
+    elif post.delete_type == "after_unpin":
+        details.append("Удалить после открепления")
+    else:
+        details.append("Удалить: нет")
+
+    return "\n".join(details)
+
+
+async def render_post_preview(bot: Bot, chat_id: int, post):
+    kb = post_actions_keyboard(post.id)
+    try:
+        await send_plans.get(post).preview(bot, chat_id, post_details(post), reply_markup=kb)
+    except Exception as e:
+        print(f"[!] Ошибка отображения запланированного поста {post.id}: {e}")
+        await bot.send_message(chat_id=chat_id, text=f"[ID {post.id}] ⚠️ Ошибка отображения", reply_markup=kb)
 
+
+async def release_session(session, posts):
+    """
+    Перед отправкой превью (в личку — не чаще RATE_LIMIT_PRIVATE, страница альбомов идёт
+    десятки секунд) завершаем транзакцию: соединение возвращается в пул, а не простаивает.
+    Планы старых постов компилируются до коммита, чтобы он же их и сохранил.
+    """
     for post in posts:
-        kb = InlineKeyboardMarkup(
-            inline_keyboard=[[
-                InlineKeyboardButton(text=f"🗑 Удалить ID {post.id}", callback_data=f"delete_post_{post.id}")
-            ]]
+        try:
+            send_plans.get(post)
+        except Exception:
+            pass  # render_post_preview покажет ошибку отображения
+    await session.commit()
+
+
+@router.callback_query(F.data.startswith("planned_posts_"))
+async def planned_posts_list(cb: CallbackQuery, session: DbSession):
+    parts = cb.data.split("_")
+    group_id = int(parts[2])
+    cursor = parts[3] if len(parts) > 3 else "a"  # кнопки, отправленные до постраничного списка
+
+    page = await group_posts_page(session, group_id, POSTS_PAGE_SIZE, cursor)
+    if not page.posts:
+        await cb.message.edit_text(
+            "📭 У вас нет запланированных постов",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="↩️ К настройкам группы", callback_data=f"group_settings_{group_id}")
+            ]])
         )
+        return
 
-        # Формируем описание параметров рассылки
-        details = [f"📌 ID: {post.id}", f"Тип: {'По интервалу' if post.type == 'interval' else 'По дате'}"]
-        if post.type == "interval":
-            details.append(f"Интервал: {post.interval_minutes} мин")
-            details.append(f"Повторов: {post.repeat_count if post.repeat_count is not None else '∞'}")
-        else:
-            details.append(f"Дата и время: {post.scheduled_datetime.strftime('%d.%m.%Y %H:%M')}")
-
-        details.append(f"Закреплять: {'Да' if post.pin else 'Нет'}")
-        if post.unpin_after_minutes:
-            details.append(f"Открепить через: {post.unpin_after_minutes} мин")
-
-        if post.delete_type == "immediately":
-            details.append("Удалить: сразу")
-        elif post.delete_type == "after" and post.delete_after_minutes:
-            details.append(f"Удалить через: {post.delete_after_minutes} мин")
-        elif post.delete_type == "after_unpin":
-            details.append("Удалить после открепления")
-        else:
-            details.append("Удалить: нет")
+    lines = "\n".join(post_summary(post) for post in page.posts)
+    await cb.message.edit_text(
+        f"📅 Запланированные посты группы <code>{group_id}</code>:\n\n{lines}\n\n"
+        f"Нажмите на ID, чтобы посмотреть пост.",
+        reply_markup=planned_posts_keyboard(group_id, page)
+    )
 
-        params_text = "\n".join(details)
 
-        try:
-            # Новый формат: media_file_id как JSON
-            album_sent = False
-            if post.media_file_id:
-                try:
-                    media_items = json.loads(post.media_file_id)
-                    if isinstance(media_items, list) and len(media_items) > 1:
-                        # Альбом
-                        input_media = []
-                        for i, item in enumerate(media_items):
-                            ct = item.get("type")
-                            fid = item.get("file_id")
-                            caption = post.content if i == 0 else None
-                            if ct == "photo":
-                                input_media.append(InputMediaPhoto(media=fid, caption=caption))
-                            elif ct == "video":
-                                input_media.append(InputMediaVideo(media=fid, caption=caption))
-                            elif ct == "document":
-                                input_media.append(InputMediaDocument(media=fid, caption=caption))
-                            elif ct == "audio":
-                                input_media.append(InputMediaAudio(media=fid, caption=caption))
-                            else:
-                                # пропустить неизвестный тип
-                                continue
-
-                        print('sent album', input_media)
-                        sent_msgs = await bot.send_media_group(chat_id=cb.from_user.id, media=input_media)
-                        album_sent = True
-                        # После альбома — параметры отдельным сообщением
-                        await bot.send_message(chat_id=cb.from_user.id, text=params_text, reply_markup=kb)
-                    elif isinstance(media_items, list) and len(media_items) == 1:
-                        # Одиночное медиа/текст
-                        ct = media_items[0].get("type")
-                        fid = media_items[0].get("file_id")
-                        if ct == "text" or not fid:
-                            await bot.send_message(
-                                chat_id=cb.from_user.id,
-                                text=f"{post.content or '(пусто)'}\n\n{params_text}",
-                                reply_markup=kb
-                            )
-                        elif ct == "photo":
-                            await bot.send_photo(chat_id=cb.from_user.id, photo=fid, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                        elif ct == "video":
-                            await bot.send_video(chat_id=cb.from_user.id, video=fid, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                        elif ct == "document":
-                            await bot.send_document(chat_id=cb.from_user.id, document=fid, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                        elif ct == "audio":
-                            await bot.send_audio(chat_id=cb.from_user.id, audio=fid, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                        elif ct == "voice":
-                            await bot.send_voice(chat_id=cb.from_user.id, voice=fid, reply_markup=kb)
-                            await bot.send_message(chat_id=cb.from_user.id, text=params_text, reply_markup=kb)
-                        elif ct == "animation":
-                            await bot.send_animation(chat_id=cb.from_user.id, animation=fid, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                        elif ct == "sticker":
-                            await bot.send_sticker(chat_id=cb.from_user.id, sticker=fid, reply_markup=kb)
-                            await bot.send_message(chat_id=cb.from_user.id, text=params_text, reply_markup=kb)
-                        else:
-                            await bot.send_message(chat_id=cb.from_user.id, text=f"[ID {post.id}] ❓ Неизвестный тип контента", reply_markup=kb)
-                        album_sent = True
-                except Exception:
-                    # Не парсится как JSON — fallback на старый формат
-                    pass
-            if not album_sent:
-                # Старый формат: "ct+++fid"
-                ct = "text"
-                media_id = ""
-                if post.media_file_id and "+++" in post.media_file_id:
-                    ct, media_id = post.media_file_id.split("+++")
-                if ct == "text" or not media_id:
-                    await bot.send_message(
-                        chat_id=cb.from_user.id,
-                        text=f"{post.content or '(пусто)'}\n\n{params_text}",
-                        reply_markup=kb
-                    )
-                elif ct == "photo":
-                    await bot.send_photo(chat_id=cb.from_user.id, photo=media_id, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                elif ct == "video":
-                    await bot.send_video(chat_id=cb.from_user.id, video=media_id, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                elif ct == "document":
-                    await bot.send_document(chat_id=cb.from_user.id, document=media_id, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                elif ct == "audio":
-                    await bot.send_audio(chat_id=cb.from_user.id, audio=media_id, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                elif ct == "voice":
-                    await bot.send_voice(chat_id=cb.from_user.id, voice=media_id, reply_markup=kb)
-                    await bot.send_message(chat_id=cb.from_user.id, text=params_text, reply_markup=kb)
-                elif ct == "animation":
-                    await bot.send_animation(chat_id=cb.from_user.id, animation=media_id, caption=f"{post.content or ''}\n\n{params_text}", reply_markup=kb)
-                elif ct == "sticker":
-                    await bot.send_sticker(chat_id=cb.from_user.id, sticker=media_id, reply_markup=kb)
-                    await bot.send_message(chat_id=cb.from_user.id, text=params_text, reply_markup=kb)
-                else:
-                    await bot.send_message(chat_id=cb.from_user.id, text=f"[ID {post.id}] ❓ Неизвестный тип контента", reply_markup=kb)
-        except Exception as e:
-            print(f"[!] Ошибка отображения запланированного поста {post.id}: {e}")
-            await bot.send_message(chat_id=cb.from_user.id, text=f"[ID {post.id}] ⚠️ Ошибка отображения", reply_markup=kb)
+@router.callback_query(F.data.startswith("post_preview_"))
+async def post_preview(cb: CallbackQuery, bot: Bot, session: DbSession):
+    post_id = int(cb.data.split("_")[-1])
+    post = await session.get(ScheduledPost, post_id)
+    if post is None:
+        await cb.answer("Рассылка уже удалена или не найдена", show_alert=True)
+        return
+
+    await cb.answer()
+    await release_session(session, [post])
+    await render_post_preview(bot, cb.from_user.id, post)
+
+
+@router.callback_query(F.data.startswith("planned_show_"))
+async def planned_posts_show_page(cb: CallbackQuery, bot: Bot, session: DbSession):
+    group_id, cursor = cb.data.split("_")[-2:]
+    page = await group_posts_page(session, int(group_id), POSTS_PAGE_SIZE, cursor, with_content=True)
+    await cb.answer(f"Отправляю превью: {len(page.posts)}")
+    await release_session(session, page.posts)
+
+    # Личный чат ограничен RATE_LIMIT_PRIVATE в rate_governor — одновременность
+    # лишь держит очередь к нему заполненной, а не обгоняет лимит
+    await run_bounded(
+        page.posts,
+        lambda post: render_post_preview(bot, cb.from_user.id, post),
+        PREVIEW_CONCURRENCY
+    )
+
 
 @router.callback_query(F.data.startswith("delete_post_"))
-async def delete_post_handler(cb: CallbackQuery, bot: Bot):
+async def delete_post_handler(cb: CallbackQuery, bot: Bot, session: DbSession):
     post_id = int(cb.data.split("_")[-1])
 
-    async with AsyncSession() as session:
-        post = await session.get(ScheduledPost, post_id)
-        if post:
-            await session.delete(post)
-            await session.commit()
-
-            from bot.scheduler import scheduler
-            job = scheduler.get_job(f"{post.type}_{post_id}")
-            if job:
-                scheduler.remove_job(job.id)
-
-            # Пытаемся отредактировать, если нельзя — удалим и отправим новое
-            try:
-                await cb.message.edit_text(f"✅ Рассылка ID {post_id} удалена.")
-            except Exception:
-                await cb.message.delete()
-                await bot.send_message(cb.from_user.id, f"✅ Рассылка ID {post_id} удалена.")
-        else:
-            await cb.answer("Рассылка уже удалена или не найдена", show_alert=True)
+    post = await session.get(ScheduledPost, post_id)
+    if post:
+        await session.delete(post)
+        await session.commit()
 
+        unschedule_post(post.type, post_id)
+        send_plans.forget(post_id)
 
-async def get_admin_groups(session, username):
-    stmt = select(Group).where(Group.admin_username == username)
-    result = await session.execute(stmt)
-    return result.scalars().all()
+        # Пытаемся отредактировать, если нельзя — удалим и отправим новое
+        try:
+            await cb.message.edit_text(f"✅ Рассылка ID {post_id} удалена.")
+        except Exception:
+            await cb.message.delete()
+            await bot.send_message(cb.from_user.id, f"✅ Рассылка ID {post_id} удалена.")
+    else:
+        await cb.answer("Рассылка уже удалена или не найдена", show_alert=True)
 
 
-async def add_scheduled_post(data, bot: Bot):
-    pprint(data)
-    async with AsyncSession() as session:
-        post = ScheduledPost(
-            group_id=data["group_id"],
-            type="interval",
-            content=data["message"],
-            interval_minutes=data["interval"],
-            repeat_count=data["repeats"],
-            pin=data.get("pin", False),
-            unpin_after_minutes=data.get("unpin_after", None),
-            delete_type=data["delete_type"],
-            delete_after_minutes=data["delete_delay"],
-            media_file_id=data["media_file_id"]
+async def show_post_targets(session, cb: CallbackQuery, post_id: int, cursor: str):
+    admin = admin_registry.get(cb.from_user.id)
+    if not admin:
+        return
+    page = await admin_groups_page(session, admin.username, PAGE_SIZE, cursor)
+    # Отметки нужны только для групп этой страницы
+    selected = set((await session.execute(
+        select(PostTarget.group_id).where(
+            PostTarget.post_id == post_id,
+            PostTarget.group_id.in_([group.id for group in page.groups])
         )
-        session.add(post)
-        await session.flush()
+    )).scalars())
 
-        await add_post_to_schedule(bot, post)
-        await session.commit()
+    await cb.message.edit_text(
+        f"Группы, в которые уходит пост ID {post_id} (нажмите, чтобы включить/выключить):",
+        reply_markup=post_targets_keyboard(post_id, page, selected)
+    )
 
 
-async def add_timed_post(data, bot: Bot):
-    async with AsyncSession() as session:
-        post = ScheduledPost(
-            group_id=data["group_id"],
-            type="datetime",
-            content=data["message"],
-            scheduled_datetime=data["scheduled_datetime"],
-            pin=data.get("pin", False),
-            unpin_after_minutes=data.get("unpin_after", None),
-            delete_type=data["delete_type"],
-            delete_after_minutes=data["delete_delay"],
-            media_file_id=data["media_file_id"]
-        )
-        session.add(post)
-        await session.flush()
+@router.callback_query(F.data.startswith("post_targets_"))
+async def post_targets(cb: CallbackQuery, session: DbSession):
+    post_id, cursor = cb.data.split("_")[-2:]
+    await show_post_targets(session, cb, int(post_id), cursor)
+
+
+def admin_owns_post(admin, post) -> bool:
+    # Пост принадлежит админу своей исходной группы
+    owner = group_cache.get(post.group_id)
+    return bool(admin and owner and owner.admin_username == admin.username)
+
+
+@router.callback_query(F.data.startswith("toggle_target_"))
+async def toggle_post_target(cb: CallbackQuery, session: DbSession):
+    post_id, group_id, cursor = cb.data.split("_")[-3:]
+    post_id, group_id = int(post_id), int(group_id)
+
+    admin = admin_registry.get(cb.from_user.id)
+    group = group_cache.get(group_id)
+    if not admin or not group or group.admin_username != admin.username:
+        await cb.answer("Нет доступа к этой группе", show_alert=True)
+        return
+    post = await session.get(ScheduledPost, post_id)
+    if not post:
+        await cb.answer("Рассылка уже удалена или не найдена", show_alert=True)
+        return
+    if not admin_owns_post(admin, post):
+        await cb.answer("Нет доступа к этой рассылке", show_alert=True)
+        return
+
+    target = await session.get(PostTarget, (post_id, group_id))
+    if target is None:
+        session.add(PostTarget(post_id=post_id, group_id=group_id))
+    else:
+        count = (await session.execute(
+            select(func.count()).where(PostTarget.post_id == post_id)
+        )).scalar_one()
+        if count <= 1:
+            await cb.answer("Нужна хотя бы одна группа", show_alert=True)
+            return
+        await session.delete(target)
+    await session.commit()
+
+    await show_post_targets(session, cb, post_id, cursor)
+
+
+@router.callback_query(F.data == "targets_done")
+async def post_targets_done(cb: CallbackQuery):
+    await cb.message.edit_text("✅ Группы рассылки сохранены.")
 
-        await add_post_to_schedule(bot, post)
-        await session.commit()
\ No newline at end of file
+
+@router.callback_query(F.data.startswith("post_report_"))
+async def post_delivery_report(cb: CallbackQuery, bot: Bot, session: DbSession):
+    post_id = int(cb.data.split("_")[-1])
+
+    post = await session.get(ScheduledPost, post_id)
+    if not post:
+        await cb.answer("Рассылка уже удалена или не найдена", show_alert=True)
+        return
+    if not admin_owns_post(admin_registry.get(cb.from_user.id), post):
+        await cb.answer("Нет доступа к этой рассылке", show_alert=True)
+        return
+
+    stmt = (
+        select(PostTarget, Group.title)
+        .join(Group, Group.id == PostTarget.group_id)
+        .where(PostTarget.post_id == post_id)
+        .order_by(Group.title)
+    )
+    rows = (await session.execute(stmt)).all()
+    # Дальше только отправка (длинный отчёт — несколько сообщений): соединение отдаём в пул
+    await session.commit()
+
+    if not rows:
+        await cb.answer("Рассылка уже удалена или не найдена", show_alert=True)
+        return
+
+    lines = [f"📊 Доставка поста ID {post_id}:"]
+    for target, title in rows:
+        if target.last_status is None:
+            status = "⏳ ещё не отправлялся"
+        elif target.last_status == "ok":
+            status = f"✅ {target.last_sent_at.strftime('%d.%m.%Y %H:%M')}"
+        else:
+            status = f"❌ {target.last_sent_at.strftime('%d.%m.%Y %H:%M')}: {escape(target.last_error or '')}"
+        lines.append(f"• {escape(title or '')}: {status} (успешно {target.sent_count}, ошибок {target.failed_count})")
+
+    await cb.answer()
+    for chunk in split_lines(lines):
+        await bot.send_message(cb.from_user.id, chunk)
+
+
+def split_lines(lines: list[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Склеивает строки в сообщения не длиннее limit; строку длиннее limit обрезает."""
+    chunks, current = [], ""
+    for line in lines:
+        line = line[:limit]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def add_scheduled_post(session, data, bot: Bot):
+    pprint(data)
+    post = ScheduledPost(
+        group_id=data["group_id"],
+        type="interval",
+        content=data["message"],
+        interval_minutes=data["interval"],
+        repeat_count=data["repeats"],
+        pin=data.get("pin", False),
+        unpin_after_minutes=data.get("unpin_after", None),
+        delete_type=data["delete_type"],
+        delete_after_minutes=data["delete_delay"],
+        media_file_id=data["media_file_id"],
+        # Битые медиа отсекаем здесь, а не в момент отправки
+        send_plan=compile_plan(data["message"], data["media_file_id"])
+    )
+    session.add(post)
+    await session.flush()
+    session.add(PostTarget(post_id=post.id, group_id=post.group_id))
+
+    await add_post_to_schedule(bot, post)
+    await session.commit()
+    announce_post(post.id)
+    return post.id
+
+
+async def add_timed_post(session, data, bot: Bot):
+    post = ScheduledPost(
+        group_id=data["group_id"],
+        type="datetime",
+        content=data["message"],
+        scheduled_datetime=datetime.datetime.fromisoformat(data["scheduled_datetime"]),
+        pin=data.get("pin", False),
+        unpin_after_minutes=data.get("unpin_after", None),
+        delete_type=data["delete_type"],
+        delete_after_minutes=data["delete_delay"],
+        media_file_id=data["media_file_id"],
+        # Битые медиа отсекаем здесь, а не в момент отправки
+        send_plan=compile_plan(data["message"], data["media_file_id"])
+    )
+    session.add(post)
+    await session.flush()
+    session.add(PostTarget(post_id=post.id, group_id=post.group_id))
+
+    await add_post_to_schedule(bot, post)
+    await session.commit()
+    announce_post(post.id)
+    return post.id
\ No newline at end of file
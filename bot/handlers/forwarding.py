@@ -4,8 +4,13 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters import StateFilter
 from sqlalchemy import select
-from db.session import AsyncSession
-from db.models import Admin, Group, UnblockedUserLimit
+from sqlalchemy.ext.asyncio import AsyncSession as DbSession
+from db.models import UnblockedUserLimit
+from bot.quota import quota_store
+from bot.admin_registry import admin_registry
+from bot.keyboards.panel import group_page_keyboard, PAGE_SIZE
+from db.groups import admin_groups_page
+from bot.cache_bus import cache_bus, QUOTA_CHANGED
 
 router = Router()
 
@@ -18,7 +23,7 @@ class UnlockState(StatesGroup):
 
 
 @router.message(F.forward_from | F.contact)
-async def handle_forwarded_message(msg: Message, state: FSMContext):
+async def handle_forwarded_message(msg: Message, state: FSMContext, session: DbSession):
     sender_id = msg.from_user.id
 
     # Если это объект контакта
@@ -47,47 +52,31 @@ async def handle_forwarded_message(msg: Message, state: FSMContext):
         return
 
     # Проверяем, является ли отправитель администратором
-    async with AsyncSession() as session:
-        admin = await session.get(Admin, sender_id)
-        if not admin:
-            await msg.answer("⛔️ Вы не админ.")
-            return
-
-        stmt = select(Group).where(Group.admin_username == admin.username)
-        result = await session.execute(stmt)
-        groups = result.scalars().all()
-
-        if not groups:
-            await msg.answer("У вас нет групп.")
-            return
+    admin = admin_registry.get(sender_id)
+    if not admin:
+        await msg.answer("⛔️ Вы не админ.")
+        return
 
-        # Отправляем список групп для выбора
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=group.title, callback_data=f"unlock_{group.id}")]
-            for group in groups
-        ])
-        await msg.answer("Выберите, где разблокировать пользователя:", reply_markup=kb)
-        await state.set_state(UnlockState.waiting_for_group_selection)
+    # Отправляем список групп для выбора
+    await ask_unlock_group(msg, state, session, admin.username)
 
 @router.message(StateFilter(UnlockState.waiting_for_manual_user))
-async def process_manual_user_input(msg: Message, state: FSMContext, bot: Bot):
+async def process_manual_user_input(msg: Message, state: FSMContext, bot: Bot, session: DbSession):
     text = msg.text.strip()
     sender_id = msg.from_user.id
 
     if text.startswith("@"):
-        async with AsyncSession() as session:
-            stmt = select(UnblockedUserLimit).where(UnblockedUserLimit.username == text.lstrip("@"))
-            result = await session.execute(stmt)
-            user_limit = result.scalars().first()
-
-            if user_limit:
-                user_id = user_limit.user_id
-                await state.update_data(target_user_id=user_id)
-                print(f"[Найден пользователь по username]: {user_id} ({text})")
-            else:
-                await msg.answer("❌ Пользователь с таким username не найден в базе данных. Попробуйте ещё раз.")
-                return
+        stmt = select(UnblockedUserLimit).where(UnblockedUserLimit.username == text.lstrip("@"))
+        result = await session.execute(stmt)
+        user_limit = result.scalars().first()
+
+        if user_limit:
+            user_id = user_limit.user_id
+            await state.update_data(target_user_id=user_id)
+            print(f"[Найден пользователь по username]: {user_id} ({text})")
+        else:
+            await msg.answer("❌ Пользователь с таким username не найден в базе данных. Попробуйте ещё раз.")
+            return
     else:
         try:
             user_id = int(text)
@@ -100,48 +89,57 @@ async def process_manual_user_input(msg: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
     admin_id = data.get("admin_id", sender_id)
 
-    async with AsyncSession() as session:
-        admin = await session.get(Admin, admin_id)
-        if not admin:
-            await msg.answer("⛔️ Вы не админ.")
-            return
+    admin = admin_registry.get(admin_id)
+    if not admin:
+        await msg.answer("⛔️ Вы не админ.")
+        return
 
-        stmt = select(Group).where(Group.admin_username == admin.username)
-        result = await session.execute(stmt)
-        groups = result.scalars().all()
+    await ask_unlock_group(msg, state, session, admin.username)
+
+
+async def ask_unlock_group(msg: Message, state: FSMContext, session, username):
+    # Группы листаются по PAGE_SIZE, как в «Мои группы»
+    page = await admin_groups_page(session, username, PAGE_SIZE)
+    if not page.groups:
+        await msg.answer("У вас нет групп.")
+        return
+
+    await msg.answer(
+        "Выберите, где разблокировать пользователя:",
+        reply_markup=group_page_keyboard(page, "unlock_", "unlockpage_")
+    )
+    await state.set_state(UnlockState.waiting_for_group_selection)
 
-        if not groups:
-            await msg.answer("У вас нет групп.")
-            return
 
-        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=group.title, callback_data=f"unlock_{group.id}")]
-            for group in groups
-        ])
-        await msg.answer("Выберите, где разблокировать пользователя:", reply_markup=kb)
-        await state.set_state(UnlockState.waiting_for_group_selection)
+@router.callback_query(StateFilter(UnlockState.waiting_for_group_selection), F.data.startswith("unlockpage_"))
+async def paginate_unlock_groups(cb: CallbackQuery, state: FSMContext, session: DbSession):
+    data = await state.get_data()
+    admin = admin_registry.get(data.get("admin_id", cb.from_user.id))
+    if not admin:
+        return
+
+    page = await admin_groups_page(session, admin.username, PAGE_SIZE, cb.data.split("_")[-1])
+    await cb.message.edit_reply_markup(reply_markup=group_page_keyboard(page, "unlock_", "unlockpage_"))
 
 
 @router.callback_query(StateFilter(UnlockState.waiting_for_group_selection), F.data.startswith("unlock_"))
-async def process_group_select(cb: CallbackQuery, state: FSMContext):
+async def process_group_select(cb: CallbackQuery, state: FSMContext, session: DbSession):
     group_id = int(cb.data.split("_")[1])
     await state.update_data(group_id=group_id)
-    async with AsyncSession() as session:
-        data = await state.get_data()
-        target_user_id = data.get("target_user_id")
-        stmt = select(UnblockedUserLimit).where(
-            UnblockedUserLimit.user_id == target_user_id,
-            UnblockedUserLimit.group_id == group_id
-        )
-        result = await session.execute(stmt)
-        limit = result.scalar_one_or_none()
-        if limit and limit.max_messages is None:
-            await cb.message.edit_text("У пользователя безлимит на сообщения.")
-            
-            await state.clear()
-            return
-        remaining = limit.max_messages - limit.used_messages if limit else 0
+    data = await state.get_data()
+    target_user_id = data.get("target_user_id")
+    stmt = select(UnblockedUserLimit).where(
+        UnblockedUserLimit.user_id == target_user_id,
+        UnblockedUserLimit.group_id == group_id
+    )
+    result = await session.execute(stmt)
+    limit = result.scalar_one_or_none()
+    if limit and limit.max_messages is None:
+        await cb.message.edit_text("У пользователя безлимит на сообщения.")
+
+        await state.clear()
+        return
+    remaining = limit.max_messages - limit.used_messages if limit else 0
 
     await cb.message.edit_text(f"Пользователю сейчас доступно {remaining} сообщений.\nСколько вы хотите ему добавить?")
     await state.set_state(UnlockState.waiting_for_limit)
@@ -163,7 +161,7 @@ async def process_limit_input(msg: Message, state: FSMContext, bot: Bot):
 
 
 @router.message(StateFilter(UnlockState.waiting_for_delete_delay))
-async def process_delete_delay(msg: Message, state: FSMContext, bot: Bot):
+async def process_delete_delay(msg: Message, state: FSMContext, bot: Bot, session: DbSession):
     try:
         delay = int(msg.text.strip())
         if delay < 0:
@@ -185,41 +183,46 @@ async def process_delete_delay(msg: Message, state: FSMContext, bot: Bot):
         await state.clear()
         return
 
-    async with AsyncSession() as session:
-        stmt = select(UnblockedUserLimit).where(
-            UnblockedUserLimit.user_id == target_user_id,
-            UnblockedUserLimit.group_id == group_id
+    stmt = select(UnblockedUserLimit).where(
+        UnblockedUserLimit.user_id == target_user_id,
+        UnblockedUserLimit.group_id == group_id
+    )
+    result = await session.execute(stmt)
+    existing_limit = result.scalar_one_or_none()
+
+    if existing_limit and existing_limit.max_messages is not None:
+        remaining = existing_limit.max_messages - existing_limit.used_messages
+        existing_limit.max_messages += max_messages
+        existing_limit.delete_after_minutes = delay or None
+        existing_limit.can_send = True
+        await session.commit()
+        quota_store.invalidate(group_id, target_user_id)
+        cache_bus.publish(QUOTA_CHANGED, group_id, target_user_id)
+        new_total = existing_limit.max_messages - existing_limit.used_messages
+        await grant_permissions(bot, group_id, target_user_id)
+        await msg.answer(
+            f"✅ Обновлено. Было доступно: {remaining}. Добавлено: {max_messages}. Теперь: {new_total}.\n"
+            f"🗑 Удаление сообщений: {'не удаляются' if delay == 0 else f'через {delay} мин.'}"
+        )
+    else:
+        limit = UnblockedUserLimit(
+            user_id=target_user_id,
+            group_id=group_id,
+            max_messages=max_messages,
+            used_messages=0,
+            delete_after_minutes=delay or None,
+            username=target_username,
+            can_send=True
+        )
+        session.add(limit)
+        await session.commit()
+        quota_store.invalidate(group_id, target_user_id)
+        cache_bus.publish(QUOTA_CHANGED, group_id, target_user_id)
+        await grant_permissions(bot, group_id, target_user_id)
+        await msg.answer(
+            f"✅ Пользователь добавлен. Доступно: {max_messages} сообщений.\n"
+            f"🗑 Удаление сообщений: {'не удаляются' if delay == 0 else f'через {delay} мин.'}"
         )
-        result = await session.execute(stmt)
-        existing_limit = result.scalar_one_or_none()
-
-        if existing_limit and existing_limit.max_messages is not None:
-            remaining = existing_limit.max_messages - existing_limit.used_messages
-            existing_limit.max_messages += max_messages
-            existing_limit.delete_after_minutes = delay or None
-            await session.commit()
-            new_total = existing_limit.max_messages - existing_limit.used_messages
-            await grant_permissions(bot, group_id, target_user_id)
-            await msg.answer(
-                f"✅ Обновлено. Было доступно: {remaining}. Добавлено: {max_messages}. Теперь: {new_total}.\n"
-                f"🗑 Удаление сообщений: {'не удаляются' if delay == 0 else f'через {delay} мин.'}"
-            )
-        else:
-            limit = UnblockedUserLimit(
-                user_id=target_user_id,
-                group_id=group_id,
-                max_messages=max_messages,
-                used_messages=0,
-                delete_after_minutes=delay or None,
-                username=target_username
-            )
-            session.add(limit)
-            await session.commit()
-            await grant_permissions(bot, group_id, target_user_id)
-            await msg.answer(
-                f"✅ Пользователь добавлен. Доступно: {max_messages} сообщений.\n"
-                f"🗑 Удаление сообщений: {'не удаляются' if delay == 0 else f'через {delay} мин.'}"
-            )
 
     await state.clear()
 
@@ -3,87 +3,81 @@ from aiogram import Router, Bot
 from aiogram.types import ChatMemberUpdated, ChatPermissions
 from aiogram.filters.chat_member_updated import ChatMemberUpdatedFilter, JOIN_TRANSITION
 from asyncio import sleep
-from db.session import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession as DbSession
 from db.models import Group, Admin
 from aiogram.types import ChatMemberUpdated, ChatPermissions
 from aiogram.enums.chat_member_status import ChatMemberStatus
-from sqlalchemy import select
+from sqlalchemy import update
 from aiogram import Router, Bot, F
 from aiogram.types import Message, ChatPermissions
-import asyncio
-from db.models import UnblockedUserLimit
+from bot.member_cache import member_cache
+from bot.quota import quota_store
+from bot.group_cache import group_cache
+from bot.cache_bus import cache_bus, GROUP_CHANGED, ADMIN_CHANGED
+from bot.admin_registry import admin_registry
+from db.limits import reset_user_limit
+from bot.timer_wheel import timer_wheel
 
 router = Router()
 
 
+# Любое изменение статуса участника (в т.ч. самого бота) сразу попадает в кэш,
+# поэтому limit_checker узнаёт админов и создателей без запроса get_chat_member
+@router.chat_member.outer_middleware()
+@router.my_chat_member.outer_middleware()
+async def track_member_status(handler, event: ChatMemberUpdated, data: dict):
+    member_cache.update_from_event(event)
+    return await handler(event, data)
+
+
 @router.chat_member(ChatMemberUpdatedFilter(JOIN_TRANSITION))
-async def on_user_join(event: ChatMemberUpdated, bot: Bot):
+async def on_user_join(event: ChatMemberUpdated, bot: Bot, session: DbSession):
     group_id = event.chat.id
     user = event.new_chat_member.user
     user_id = user.id
 
-    async with AsyncSession() as session:
-        group = await session.get(Group, group_id)
-        if not group:
-            return
+    group = group_cache.get(group_id)
+    if group is None:
+        return
 
-        # Определяем лимит
-        base_limit = group.limit_msg
+    # Определяем лимит
+    base_limit = group.limit_msg
 
-        # Добавляем запись в таблицу лимитов
-        stmt = select(UnblockedUserLimit).where(
-            UnblockedUserLimit.group_id == group_id,
-            UnblockedUserLimit.user_id == user_id
-        )
-        result = await session.execute(stmt)
-        existing = result.scalar_one_or_none()
-
-        if existing:
-            existing.max_messages = base_limit
-            used_messages = existing.used_messages
-        else:
-            session.add(UnblockedUserLimit(
-                group_id=group_id,
-                user_id=user_id,
-                max_messages=base_limit,
-                used_messages=0,
-                username=user.username
-            ))
-
-            used_messages = 0
-
-        await session.commit()
-
-        # Блокировка по лимиту
-        if base_limit == 0:
-            await bot.restrict_chat_member(
-                chat_id=group_id,
-                user_id=user_id,
-                permissions=ChatPermissions(
-                    can_send_messages=False,
-                    can_send_media_messages=False,
-                    can_send_polls=False,
-                    can_send_other_messages=False,
-                    can_add_web_page_previews=False
-                )
+    # Создаём или обновляем запись лимита одним upsert-ом
+    used_messages = await reset_user_limit(
+        session, group_id, user_id, base_limit, user.username, can_send=base_limit != 0
+    )
+    await session.commit()
+    quota_store.invalidate(group_id, user_id)
+
+    # Блокировка по лимиту
+    if base_limit == 0:
+        await bot.restrict_chat_member(
+            chat_id=group_id,
+            user_id=user_id,
+            permissions=ChatPermissions(
+                can_send_messages=False,
+                can_send_media_messages=False,
+                can_send_polls=False,
+                can_send_other_messages=False,
+                can_add_web_page_previews=False
             )
-        else:
-            await bot.restrict_chat_member(
-                chat_id=group_id,
-                user_id=user_id,
-                permissions=ChatPermissions(
-                    can_send_messages=True,
-                    can_send_media_messages=True,
-                    can_send_polls=True,
-                    can_send_other_messages=True,
-                    can_add_web_page_previews=True
-                )
+        )
+    else:
+        await bot.restrict_chat_member(
+            chat_id=group_id,
+            user_id=user_id,
+            permissions=ChatPermissions(
+                can_send_messages=True,
+                can_send_media_messages=True,
+                can_send_polls=True,
+                can_send_other_messages=True,
+                can_add_web_page_previews=True
             )
+        )
 
-        # Получаем админа
-        result = await session.execute(select(Admin))
-        admin = result.scalars().first()
-        admin_username = f"@{admin.username}" if admin and admin.username else "админ"
+    # Упоминание админа посчитано один раз на группу (GroupSettings.admin_mention)
+    admin_username = group.admin_mention or admin_registry.fallback_mention()
 
     user_nickname = f"@{user.username}" if user.username else f"{user.full_name}"
     limit_text = "без ограничений" if base_limit is None else str(base_limit - used_messages)
@@ -98,47 +92,46 @@ async def on_user_join(event: ChatMemberUpdated, bot: Bot):
         ) # + f"\n\n💬 Доступно сообщений: {limit_text}"
     )
 
-    await asyncio.sleep(30)
-    for _ in range(3):
-        try:
-            await msg.delete()
-            break
-        except:
-            print("Failed to delete message, retrying...")
-            await asyncio.sleep(2)
+    # Удаляем приветствие через 30 секунд (3 попытки с паузой 2 секунды)
+    timer_wheel.schedule(group_id, msg.message_id, 30, retries=2)
 
 @router.my_chat_member()
-async def on_bot_added(event: ChatMemberUpdated, bot: Bot):
+async def on_bot_added(event: ChatMemberUpdated, bot: Bot, session: DbSession):
     group_id = event.chat.id
     adder_id = event.from_user.id
-    adder_username = event.from_user.username or "admin"
-
-    async with AsyncSession() as session:
-        admin = await session.get(Admin, adder_id)
-        if not admin:
-            await bot.leave_chat(group_id)
-            return
-
-        # Обновляем username админа при необходимости
-        if not admin.username and event.from_user.username:
-            admin.username = adder_username
-
-        # Получаем данные о чате
-        chat = await bot.get_chat(group_id)
-
-        group = await session.get(Group, group_id)
-        if group:
-            group.title = chat.title
-            group.description = chat.description or "-"
-            group.admin_username = admin.username  # обновим, если поменяли
-        else:
-            group = Group(
-                id=group_id,
-                title=chat.title,
-                description=chat.description or "-",
-                admin_username=admin.username,
-                welcome_template="Привет, {user}! Добро пожаловать в чат {title}. Это крупнейший паблик по {description}. Чтобы разместить ваше предложение напишите админу чата {admin}"
-            )
-            session.add(group)
 
-        await session.commit()
\ No newline at end of file
+    admin = admin_registry.get(adder_id)
+    if not admin:
+        await bot.leave_chat(group_id)
+        return
+
+    # Обновляем username админа при необходимости
+    admin_username = admin.username
+    if not admin_username and event.from_user.username:
+        admin_username = event.from_user.username
+        await session.execute(update(Admin).where(Admin.id == adder_id).values(username=admin_username))
+
+    # Получаем данные о чате
+    chat = await bot.get_chat(group_id)
+
+    group = await session.get(Group, group_id)
+    if group:
+        group.title = chat.title
+        group.description = chat.description or "-"
+        group.admin_username = admin_username  # обновим, если поменяли
+    else:
+        group = Group(
+            id=group_id,
+            title=chat.title,
+            description=chat.description or "-",
+            admin_username=admin_username,
+            welcome_template="Привет, {user}! Добро пожаловать в чат {title}. Это крупнейший паблик по {description}. Чтобы разместить ваше предложение напишите админу чата {admin}"
+        )
+        session.add(group)
+
+    await session.commit()
+    if admin_username != admin.username:
+        admin_registry.put(adder_id, admin_username)
+        cache_bus.publish(ADMIN_CHANGED, adder_id)
+    group_cache.put(group)
+    cache_bus.publish(GROUP_CHANGED, group.id)
\ No newline at end of file
@@ -1,114 +1,65 @@
 from aiogram import Router, Bot, F
 from aiogram.types import Message
-from sqlalchemy import select, update, UniqueConstraint
-from db.session import AsyncSession
-from db.models import UnblockedUserLimit, Group, ScheduledTask
-import asyncio
-from apscheduler.triggers.date import DateTrigger
+from sqlalchemy.ext.asyncio import AsyncSession as DbSession
+from bot.quota import quota_store
+from bot.group_cache import group_cache
+from bot.timer_wheel import timer_wheel
+from bot.delayed_actions import add_action
+from bot.deletion_batcher import deletion_batcher
 import datetime
 from aiogram.types import Message, ChatPermissions
+from bot.member_cache import member_cache
+from bot.rate_limiter import best_effort, SendDropped
 
 router = Router()
 
 
 @router.message(F.chat.type.in_({"group", "supergroup"}))
-async def limit_checker(msg: Message, bot: Bot):
+async def limit_checker(msg: Message, bot: Bot, session: DbSession):
     user_id = msg.from_user.id
     group_id = msg.chat.id
 
-    member = await bot.get_chat_member(group_id, user_id)
-    print(f"Checking limits for user {user_id} in group {group_id}, status: {member.status}")
-    if member.status in ("administrator", "creator", "left"):
-        return  # Админы и владельцы не ограничиваются
-
-    if msg.content_type in {"new_chat_members", "left_chat_member", "pinned_message"}:
+    # Чаты, которыми бот не управляет, отсекаем до любых запросов к API и БД
+    group = group_cache.get(group_id)
+    if group is None:
         return
 
     if msg.content_type in {"new_chat_members", "left_chat_member", "pinned_message"}:
         return
 
-    async with AsyncSession() as session:
-        stmt = select(UnblockedUserLimit).where(
-            UnblockedUserLimit.user_id == user_id,
-            UnblockedUserLimit.group_id == group_id
-        )
-        result = await session.execute(stmt)
-        record = result.scalars().first()
-
-        group = await session.get(Group, group_id)
-        if not group:
-            return
-
-        # Определяем лимит
-        base_limit = group.limit_msg
-
-        # Нет записи — создаем новую
-        if not record:
-            record = UnblockedUserLimit(
-                group_id=group_id,
-                user_id=user_id,
-                max_messages=base_limit,
-                used_messages=1,
-                username=msg.from_user.username
-            )
-            session.add(record)
-            await session.commit()
-
-        # Обработка по лимиту
-        if record.max_messages is not None and record.used_messages >= record.max_messages:
-            try:
-                await msg.delete()
-            except Exception:
-                pass
-
-            username = f"@{msg.from_user.username}" if msg.from_user.username else msg.from_user.full_name
-            stmt = select(Group).where(Group.id == group_id)
-            group_result = await session.execute(stmt)
-            group = group_result.scalars().first()
-
-            if group and group.limit_exceeded_template:
-                text = group.limit_exceeded_template.format(user=username)
-            else:
-                text = f"{username}, вы исчерпали лимит сообщений."
+    # Статус берём из кэша (обновляется событиями chat_member), в API идём только при промахе
+    status = await member_cache.get_status(bot, group_id, user_id)
+    if status in ("administrator", "creator", "left"):
+        return  # Админы и владельцы не ограничиваются
 
-            warn_msg = await bot.send_message(chat_id=group_id, text=text)
-            await asyncio.sleep(30)
-            try:
-                await warn_msg.delete()
-            except:
-                pass
+    # Счётчик живёт в памяти, в БД попадает пачкой (см. bot/quota.py)
+    allowed, delete_after_minutes = await quota_store.consume(
+        group_id, user_id, msg.from_user.username, group.limit_msg
+    )
+
+    # Обработка по лимиту
+    if not allowed:
+        # Удаления в одном чате уходят пачкой через deleteMessages
+        deletion_batcher.enqueue(group_id, msg.message_id)
+
+        username = f"@{msg.from_user.username}" if msg.from_user.username else msg.from_user.full_name
+        if group.limit_exceeded_template:
+            text = group.limit_exceeded_template.format(user=username)
+        else:
+            text = f"{username}, вы исчерпали лимит сообщений."
+
+        try:
+            # Во время спам-волны очередь к группе длинная — предупреждения тогда пропускаем
+            with best_effort():
+                warn_msg = await bot.send_message(chat_id=group_id, text=text)
+        except SendDropped:
             return
+        # Предупреждение удалит колесо таймеров, хендлер не ждёт
+        timer_wheel.schedule(group_id, warn_msg.message_id, 30)
+        return
 
-        if record.max_messages is not None:
-            # Увеличиваем used_messages
-            stmt = update(UnblockedUserLimit).where(
-                UnblockedUserLimit.id == record.id
-            ).values(
-                used_messages=record.used_messages + 1
-            )
-            await session.execute(stmt)
-            await session.commit()
-
-        if record.delete_after_minutes:
-            from bot.scheduler import scheduler
-
-            run_at = datetime.datetime.now() + datetime.timedelta(minutes=record.delete_after_minutes)
-
-            # Сохраняем задачу в БД
-            async with AsyncSession() as session:
-                task = ScheduledTask(
-                    chat_id=msg.chat.id,
-                    message_id=msg.message_id,
-                    run_at=run_at
-                )
-                session.add(task)
-                await session.commit()
-
-            # Добавляем задачу в планировщик
-            scheduler.add_job(
-                bot.delete_message,
-                trigger=DateTrigger(run_date=run_at),
-                kwargs={"chat_id": msg.chat.id, "message_id": msg.message_id},
-                id=f"autodel_{msg.chat.id}_{msg.message_id}",
-                replace_existing=True
-            )
\ No newline at end of file
+    if delete_after_minutes:
+        # Удаление сообщения пользователя — строка в очереди отложенных действий,
+        # коммит сделает DbSessionMiddleware; до этой ветки сессия не создаётся
+        run_at = datetime.datetime.now() + datetime.timedelta(minutes=delete_after_minutes)
+        add_action(session, msg.chat.id, msg.message_id, run_at)
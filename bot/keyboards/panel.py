@@ -1,36 +1,101 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from math import ceil
 
-PAGE_SIZE = 5
+from db.groups import page_cursors
+from db.posts import post_page_cursors
 
+PAGE_SIZE = 5
+POSTS_PAGE_SIZE = 10
 
-def groups_keyboard(groups, page=0):
-    start = page * PAGE_SIZE
-    end = start + PAGE_SIZE
-    page_groups = groups[start:end]
 
+def group_page_keyboard(page, select_prefix: str, nav_prefix: str):
+    _, prev_cursor, next_cursor = page_cursors(page)
     buttons = [
-        [InlineKeyboardButton(text=group.title, callback_data=f"group_settings_{group.id}")]
-        for group in page_groups
+        [InlineKeyboardButton(text=group.title, callback_data=f"{select_prefix}{group.id}")]
+        for group in page.groups
     ]
 
     nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"groups_page_{page - 1}"))
-    if end < len(groups):
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"groups_page_{page + 1}"))
+    if page.has_prev:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"{nav_prefix}{prev_cursor}"))
+    if page.has_next:
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"{nav_prefix}{next_cursor}"))
     if nav_buttons:
         buttons.append(nav_buttons)
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def groups_keyboard(page):
+    return group_page_keyboard(page, "group_settings_", "groups_page_")
+
+
 def group_panel_keyboard(group_id):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="👋️ Приветствие", callback_data=f"edit_welcome_{group_id}")],
         [InlineKeyboardButton(text="📊️ Лимит сообщений", callback_data=f"edit_limit_{group_id}")],
         [InlineKeyboardButton(text="💬 Превышение лимита", callback_data=f"edit_limit_message_{group_id}")],
         [InlineKeyboardButton(text="📤 Настройки рассылки", callback_data=f"mailing_menu_{group_id}")],
-        [InlineKeyboardButton(text="📅 Запланированные посты", callback_data=f"planned_posts_{group_id}")],
+        [InlineKeyboardButton(text="📅 Запланированные посты", callback_data=f"planned_posts_{group_id}_a")],
         [InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"delete_group_{group_id}")]
-    ])
\ No newline at end of file
+    ])
+
+
+def post_saved_keyboard(post_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🎯 Отправлять и в другие группы", callback_data=f"post_targets_{post_id}_a")]
+    ])
+
+
+def post_actions_keyboard(post_id):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=f"🗑 Удалить ID {post_id}", callback_data=f"delete_post_{post_id}")
+    ], [
+        InlineKeyboardButton(text="🎯 Группы", callback_data=f"post_targets_{post_id}_a"),
+        InlineKeyboardButton(text="📊 Доставка", callback_data=f"post_report_{post_id}")
+    ]])
+
+
+def post_targets_keyboard(post_id, page, selected):
+    current, prev_cursor, next_cursor = page_cursors(page)
+
+    buttons = [
+        [InlineKeyboardButton(
+            text=f"{'✅' if group.id in selected else '▫️'} {group.title}",
+            callback_data=f"toggle_target_{post_id}_{group.id}_{current}"
+        )]
+        for group in page.groups
+    ]
+
+    nav_buttons = []
+    if page.has_prev:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"post_targets_{post_id}_{prev_cursor}"))
+    if page.has_next:
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"post_targets_{post_id}_{next_cursor}"))
+    if nav_buttons:
+        buttons.append(nav_buttons)
+    buttons.append([InlineKeyboardButton(text="Готово", callback_data="targets_done")])
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def planned_posts_keyboard(group_id, page):
+    current, prev_cursor, next_cursor = post_page_cursors(page)
+
+    post_buttons = [
+        InlineKeyboardButton(text=f"👁 ID {post.id}", callback_data=f"post_preview_{post.id}")
+        for post in page.posts
+    ]
+    buttons = [post_buttons[i:i + 2] for i in range(0, len(post_buttons), 2)]
+
+    nav_buttons = []
+    if page.has_prev:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"planned_posts_{group_id}_{prev_cursor}"))
+    if page.has_next:
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"planned_posts_{group_id}_{next_cursor}"))
+    if nav_buttons:
+        buttons.append(nav_buttons)
+    buttons.append([InlineKeyboardButton(text="👁 Показать все на странице", callback_data=f"planned_show_{group_id}_{current}")])
+    buttons.append([InlineKeyboardButton(text="↩️ К настройкам группы", callback_data=f"group_settings_{group_id}")])
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -2,17 +2,37 @@
 import asyncio
 import logging
 import os
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 from db.session import engine, AsyncSession
 from db.models import Base, Admin
+from db.schema import upgrade_schema
 from sqlalchemy import select
 from bot.handlers import group_events, forwarding, admin_panel, limits
-from bot.scheduler import start_scheduler
+from bot.scheduler import start_scheduler, scheduler, scheduler_stats
 from aiogram import Bot, Dispatcher
 from aiogram.enums.parse_mode import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from bot.scheduler import restore_scheduled_tasks
+from bot.delayed_actions import delayed_actions
+from bot.quota import quota_store
+from bot.group_cache import group_cache
+from bot.admin_registry import admin_registry
+from bot.timer_wheel import timer_wheel
+from bot.deletion_batcher import deletion_batcher
+from bot.rate_limiter import rate_governor
+from bot.bulk_restrict import resume_restrict_jobs
+from bot.webhook import run_webhook
+from bot.fsm_storage import fsm_storage
+from bot.middlewares.recorder import UpdateRecorder, UPDATE_LOG
+from bot.workers import run_supervisor, BOT_WORKERS
+from bot.metrics import metrics, METRICS_PORT
+from bot.middlewares.metrics import UpdateMetrics, HandlerMetrics, ApiMetrics
+from bot.middlewares.query_budget import QueryAccounting, QueryTag
+from bot.middlewares.db_session import DbSessionMiddleware
+from bot.middlewares.album import AlbumMiddleware
+from bot import bulk_restrict
+from bot.member_cache import member_cache
+from bot.send_plan import send_plans
+from bot.cache_bus import cache_bus
 from aiogram.client.session.aiohttp import AiohttpSession
 import aiohttp
 
@@ -22,15 +42,86 @@ logging.basicConfig(level=logging.INFO)
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 RAW_ADMIN_IDS = os.getenv("ADMIN_IDS", "").split()
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling / webhook
 
-dp = Dispatcher(storage=MemoryStorage())
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+class App:
+    """
+    Bot и Dispatcher одного процесса со всеми middleware и роутерами. Собирается
+    build_app(): импорт модуля ничего не создаёт — воркеры (spawn) и бенчмарки
+    импортируют его, не получая второй Bot, второй журнал апдейтов и двойные метрики.
+    """
 
+    def __init__(self, bot: Bot, dp: Dispatcher, update_recorder=None):
+        self.bot = bot
+        self.dp = dp
+        self.update_recorder = update_recorder
 
-async def on_startup():
+
+def build_app(update_log: str = UPDATE_LOG, with_metrics: bool = bool(METRICS_PORT)) -> App:
+    # Состояния диалогов админки — в БД: переживают рестарт и общие для всех воркеров
+    dp = Dispatcher(storage=fsm_storage)
+    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    # Все исходящие запросы идут через общий ограничитель скорости
+    bot.session.middleware(rate_governor)
+
+    # Журнал входящих апдейтов для замеров (bot/bench/replay.py)
+    update_recorder = UpdateRecorder(update_log) if update_log else None
+    if update_recorder:
+        dp.update.outer_middleware(update_recorder)
+
+    # Учёт SQL-запросов на апдейт и бюджет QUERY_BUDGET (db/query_stats.py)
+    dp.update.outer_middleware(QueryAccounting())
+    query_tag = QueryTag()
+    # Одна сессия БД на апдейт для хендлеров с параметром session
+    db_session = DbSessionMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(query_tag)
+            observer.middleware(db_session)
+    # Альбомы для хендлеров с флагом album — одним вызовом (bot/middlewares/album.py).
+    # Регистрируется до HandlerMetrics: ожидание частей альбома во время хендлера не попадает
+    album_collector = AlbumMiddleware()
+    dp.message.middleware(album_collector)
+
+    # Метрики Prometheus (bot/metrics.py): без METRICS_PORT ничего не подключается
+    if with_metrics:
+        dp.update.outer_middleware(UpdateMetrics())
+        handler_metrics = HandlerMetrics()
+        for name, observer in dp.observers.items():
+            if name not in ("update", "error"):
+                observer.middleware(handler_metrics)
+        # После rate_governor — внутри него, на каждую попытку
+        bot.session.middleware(ApiMetrics())
+        metrics.instrument_engine(engine)
+        metrics.instrument_scheduler(scheduler)
+        metrics.watch("rate_limiter", rate_governor.stats)
+        metrics.watch("deletion_batcher", deletion_batcher.stats)
+        metrics.watch("timer_wheel", timer_wheel.stats)
+        metrics.watch("delayed_actions", delayed_actions.stats)
+        metrics.watch("restrict_jobs", bulk_restrict.stats)
+        metrics.watch("quota_store", quota_store.stats)
+        metrics.watch("member_cache", member_cache.stats)
+        metrics.watch("send_plans", send_plans.stats)
+        metrics.watch("fsm", fsm_storage.stats)
+        metrics.watch("cache_bus", cache_bus.stats)
+        metrics.watch("albums", album_collector.stats)
+        metrics.watch("scheduler", scheduler_stats)
+
+    # 3. Регистрация роутеров
+    dp.include_routers(
+        admin_panel.router,
+        group_events.router,
+        limits.router,
+        forwarding.router,
+    )
+    return App(bot, dp, update_recorder)
+
+
+async def prepare_database():
     # 1. Создание таблиц
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await upgrade_schema(conn)
 
     # 2. Добавление админов в БД
     async with AsyncSession() as session:
@@ -46,22 +137,71 @@ async def on_startup():
                 session.add(Admin(id=admin_id_int, username=""))
         await session.commit()
 
-    # 3. Регистрация роутеров
-    dp.include_routers(
-        admin_panel.router,
-        group_events.router,
-        limits.router,
-        forwarding.router,
-    )
 
+async def on_startup(app: App, run_scheduler: bool = True, metrics_port: int = METRICS_PORT):
+    # Настройки групп держим в памяти: по ним же отсекаются чужие чаты
+    await group_cache.load()
+    # Админов тоже (в т.ч. только что добавленных из ADMIN_IDS в prepare_database)
+    await admin_registry.load()
+
+    bot = app.bot
     # 4. Планировщик
-    await start_scheduler(bot)
-    await restore_scheduled_tasks(bot)
+    deletion_batcher.start(bot)
+    timer_wheel.start(bot)
+    # В режиме воркеров планировщик и очереди ведёт только один процесс
+    if run_scheduler:
+        await start_scheduler(bot)
+        # Очередь отложенных удалений/откреплений, в т.ч. просроченных за время простоя
+        delayed_actions.start(bot)
+        # Незавершённые массовые изменения прав продолжаем с чекпоинта
+        await resume_restrict_jobs(bot)
+
+    # 5. Фоновая запись счётчиков лимитов
+    quota_store.start()
+    # Чистка брошенных диалогов FSM
+    fsm_storage.start()
+
+    if metrics_port:
+        await metrics.start(metrics_port)
+
+
+async def on_shutdown(app: App):
+    timer_wheel.stop()
+    delayed_actions.stop()
+    await deletion_batcher.stop()
+    # Дописываем в БД накопленные счётчики сообщений
+    await quota_store.stop()
+    await fsm_storage.close()
+    await metrics.stop()
+    if app.update_recorder:
+        app.update_recorder.close()
 
 
 async def main():
-    await on_startup()
-    await dp.start_polling(bot)
+    await prepare_database()
+
+    if BOT_WORKERS > 1:
+        # Супервизор только принимает апдейты и раздаёт их воркерам: журнал и метрики — у воркеров
+        app = build_app(update_log="", with_metrics=False)
+        await run_supervisor(app.bot, app.dp.resolve_used_update_types(), BOT_MODE)
+        return
+
+    app = build_app()
+    await on_startup(app)
+
+    async def shutdown():
+        await on_shutdown(app)
+
+    app.dp.shutdown.register(shutdown)
+
+    # Подписываемся только на те типы апдейтов, которые есть в роутерах
+    allowed_updates = app.dp.resolve_used_update_types()
+    if BOT_MODE == "webhook":
+        await run_webhook(app.dp, app.bot, allowed_updates)
+    else:
+        # Вебхук мог остаться от запуска в webhook-режиме — с ним getUpdates не работает
+        await app.bot.delete_webhook()
+        await app.dp.start_polling(app.bot, allowed_updates=allowed_updates)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+# bot/member_cache.py
+import os
+import time
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.types import ChatMemberUpdated
+
+MEMBER_CACHE_TTL = int(os.getenv("MEMBER_CACHE_TTL", "600"))  # секунды
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "100000"))
+
+
+class MemberStatusCache:
+    """LRU-кэш статусов участников (chat_id, user_id) -> status с TTL."""
+
+    def __init__(self, ttl: float = MEMBER_CACHE_TTL, max_size: int = MEMBER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[tuple[int, int], tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, chat_id: int, user_id: int):
+        key = (chat_id, user_id)
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        status, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return status
+
+    def peek(self, chat_id: int, user_id: int):
+        """Статус без побочных эффектов: не трогает счётчики попаданий и порядок LRU."""
+        item = self._items.get((chat_id, user_id))
+        if item is None or item[1] < time.monotonic():
+            return None
+        return item[0]
+
+    def set(self, chat_id: int, user_id: int, status: str):
+        key = (chat_id, user_id)
+        status = getattr(status, "value", status)  # ChatMemberStatus -> str
+        self._items[key] = (status, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def forget(self, chat_id: int, user_id: int):
+        self._items.pop((chat_id, user_id), None)
+
+    def update_from_event(self, event: ChatMemberUpdated):
+        member = event.new_chat_member
+        self.set(event.chat.id, member.user.id, member.status)
+
+    async def get_status(self, bot: Bot, chat_id: int, user_id: int) -> str:
+        status = self.get(chat_id, user_id)
+        if status is None:
+            member = await bot.get_chat_member(chat_id, user_id)
+            status = getattr(member.status, "value", member.status)
+            self.set(chat_id, user_id, status)
+        return status
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+member_cache = MemberStatusCache()
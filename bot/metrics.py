@@ -0,0 +1,221 @@
+# bot/metrics.py
+import os
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
+from sqlalchemy import event
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 — метрики не собираются и сервер не поднимается
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PATH = "/metrics"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+LATENESS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300)
+
+# Всё прочее (SAVEPOINT, SET, ...) — в OTHER, чтобы не плодить ряды
+DB_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    __slots__ = ("name", "help", "labels", "_series")
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series: dict[tuple, float] = {}
+
+    def inc(self, *values, amount: float = 1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, total in self._series.items():
+            lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами. observe — бинарный поиск и два сложения,
+    накопительные суммы по корзинам считаются только при выдаче.
+    """
+
+    __slots__ = ("name", "help", "labels", "buckets", "_series")
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # значения меток -> [счётчики по корзинам (+Inf последней)..., сумма]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *values):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """
+    Реестр метрик в формате Prometheus. Счётчики и гистограммы обновляются на горячем
+    пути (middleware, события движка БД и планировщика); размеры очередей и кэшей
+    не копятся, а снимаются с их stats() в момент запроса /metrics.
+    """
+
+    def __init__(self):
+        self.updates = Counter("bot_updates_total", "Входящие апдейты по типу", ("type",))
+        self.updates_in_flight = 0
+        self.update_seconds = Histogram("bot_update_seconds", "Обработка апдейта целиком", ("type",))
+        self.handler_seconds = Histogram("bot_handler_seconds", "Время работы хендлера", ("handler",))
+        self.handler_errors = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("handler",))
+
+        self.db_queries = Counter("bot_db_queries_total", "SQL-запросы по типу", ("op",))
+        self.db_seconds = Histogram("bot_db_query_seconds", "Время SQL-запроса", ("op",), DB_BUCKETS)
+        self.db_errors = Counter("bot_db_errors_total", "Ошибки SQL-запросов", ("op",))
+
+        self.api_requests = Counter("bot_api_requests_total", "Запросы к Bot API (каждая попытка)", ("method",))
+        self.api_seconds = Histogram("bot_api_seconds", "Время ответа Bot API", ("method",))
+        self.api_errors = Counter("bot_api_errors_total", "Ошибки Bot API, кроме 429", ("method",))
+        self.api_retry_after = Counter("bot_api_retry_after_total", "Ответы 429 Too Many Requests", ("method",))
+
+        self.job_runs = Counter("bot_scheduler_runs_total", "Срабатывания заданий планировщика", ("kind", "status"))
+        self.job_lateness = Histogram(
+            "bot_scheduler_lateness_seconds", "Опоздание запуска задания", ("kind",), LATENESS_BUCKETS
+        )
+
+        self._sources: dict[str, callable] = {}
+        self._runner = None
+
+    # --- источники снимков ---
+
+    def watch(self, component: str, stats):
+        """stats() -> dict: числовые значения выдаются как bot_<component>_<ключ>."""
+        self._sources[component] = stats
+
+    def render(self) -> str:
+        lines = []
+        for metric in (
+            self.updates, self.update_seconds, self.handler_seconds, self.handler_errors,
+            self.db_queries, self.db_seconds, self.db_errors,
+            self.api_requests, self.api_seconds, self.api_errors, self.api_retry_after,
+            self.job_runs, self.job_lateness,
+        ):
+            lines.extend(metric.render())
+
+        lines.append("# TYPE bot_updates_in_flight gauge")
+        lines.append(f"bot_updates_in_flight {self.updates_in_flight}")
+        for component, stats in self._sources.items():
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"[!] Не удалось снять метрики {component}: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"bot_{component}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    # --- БД ---
+
+    def instrument_engine(self, engine):
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before_query)
+        event.listen(sync_engine, "after_cursor_execute", self._after_query)
+        event.listen(sync_engine, "handle_error", self._query_error)
+
+    @staticmethod
+    def _operation(statement: str) -> str:
+        op = statement.lstrip()[:8].split(None, 1)
+        op = op[0].upper() if op else ""
+        return op if op in DB_OPERATIONS else "OTHER"
+
+    def _before_query(self, conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    def _after_query(self, conn, cursor, statement, parameters, context, executemany):
+        op = self._operation(statement)
+        self.db_queries.inc(op)
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            self.db_seconds.observe(time.perf_counter() - started, op)
+
+    def _query_error(self, context):
+        self.db_errors.inc(self._operation(context.statement or ""))
+
+    # --- планировщик ---
+
+    def instrument_scheduler(self, scheduler):
+        scheduler.add_listener(self._job_submitted, EVENT_JOB_SUBMITTED)
+        scheduler.add_listener(self._job_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+    @staticmethod
+    def _job_kind(job_id: str) -> str:
+        # interval_12 / datetime_7 / refill_horizon
+        return job_id.split("_", 1)[0]
+
+    def _job_submitted(self, event):
+        now = time.time()
+        kind = self._job_kind(event.job_id)
+        for run_time in event.scheduled_run_times:
+            self.job_lateness.observe(max(0.0, now - run_time.timestamp()), kind)
+
+    def _job_finished(self, event):
+        if event.code == EVENT_JOB_MISSED:
+            status = "missed"
+        else:
+            status = "error" if event.exception else "ok"
+        self.job_runs.inc(self._job_kind(event.job_id), status)
+
+    # --- HTTP ---
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Prometheus-Format": "0.0.4"})
+
+    async def start(self, port: int = METRICS_PORT, host: str = METRICS_HOST):
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get(METRICS_PATH, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        print(f"Метрики: http://{host}:{port}{METRICS_PATH}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics = Metrics()
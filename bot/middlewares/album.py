@@ -0,0 +1,85 @@
+# bot/middlewares/album.py
+import asyncio
+import os
+from operator import itemgetter
+from typing import NamedTuple, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+
+ALBUM_LATENCY = float(os.getenv("ALBUM_LATENCY", "0.5"))  # сек. тишины, после которых альбом считается полным
+
+ALBUM_MEDIA = ("photo", "video", "document", "audio", "animation", "voice", "sticker")
+
+
+class AlbumItem(NamedTuple):
+    type: Optional[str]
+    file_id: Optional[str]
+    caption: str
+
+
+def album_item(message: Message) -> AlbumItem:
+    for kind in ALBUM_MEDIA:
+        media = getattr(message, kind)
+        if media:
+            file_id = media[-1].file_id if kind == "photo" else media.file_id
+            return AlbumItem(kind, file_id, message.caption or message.html_text or "")
+    return AlbumItem(None, None, "")
+
+
+class _PendingAlbum:
+    __slots__ = ("parts", "last_at")
+
+    def __init__(self, message: Message, now: float):
+        self.parts = [(message.message_id, album_item(message))]
+        self.last_at = now
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """
+    Inner-middleware для хендлеров с флагом album (@router.message(..., flags={"album": True})).
+    Части альбома (общий media_group_id) копятся в памяти процесса; хендлер вызывается
+    один раз — на первой пришедшей части, когда ALBUM_LATENCY секунд не было новых,
+    и получает album: list[AlbumItem] в порядке сообщений. Остальные части хендлер не видят.
+    Все апдейты чата попадают в один процесс (bot/workers.py), поэтому общий буфер не нужен.
+    """
+
+    def __init__(self, latency: float = ALBUM_LATENCY):
+        self.latency = latency
+        self._pending: dict[tuple[int, str], _PendingAlbum] = {}
+        self.albums = 0
+        self.parts = 0
+
+    async def __call__(self, handler, event, data: dict):
+        if not getattr(event, "media_group_id", None) or not get_flag(data, "album"):
+            return await handler(event, data)
+
+        loop = asyncio.get_running_loop()
+        key = (event.chat.id, event.media_group_id)
+        self.parts += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.parts.append((event.message_id, album_item(event)))
+            pending.last_at = loop.time()
+            return None
+
+        pending = self._pending[key] = _PendingAlbum(event, loop.time())
+        try:
+            # Ждём, пока части перестанут приходить: каждая новая отодвигает срок
+            while (wait := pending.last_at + self.latency - loop.time()) > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._pending.pop(key, None)
+
+        self.albums += 1
+        pending.parts.sort(key=itemgetter(0))
+        data["album"] = [item for _, item in pending.parts]
+        return await handler(event, data)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "albums": self.albums,
+            "parts": self.parts,
+        }
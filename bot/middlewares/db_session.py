@@ -0,0 +1,60 @@
+# bot/middlewares/db_session.py
+from aiogram import BaseMiddleware
+
+from db.session import AsyncSession
+
+
+class LazySession:
+    """
+    Сессия БД одного апдейта. Настоящая AsyncSession создаётся при первом обращении
+    к любому её атрибуту (session.get, session.execute, session.add...), соединение
+    из пула SQLAlchemy берёт ещё позже — на первом запросе.
+    """
+
+    __slots__ = ("_session",)
+
+    def __init__(self):
+        self._session = None
+
+    def __getattr__(self, name):
+        # Сюда попадают только атрибуты, которых нет у самого прокси
+        if self._session is None:
+            self._session = AsyncSession()
+        return getattr(self._session, name)
+
+
+async def _finish(session: LazySession, commit: bool):
+    real = session._session
+    if real is None:
+        return
+    try:
+        if real.in_transaction():
+            if commit:
+                await real.commit()
+            else:
+                await real.rollback()
+    finally:
+        await real.close()
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Inner-middleware: хендлерам с параметром session передаёт одну сессию на апдейт.
+    Хендлер может коммитить сам (например, перед публикацией в cache_bus); что осталось
+    незакоммиченным, фиксируется после хендлера, при исключении — откатывается.
+    Апдейты, не трогавшие БД, сессию не создают.
+    """
+
+    async def __call__(self, handler, event, data: dict):
+        handler_object = data.get("handler")
+        if handler_object is None or "session" not in handler_object.params:
+            return await handler(event, data)
+
+        session = data["session"] = LazySession()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            await _finish(session, commit=False)
+            raise
+        await _finish(session, commit=True)
+        return result
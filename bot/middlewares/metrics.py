@@ -0,0 +1,78 @@
+# bot/middlewares/metrics.py
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from bot.metrics import metrics
+
+_handler_names = {}
+
+
+def handler_name(data: dict) -> str:
+    """Имя выбранного хендлера (модуль.функция) для inner-middleware."""
+    handler_object = data.get("handler")
+    if handler_object is None:
+        return "unknown"
+    callback = handler_object.callback
+    name = _handler_names.get(callback)
+    if name is None:
+        module = getattr(callback, "__module__", "") or ""
+        name = _handler_names[callback] = f"{module.rsplit('.', 1)[-1]}.{getattr(callback, '__name__', 'handler')}"
+    return name
+
+
+class UpdateMetrics(BaseMiddleware):
+    """Outer-middleware на dp.update: апдейты по типу, время обработки, число апдейтов в работе."""
+
+    async def __call__(self, handler, event, data: dict):
+        update_type = event.event_type
+        metrics.updates.inc(update_type)
+        metrics.updates_in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.updates_in_flight -= 1
+            metrics.update_seconds.observe(time.perf_counter() - started, update_type)
+
+
+class HandlerMetrics(BaseMiddleware):
+    """
+    Inner-middleware: вызывается уже после фильтров, когда хендлер выбран,
+    поэтому время пишется по имени хендлера (модуль.функция).
+    """
+
+    async def __call__(self, handler, event, data: dict):
+        name = handler_name(data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(name)
+            raise
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - started, name)
+
+
+class ApiMetrics(BaseRequestMiddleware):
+    """
+    Метрики запросов к Bot API. Регистрируется после rate_governor, то есть внутри него:
+    видит каждую попытку (в т.ч. 429), а ожидание в ведре в задержку не попадает.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        metrics.api_requests.inc(name)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            metrics.api_retry_after.inc(name)
+            raise
+        except Exception:
+            metrics.api_errors.inc(name)
+            raise
+        finally:
+            metrics.api_seconds.observe(time.perf_counter() - started, name)
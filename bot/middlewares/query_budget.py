@@ -0,0 +1,27 @@
+# bot/middlewares/query_budget.py
+from aiogram import BaseMiddleware
+
+from bot.middlewares.metrics import handler_name
+from db import query_stats
+
+
+class QueryAccounting(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: считает SQL-запросы и время в БД на апдейт
+    (db/query_stats.py) и проверяет бюджет QUERY_BUDGET после обработки.
+    """
+
+    async def __call__(self, handler, event, data: dict):
+        token = query_stats.begin(event.update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            query_stats.finish(token)
+
+
+class QueryTag(BaseMiddleware):
+    """Inner-middleware: помечает запросы апдейта именем выбранного хендлера."""
+
+    async def __call__(self, handler, event, data: dict):
+        query_stats.tag(handler_name(data))
+        return await handler(event, data)
@@ -0,0 +1,106 @@
+# bot/middlewares/recorder.py
+import gzip
+import hashlib
+import json
+import os
+import random
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+UPDATE_LOG = os.getenv("UPDATE_LOG", "")  # путь к журналу апдейтов (.jsonl или .jsonl.gz); пусто — не пишем
+UPDATE_LOG_SAMPLE = float(os.getenv("UPDATE_LOG_SAMPLE", "1"))  # доля записываемых апдейтов
+UPDATE_LOG_SALT = os.getenv("UPDATE_LOG_SALT", "") or os.urandom(16).hex()
+FLUSH_EVERY = 100
+
+DROP_FIELDS = {
+    "last_name", "username", "phone_number", "bio", "email", "vcard",
+    # Имена из пересылок от скрытых пользователей и подписи авторов
+    "forward_sender_name", "sender_user_name", "forward_signature", "author_signature",
+}
+MASK_FIELDS = {"text", "caption"}
+
+
+def _pseudo_id(value: int) -> int:
+    # Стабильная подмена id пользователя в пределах одного журнала (одна соль)
+    digest = hashlib.blake2b(f"{UPDATE_LOG_SALT}:{value}".encode(), digest_size=5).digest()
+    return int.from_bytes(digest, "big") + 1
+
+
+def _mask(text: str) -> str:
+    # Длину сохраняем (от неё зависят entities), команды оставляем — по ним идёт маршрутизация
+    if text.startswith("/"):
+        command, _, rest = text.partition(" ")
+        return command + (" " + "x" * len(rest) if rest else "")
+    return "x" * len(text)
+
+
+def scrub(value):
+    """Убирает из апдейта персональные данные: имена, юзернеймы, телефоны, тексты, id людей."""
+    if isinstance(value, list):
+        return [scrub(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    result = {}
+    for key, item in value.items():
+        if key in DROP_FIELDS:
+            continue
+        if key in MASK_FIELDS and isinstance(item, str):
+            result[key] = _mask(item)
+        elif key == "first_name":
+            result[key] = "user"
+        else:
+            result[key] = scrub(item)
+
+    # Пользователь или личный чат: id положительный — подменяем; группы (id < 0) оставляем
+    if isinstance(result.get("id"), int) and result["id"] > 0 and ("is_bot" in result or result.get("type") == "private"):
+        result["id"] = _pseudo_id(result["id"])
+    if isinstance(result.get("user_id"), int):
+        result["user_id"] = _pseudo_id(result["user_id"])
+    return result
+
+
+def worker_log_path(path: str, worker_id: int) -> str:
+    """updates.jsonl.gz -> updates.w1.jsonl.gz: у каждого воркера свой файл, строки не перемешиваются."""
+    for suffix in (".jsonl.gz", ".jsonl", ".gz"):
+        if path.endswith(suffix):
+            return f"{path[:-len(suffix)]}.w{worker_id}{suffix}"
+    return f"{path}.w{worker_id}"
+
+
+class UpdateRecorder(BaseMiddleware):
+    """
+    Пишет входящие апдейты в журнал JSONL (по строке на апдейт, .gz сжимается),
+    предварительно вычистив персональные данные. Журнал проигрывает bot/bench/replay.py.
+    """
+
+    def __init__(self, path: str = UPDATE_LOG, sample: float = UPDATE_LOG_SAMPLE):
+        self.path = path
+        self.sample = sample
+        opener = gzip.open if path.endswith(".gz") else open
+        self._file = opener(path, "at", encoding="utf-8")
+        self._unflushed = 0
+        self.recorded = 0
+
+    async def __call__(self, handler, event: Update, data: dict):
+        if self.sample >= 1 or random.random() < self.sample:
+            try:
+                self.write(event)
+            except Exception as e:
+                print(f"[!] Не удалось записать апдейт {event.update_id}: {e}")
+        return await handler(event, data)
+
+    def write(self, update: Update):
+        # exclude_defaults не годится: у ChatMember* и MessageOrigin* поля-дискриминаторы
+        # (status, type) имеют значения по умолчанию — без них переход left→member не восстановить
+        raw = scrub(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+        self._file.write(json.dumps(raw, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.recorded += 1
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self._file.flush()
+            self._unflushed = 0
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,247 @@
+# bot/quota.py
+import asyncio
+import os
+import time
+from array import array
+
+from sqlalchemy import update, bindparam, func
+
+from db.session import AsyncSession
+from db.limits import consume_quota, limits_table
+
+QUOTA_FLUSH_INTERVAL = float(os.getenv("QUOTA_FLUSH_INTERVAL", "5"))  # секунды
+QUOTA_STORE_SIZE = int(os.getenv("QUOTA_STORE_SIZE", "200000"))
+
+UNLIMITED = -1  # max_messages IS NULL
+NO_DELETE = 0   # delete_after_minutes IS NULL
+
+# executemany: одна пачка приращений за один запрос
+increment_used_stmt = update(limits_table).where(
+    limits_table.c.group_id == bindparam("g"),
+    limits_table.c.user_id == bindparam("u")
+).values(
+    used_messages=func.coalesce(limits_table.c.used_messages, 0) + bindparam("delta")
+)
+
+
+class QuotaStore:
+    """
+    Счётчики UnblockedUserLimit в памяти: (group_id, user_id) -> слот в массивах.
+    Проверка лимита не ходит в БД (кроме первого сообщения — один upsert),
+    приращения used_messages копятся в pending и пишутся в unblocked_limits
+    пачкой раз в QUOTA_FLUSH_INTERVAL и при остановке.
+    """
+
+    def __init__(self, max_size: int = QUOTA_STORE_SIZE):
+        self.max_size = max_size
+        self._slots: dict[tuple[int, int], int] = {}
+        self._keys: list = []
+        self._max = array("q")
+        self._used = array("q")
+        self._pending = array("q")
+        self._delete_after = array("l")
+        self._touched = array("l")
+        self._stale = bytearray()
+        self._free: list[int] = []
+        self._dirty: set[int] = set()
+        self._loading: dict[tuple[int, int], asyncio.Future] = {}
+        self._task = None
+        self.loads = 0
+        self.flushes = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    # --- проверка лимита ---
+
+    async def consume(self, group_id: int, user_id: int, username=None, base_limit=None):
+        """Возвращает (можно ли писать, delete_after_minutes | None) и засчитывает сообщение."""
+        key = (group_id, user_id)
+        slot = self._slots.get(key)
+        if slot is None or self._stale[slot]:
+            waiter = self._loading.get(key)
+            if waiter is None:
+                # Промах: сообщение засчитывается в БД тем же запросом, что и загрузка
+                return await self._load(key, username, base_limit)
+            slot = await asyncio.shield(waiter)
+
+        self._touched[slot] = int(time.monotonic())
+        delete_after = self._delete_after[slot] or None
+
+        max_messages = self._max[slot]
+        if max_messages == UNLIMITED:
+            return True, delete_after
+
+        if self._used[slot] >= max_messages:
+            return False, None
+
+        self._used[slot] += 1
+        self._pending[slot] += 1
+        self._dirty.add(slot)
+        return True, delete_after
+
+    async def _load(self, key, username, base_limit):
+        waiter = asyncio.get_running_loop().create_future()
+        self._loading[key] = waiter
+        try:
+            group_id, user_id = key
+            # Устаревший слот мог накопить приращения — пишем их до проверки лимита в БД.
+            # Забираем их из слота до await, чтобы flush() не записал ту же дельту ещё раз
+            old_slot = self._slots.get(key)
+            pending = self._pending[old_slot] if old_slot is not None else 0
+            if pending:
+                self._pending[old_slot] = 0
+                self._dirty.discard(old_slot)
+
+            try:
+                async with AsyncSession() as session:
+                    if pending:
+                        await session.execute(increment_used_stmt, [{"g": group_id, "u": user_id, "delta": pending}])
+                    allowed, max_messages, used, delete_after = await consume_quota(
+                        session, group_id, user_id, base_limit, username
+                    )
+                    await session.commit()
+            except BaseException:
+                # Не записалось — возвращаем приращения, их сбросит следующий flush
+                if pending:
+                    self._pending[old_slot] += pending
+                    self._dirty.add(old_slot)
+                raise
+
+            self.loads += 1
+            if allowed or max_messages is not None:
+                slot = self._store(key, max_messages, used, delete_after)
+            else:
+                # Лимит исчерпан — точные цифры не нужны, до инвалидации пользователь заблокирован
+                slot = self._store(key, 0, 0, None)
+            waiter.set_result(slot)
+            return allowed, (delete_after or None) if allowed else None
+        except BaseException as e:
+            waiter.set_exception(e)
+            waiter.exception()  # не даём asyncio ругаться на неполученное исключение
+            raise
+        finally:
+            del self._loading[key]
+
+    def _store(self, key, max_messages, used, delete_after) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._keys[slot] = key
+                self._pending[slot] = 0
+            else:
+                slot = len(self._keys)
+                self._keys.append(key)
+                self._max.append(0)
+                self._used.append(0)
+                self._pending.append(0)
+                self._delete_after.append(0)
+                self._touched.append(0)
+                self._stale.append(0)
+            self._slots[key] = slot
+
+        # В БД ещё нет несброшенных приращений — учитываем их поверх прочитанного
+        self._max[slot] = UNLIMITED if max_messages is None else max_messages
+        self._used[slot] = used + self._pending[slot]
+        self._delete_after[slot] = delete_after or NO_DELETE
+        self._touched[slot] = int(time.monotonic())
+        self._stale[slot] = 0
+        return slot
+
+    # --- инвалидация после изменений из админки ---
+
+    def invalidate(self, group_id: int, user_id: int):
+        slot = self._slots.get((group_id, user_id))
+        if slot is not None:
+            self._stale[slot] = 1
+
+    def invalidate_group(self, group_id: int):
+        for (g, _), slot in self._slots.items():
+            if g == group_id:
+                self._stale[slot] = 1
+
+    # --- write-behind ---
+
+    async def flush(self):
+        try:
+            return await self._flush_dirty()
+        finally:
+            # Размер держим на каждом такте: слоты без лимита, заблокированных и после
+            # первого сообщения не бывают грязными, и без этого словарь рос бы без предела
+            self._evict()
+
+    async def _flush_dirty(self):
+        if not self._dirty:
+            return 0
+
+        dirty, self._dirty = self._dirty, set()
+        params = []
+        flushed = []
+        for slot in dirty:
+            delta = self._pending[slot]
+            if not delta:
+                continue
+            group_id, user_id = self._keys[slot]
+            params.append({"g": group_id, "u": user_id, "delta": delta})
+            flushed.append((slot, delta))
+            self._pending[slot] = 0
+
+        if not params:
+            return 0
+
+        try:
+            async with AsyncSession() as session:
+                await session.execute(increment_used_stmt, params)
+                await session.commit()
+        except Exception as e:
+            # Возвращаем приращения, попробуем в следующий раз
+            for slot, delta in flushed:
+                self._pending[slot] += delta
+                self._dirty.add(slot)
+            print(f"[!] Ошибка сохранения счётчиков лимитов: {e}")
+            return 0
+
+        self.flushes += 1
+        return len(params)
+
+    def _evict(self):
+        overflow = len(self._slots) - self.max_size
+        if overflow <= 0:
+            return
+
+        clean = [
+            slot for slot in self._slots.values()
+            if not self._pending[slot] and slot not in self._dirty and self._keys[slot] not in self._loading
+        ]
+        clean.sort(key=self._touched.__getitem__)
+        for slot in clean[:overflow]:
+            del self._slots[self._keys[slot]]
+            self._keys[slot] = None
+            self._free.append(slot)
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def start(self, interval: float = QUOTA_FLUSH_INTERVAL):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._slots),
+            "dirty": len(self._dirty),
+            "loads": self.loads,
+            "flushes": self.flushes,
+        }
+
+
+quota_store = QuotaStore()
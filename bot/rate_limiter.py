@@ -0,0 +1,183 @@
+# bot/rate_limiter.py
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота, 1 в секунду в личный чат, 20 в минуту в группу
+RATE_LIMIT_GLOBAL = float(os.getenv("RATE_LIMIT_GLOBAL", "30"))          # запросов в секунду
+RATE_LIMIT_PRIVATE = float(os.getenv("RATE_LIMIT_PRIVATE", "1"))         # сообщений в секунду в личку
+RATE_LIMIT_GROUP = float(os.getenv("RATE_LIMIT_GROUP", "20")) / 60       # сообщений в секунду в группу
+RATE_LIMIT_GROUP_BURST = float(os.getenv("RATE_LIMIT_GROUP_BURST", "3"))
+MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+# Необязательные отправки (предупреждения о лимите) не ждут в очереди дольше — их пропускаем
+BEST_EFFORT_MAX_WAIT = float(os.getenv("RATE_LIMIT_BEST_EFFORT_WAIT", "10"))  # секунды
+BACKOFF_BASE = 0.5  # секунды, удваивается с каждой попыткой
+
+# Методы, которые Telegram считает сообщениями в чат (на них действуют лимиты чата)
+CHAT_LIMITED_PREFIXES = ("send", "copyMessage", "forwardMessage")
+# Их же нельзя повторять после сетевой ошибки или 5xx: сообщение могло уже уйти
+NON_IDEMPOTENT_PREFIXES = CHAT_LIMITED_PREFIXES
+
+_best_effort: ContextVar[bool] = ContextVar("rate_best_effort", default=False)
+
+
+class SendDropped(Exception):
+    """Необязательная отправка пропущена: очередь к чату длиннее BEST_EFFORT_MAX_WAIT."""
+
+
+@contextmanager
+def best_effort():
+    """Запросы внутри блока при длинной очереди не ждут, а падают с SendDropped."""
+    token = _best_effort.set(True)
+    try:
+        yield
+    finally:
+        _best_effort.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        # Берём токен в долг: возвращает, сколько секунд подождать перед запросом
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens += 1
+
+    def block_for(self, seconds: float):
+        # После 429 никто не должен проскочить раньше retry_after
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class RateGovernor(BaseRequestMiddleware):
+    """
+    Общий ограничитель исходящих запросов к Bot API: глобальное ведро на все
+    методы и ведро на каждый чат для отправки сообщений. Повторяет запрос после
+    TelegramRetryAfter и, кроме отправки сообщений, с экспоненциальной паузой после
+    сетевых ошибок. Необязательные отправки (best_effort) при длинной очереди пропускает.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(RATE_LIMIT_GLOBAL, RATE_LIMIT_GLOBAL)
+        self._chats: dict[int, TokenBucket] = {}
+        self.calls = 0
+        self.queued = 0
+        self.throttled = 0
+        self.retry_after = 0
+        self.retries = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def set_share(self, workers: int):
+        # В режиме воркеров лимит бота общий на все процессы — каждому достаётся доля
+        rate = RATE_LIMIT_GLOBAL / workers
+        self.global_bucket = TokenBucket(rate, max(1.0, rate))
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._prune()
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(RATE_LIMIT_PRIVATE, 1)
+            else:
+                bucket = TokenBucket(RATE_LIMIT_GROUP, RATE_LIMIT_GROUP_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self):
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.is_idle()]:
+            del self._chats[chat_id]
+
+    async def _acquire(self, chat_bucket):
+        wait = self.global_bucket.reserve()
+        if chat_bucket is not None:
+            wait = max(wait, chat_bucket.reserve())
+        if wait > BEST_EFFORT_MAX_WAIT and _best_effort.get():
+            # Возвращаем взятые в долг токены: пропущенный запрос не должен задерживать остальных
+            self.global_bucket.refund()
+            if chat_bucket is not None:
+                chat_bucket.refund()
+            self.dropped += 1
+            raise SendDropped(f"очередь {wait:.0f} с")
+        if wait > 0:
+            self.throttled += 1
+            self.queued += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.queued -= 1
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = None
+        if chat_id is not None and method.__api_method__.startswith(CHAT_LIMITED_PREFIXES):
+            chat_bucket = self._chat_bucket(chat_id)
+
+        attempt = 0
+        while True:
+            await self._acquire(chat_bucket)
+            self.calls += 1
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_after += 1
+                (chat_bucket or self.global_bucket).block_for(e.retry_after)
+                if attempt >= MAX_RETRIES:
+                    self.errors += 1
+                    raise
+                delay = 0.0  # паузу выдержит ведро при следующем _acquire
+            except (TelegramNetworkError, TelegramServerError):
+                if attempt >= MAX_RETRIES or method.__api_method__.startswith(NON_IDEMPOTENT_PREFIXES):
+                    # Повтор send* после ошибки, когда запрос мог дойти, даёт дубли сообщений
+                    self.errors += 1
+                    raise
+                delay = BACKOFF_BASE * 2 ** attempt
+
+            attempt += 1
+            self.retries += 1
+            if delay:
+                self.queued += 1
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    self.queued -= 1
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "queued": self.queued,
+            "throttled": self.throttled,
+            "retry_after": self.retry_after,
+            "retries": self.retries,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "chat_buckets": len(self._chats),
+        }
+
+
+rate_governor = RateGovernor()
@@ -3,14 +3,24 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.date import DateTrigger
 from db.session import AsyncSession
-from db.models import MessageSchedule, Group, ScheduledPost
-from sqlalchemy import select
+from db.models import MessageSchedule, Group, ScheduledPost, PostType, PostTarget
+from sqlalchemy import select, or_
 from aiogram import Bot
 import datetime
-import asyncio
+import os
+from typing import Optional
 
 scheduler = AsyncIOScheduler()
 
+# В памяти держим задания только на ближайший горизонт, остальные подтягиваем из БД
+SCHEDULER_HORIZON = int(os.getenv("SCHEDULER_HORIZON", "60"))  # минуты
+SCHEDULER_REFILL_INTERVAL = int(os.getenv("SCHEDULER_REFILL_INTERVAL", "300"))  # секунды, меньше горизонта
+SCHEDULER_CHUNK = int(os.getenv("SCHEDULER_CHUNK", "500"))
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "5"))  # групп одного поста одновременно
+
+_sending: set[int] = set()  # посты, которые сейчас отправляются
+_bot: Optional[Bot] = None  # бот процесса, в котором запущен планировщик
+
 
 async def send_group_message(bot: Bot, group_id: int, text: str):
     try:
@@ -23,135 +33,52 @@ from aiogram import Bot
 from db.models import ScheduledPost
 from sqlalchemy import delete, update
 
-import json
-from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+from bot.delayed_actions import add_action, ACTION_UNPIN
+from bot.cache_bus import cache_bus, POST_SCHEDULED, POST_UNSCHEDULED
+from bot.send_plan import send_plans
+from bot.bulk_restrict import run_bounded
 
 
 
-async def safe_unpin(bot, chat_id: int, message_id: int):
-    for attempt in range(3):
-        try:
-            await bot.unpin_chat_message(chat_id=chat_id, message_id=message_id)
-            break
-        except Exception as e:
-            if attempt < 2:
-                await asyncio.sleep(2)
-            else:
-                print(f"❌ Не удалось открепить сообщение {message_id} в {chat_id} после 3 попыток")
+async def send_scheduled_message(bot: Bot, post_id: int):
+    _sending.add(post_id)
+    try:
+        await _send_scheduled_message(bot, post_id)
+    finally:
+        _sending.discard(post_id)
 
 
-async def send_scheduled_message(bot: Bot, post_id: int):
+async def _send_scheduled_message(bot: Bot, post_id: int):
     async with AsyncSession() as session:
         post = await session.get(ScheduledPost, post_id)
         if not post:
             print("Post didn't found")
             return
 
+        targets = (await session.execute(
+            select(PostTarget).where(PostTarget.post_id == post_id).order_by(PostTarget.group_id)
+        )).scalars().all()
         try:
-            sent = None
-            if post.media_file_id:
-                try:
-                    media_items = json.loads(post.media_file_id)
-                except Exception:
-                    media_items = None
-
-                if isinstance(media_items, list) and len(media_items) > 1:
-                    # Формируем альбом
-                    input_media = []
-                    for i, item in enumerate(media_items):
-                        ct = item.get("type")
-                        fid = item.get("file_id")
-                        caption = post.content if i == 0 else None  # подпись только к первой
-                        if ct == "photo":
-                            input_media.append(InputMediaPhoto(media=fid, caption=caption))
-                        elif ct == "video":
-                            input_media.append(InputMediaVideo(media=fid, caption=caption))
-                        elif ct == "document":
-                            input_media.append(InputMediaDocument(media=fid, caption=caption))
-                        elif ct == "audio":
-                            input_media.append(InputMediaAudio(media=fid, caption=caption))
-                        else:
-                            print(f"[!] Unsupported type in album: {ct}")
-
-                    sent_messages = await bot.send_media_group(chat_id=post.group_id, media=input_media)
-                    sent = sent_messages[0]  # для пинов/удалений берем первое сообщение
-                else:
-                    # Старый режим — одиночное медиа или текст
-                    if isinstance(media_items, list) and len(media_items) == 1:
-                        ct = media_items[0]["type"]
-                        fid = media_items[0]["file_id"]
-                    else:
-                        # Совместимость со старым форматом "ct+++fid"
-                        if "+++" in post.media_file_id:
-                            ct, fid = post.media_file_id.split("+++")
-                        else:
-                            ct, fid = "text", None
-
-                    if ct == "text" or not fid:
-                        sent = await bot.send_message(chat_id=post.group_id, text=post.content or "")
-                    elif ct == "photo":
-                        sent = await bot.send_photo(chat_id=post.group_id, photo=fid, caption=post.content or "")
-                    elif ct == "video":
-                        sent = await bot.send_video(chat_id=post.group_id, video=fid, caption=post.content or "")
-                    elif ct == "document":
-                        sent = await bot.send_document(chat_id=post.group_id, document=fid, caption=post.content or "")
-                    elif ct == "audio":
-                        sent = await bot.send_audio(chat_id=post.group_id, audio=fid, caption=post.content or "")
-                    elif ct == "voice":
-                        sent = await bot.send_voice(chat_id=post.group_id, voice=fid)
-                    elif ct == "animation":
-                        sent = await bot.send_animation(chat_id=post.group_id, animation=fid,
-                                                        caption=post.content or "")
-                    elif ct == "sticker":
-                        sent = await bot.send_sticker(chat_id=post.group_id, sticker=fid)
-                    else:
-                        print(f"[!] Неизвестный content_type: {ct}")
-                        return
-            else:
-                # Просто текст
-                sent = await bot.send_message(chat_id=post.group_id, text=post.content or "")
-
+            # План собран при сохранении поста — на каждую группу только вызов Bot API
+            plan = send_plans.get(post)
+            results = await run_bounded(
+                targets, lambda target: deliver(bot, session, post, plan, target), FANOUT_CONCURRENCY
+            )
         except Exception as e:
+            results = []
             print(f"[!] Ошибка отправки поста {post_id}: {e}")
+        # Статусы доставки и отложенные действия по всем группам — одним коммитом
+        await session.commit()
+
+        delivered = sum(results)
+        if len(targets) > 1:
+            print(f"Пост {post_id}: доставлено в {delivered} из {len(targets)} групп")
+        if not delivered:
+            # Интервальная рассылка не должна остановиться из-за одной неудачи
+            if post.type == "interval":
+                await advance_interval(bot, session, post)
             return
 
-        message_id = sent.message_id
-
-        # Pin
-        if post.pin:
-            try:
-                await bot.pin_chat_message(chat_id=post.group_id, message_id=message_id, disable_notification=True)
-            except Exception as e:
-                print(f"[!] Ошибка закрепления: {e}")
-
-        # Unpin
-        if post.unpin_after_minutes:
-            scheduler.add_job(
-                safe_unpin,
-                DateTrigger(run_date=datetime.datetime.now() + datetime.timedelta(minutes=post.unpin_after_minutes)),
-                kwargs={"bot": bot, "chat_id": post.group_id, "message_id": message_id}
-            )
-
-        # Delete
-        if post.delete_type == "immediately":
-            scheduler.add_job(
-                bot.delete_message,
-                DateTrigger(run_date=datetime.datetime.now() + datetime.timedelta(seconds=1)),
-                kwargs={"chat_id": post.group_id, "message_id": message_id}
-            )
-        elif post.delete_type == "after" and post.delete_after_minutes:
-            scheduler.add_job(
-                bot.delete_message,
-                DateTrigger(run_date=datetime.datetime.now() + datetime.timedelta(minutes=post.delete_after_minutes)),
-                kwargs={"chat_id": post.group_id, "message_id": message_id}
-            )
-        elif post.delete_type == "after_unpin" and post.unpin_after_minutes:
-            scheduler.add_job(
-                bot.delete_message,
-                DateTrigger(run_date=datetime.datetime.now() + datetime.timedelta(minutes=post.unpin_after_minutes + 1)),
-                kwargs={"chat_id": post.group_id, "message_id": message_id}
-            )
-
         # Уменьшить счётчик, если интервальная
         if post.type == "interval":
             if post.repeat_count is not None and post.repeat_count > 0:
@@ -164,10 +91,11 @@ async def send_scheduled_message(bot: Bot, post_id: int):
                     #     await bot.send_message(chat_id=post.group_id, text=f"✅ Рассылка {post.id} завершена и удалена.")
                     # except:
                     #     pass
-                    job_id = f"interval_{post.id}"
-                    job = scheduler.get_job(job_id)
+                    job = scheduler.get_job(job_id(post.type, post.id))
                     if job:
-                        scheduler.remove_job(job_id)
+                        scheduler.remove_job(job.id)
+                    return
+            await advance_interval(bot, session, post)
 
         # Если по дате — удаляем после отправки
         elif post.type == "datetime":
@@ -177,69 +105,185 @@ async def send_scheduled_message(bot: Bot, post_id: int):
             #     await bot.send_message(chat_id=post.group_id, text=f"✅ Одноразовая рассылка {post.id} выполнена и удалена.")
             # except:
             #     pass
-            job_id = f"datetime_{post.id}"
-            job = scheduler.get_job(job_id)
+            job = scheduler.get_job(job_id(post.type, post.id))
             if job:
-                scheduler.remove_job(job_id)
+                scheduler.remove_job(job.id)
 
 
-async def load_schedules(bot: Bot):
+async def deliver(bot: Bot, session, post: ScheduledPost, plan, target: PostTarget) -> bool:
+    """Отправляет пост в одну группу и ставит ей открепление/удаление. Итог пишет в target."""
+    chat_id = target.group_id
+    now = datetime.datetime.now()
+    target.last_sent_at = now
+    try:
+        sent = await plan.send(bot, chat_id)
+    except Exception as e:
+        print(f"[!] Ошибка отправки поста {post.id} в группу {chat_id}: {e}")
+        target.last_status = "failed"
+        target.last_error = str(e)[:500]
+        target.failed_count = (target.failed_count or 0) + 1
+        return False
+
+    message_id = sent.message_id
+    target.last_status = "ok"
+    target.last_error = None
+    target.last_message_id = message_id
+    target.sent_count = (target.sent_count or 0) + 1
+
+    # Pin
+    if post.pin:
+        try:
+            await bot.pin_chat_message(chat_id=chat_id, message_id=message_id, disable_notification=True)
+        except Exception as e:
+            print(f"[!] Ошибка закрепления: {e}")
+
+    # Открепление и удаление — через очередь отложенных действий (переживает рестарт)
+    if post.unpin_after_minutes:
+        add_action(session, chat_id, message_id,
+                   now + datetime.timedelta(minutes=post.unpin_after_minutes), ACTION_UNPIN)
+
+    if post.delete_type == "immediately":
+        add_action(session, chat_id, message_id, now + datetime.timedelta(seconds=1))
+    elif post.delete_type == "after" and post.delete_after_minutes:
+        add_action(session, chat_id, message_id,
+                   now + datetime.timedelta(minutes=post.delete_after_minutes))
+    elif post.delete_type == "after_unpin" and post.unpin_after_minutes:
+        add_action(session, chat_id, message_id,
+                   now + datetime.timedelta(minutes=post.unpin_after_minutes + 1))
+    return True
+
+
+def job_id(post_type, post_id: int) -> str:
+    return f"{getattr(post_type, 'value', post_type)}_{post_id}"
+
+
+def _horizon_end() -> datetime.datetime:
+    return datetime.datetime.now() + datetime.timedelta(minutes=SCHEDULER_HORIZON)
+
+
+def _materialize(bot: Bot, post_id: int, post_type, run_at: datetime.datetime):
+    # Просроченное (например, интервальная рассылка после простоя) отправляем сразу
+    scheduler.add_job(
+        send_scheduled_message,
+        DateTrigger(run_date=max(run_at, datetime.datetime.now())),
+        args=[bot, post_id],
+        id=job_id(post_type, post_id),
+        replace_existing=True,
+        misfire_grace_time=None
+    )
+
+
+async def advance_interval(bot: Bot, session, post: ScheduledPost):
+    post.next_run_at = datetime.datetime.now() + datetime.timedelta(minutes=post.interval_minutes)
+    await session.commit()
+    if post.next_run_at <= _horizon_end():
+        _materialize(bot, post.id, post.type, post.next_run_at)
+
+
+async def refill_horizon(bot: Bot) -> int:
+    """Ставит в APScheduler посты, которые наступят в пределах горизонта и ещё не стоят."""
+    now = datetime.datetime.now()
+    stmt = (
+        select(ScheduledPost.id, ScheduledPost.type, ScheduledPost.next_run_at)
+        .where(
+            ScheduledPost.next_run_at <= _horizon_end(),
+            # Пропущенные разовые посты не отправляем, как и раньше
+            or_(ScheduledPost.type == PostType.interval, ScheduledPost.next_run_at > now)
+        )
+        .order_by(ScheduledPost.next_run_at)
+        .execution_options(yield_per=SCHEDULER_CHUNK)
+    )
+
+    added = 0
     async with AsyncSession() as session:
-        stmt = select(ScheduledPost)
-        result = await session.execute(stmt)
-        posts = result.scalars().all()
+        result = await session.stream(stmt)
+        async for rows in result.partitions():
+            for post_id, post_type, run_at in rows:
+                if post_id in _sending or scheduler.get_job(job_id(post_type, post_id)):
+                    continue
+                _materialize(bot, post_id, post_type, run_at)
+                added += 1
+    return added
+
 
-        for post in posts:
-            await add_post_to_schedule(bot, post)
+async def load_schedules(bot: Bot):
+    await refill_horizon(bot)
 
 
 async def start_scheduler(bot: Bot):
+    global _bot
+    _bot = bot
     await load_schedules(bot)
+    scheduler.add_job(
+        refill_horizon,
+        IntervalTrigger(seconds=SCHEDULER_REFILL_INTERVAL),
+        args=[bot],
+        id="refill_horizon",
+        replace_existing=True
+    )
     scheduler.start()
 
+
+def scheduler_stats() -> dict:
+    return {
+        "jobs": len(scheduler.get_jobs()) if scheduler.running else 0,
+        "sending": len(_sending),
+    }
+
+
 async def add_post_to_schedule(bot: Bot, post: ScheduledPost):
-    from bot.scheduler import send_scheduled_message
-    if post.type == "interval":
-        if post.repeat_count == 0 or post.repeat_count > 0:
-            scheduler.add_job(
-                send_scheduled_message,
-                IntervalTrigger(minutes=post.interval_minutes),
-                args=[bot, post.id],
-                id=f"interval_{post.id}",
-                replace_existing=True
-            )
-    elif post.type == "datetime":
-        if post.scheduled_datetime and post.scheduled_datetime > datetime.datetime.now():
-            scheduler.add_job(
-                send_scheduled_message,
-                DateTrigger(run_date=post.scheduled_datetime),
-                args=[bot, post.id],
-                id=f"datetime_{post.id}",
-                replace_existing=True
-            )
+    # Время следующей отправки хранится в БД; коммит делает вызывающий
+    if post.next_run_at is None:
+        if post.type == "interval":
+            post.next_run_at = datetime.datetime.now() + datetime.timedelta(minutes=post.interval_minutes)
+        elif post.type == "datetime":
+            post.next_run_at = post.scheduled_datetime
 
+    # Задание заводит только процесс с запущенным планировщиком; остальные
+    # после коммита сообщают ему о посте через announce_post
+    if scheduler.running:
+        _schedule(bot, post.id, post.type, post.next_run_at)
 
-async def restore_scheduled_tasks(bot: Bot):
-    from bot.scheduler import scheduler
-    from db.models import ScheduledTask
-    import datetime
 
+def _schedule(bot: Bot, post_id: int, post_type, run_at):
+    if run_at is None:
+        return
+    if post_type == "datetime" and run_at <= datetime.datetime.now():
+        return
+    if run_at <= _horizon_end():
+        _materialize(bot, post_id, post_type, run_at)
+
+
+def announce_post(post_id: int):
+    """
+    Вызывается после коммита нового поста. В режиме воркеров планировщик живёт в одном
+    из них — без этого пост ждал бы refill_horizon, а разовый мог бы его не дождаться.
+    """
+    if not scheduler.running:
+        cache_bus.publish(POST_SCHEDULED, post_id)
+
+
+async def schedule_post(post_id: int):
+    # POST_SCHEDULED из другого воркера: время берём из БД, пост уже закоммичен
+    if not scheduler.running or post_id in _sending:
+        return
     async with AsyncSession() as session:
-        stmt = select(ScheduledTask)
-        result = await session.execute(stmt)
-        tasks = result.scalars().all()
-
-        for task in tasks:
-            if task.run_at > datetime.datetime.now():
-                # Восстанавливаем задачу в планировщике
-                scheduler.add_job(
-                    bot.delete_message,
-                    trigger=DateTrigger(run_date=task.run_at),
-                    kwargs={"chat_id": task.chat_id, "message_id": task.message_id},
-                    id=f"autodel_{task.chat_id}_{task.message_id}",
-                    replace_existing=True
-                )
-            else:
-                # Если время задачи уже прошло, удаляем её из БД
-                await session.delete(task)
-        await session.commit()
\ No newline at end of file
+        row = (await session.execute(
+            select(ScheduledPost.type, ScheduledPost.next_run_at).where(ScheduledPost.id == post_id)
+        )).first()
+    if row is not None:
+        _schedule(_bot, post_id, row.type, row.next_run_at)
+
+
+def unschedule_post(post_type, post_id: int):
+    """Снимает задание удалённого поста здесь или, в режиме воркеров, в процессе планировщика."""
+    if scheduler.running:
+        remove_post_job(job_id(post_type, post_id))
+    else:
+        cache_bus.publish(POST_UNSCHEDULED, job_id(post_type, post_id))
+
+
+def remove_post_job(job: str):
+    if scheduler.running and scheduler.get_job(job):
+        scheduler.remove_job(job)
+
@@ -0,0 +1,170 @@
+# bot/send_plan.py
+import json
+import os
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.methods import (
+    SendMessage, SendPhoto, SendVideo, SendDocument, SendAudio, SendVoice,
+    SendAnimation, SendSticker, SendMediaGroup
+)
+from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+
+SEND_PLAN_CACHE_SIZE = int(os.getenv("SEND_PLAN_CACHE_SIZE", "1000"))
+PREVIEW_CONCURRENCY = int(os.getenv("PREVIEW_CONCURRENCY", "2"))  # превью постов, отправляемых админу одновременно
+
+# type -> (метод Bot API, поле с file_id, есть ли подпись)
+SINGLE_METHODS = {
+    "photo": (SendPhoto, "photo", True),
+    "video": (SendVideo, "video", True),
+    "document": (SendDocument, "document", True),
+    "audio": (SendAudio, "audio", True),
+    "voice": (SendVoice, "voice", False),
+    "animation": (SendAnimation, "animation", True),
+    "sticker": (SendSticker, "sticker", False),
+}
+ALBUM_MEDIA = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+# Какие типы Telegram разрешает смешивать в одном альбоме: фото с видео,
+# документы и аудио — только с такими же
+ALBUM_FAMILY = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+
+
+class PlanError(ValueError):
+    """Медиа поста не удаётся превратить в отправку — показываем админу при сохранении."""
+
+
+def compile_plan(content, media_file_id) -> dict:
+    """
+    Разбирает content и media_file_id поста (JSON-список, старый формат "ct+++fid"
+    или пусто) в JSON-план отправки, который хранится в scheduled_posts.send_plan.
+    """
+    text = content or ""
+    if not media_file_id:
+        return {"kind": "text", "text": text}
+
+    try:
+        items = json.loads(media_file_id)
+    except ValueError:
+        items = None
+
+    if not isinstance(items, list):
+        # Совместимость со старым форматом "ct+++fid"
+        if "+++" in media_file_id:
+            ct, fid = media_file_id.split("+++", 1)
+            items = [{"type": ct, "file_id": fid}]
+        else:
+            items = [{"type": "text", "file_id": None}]
+
+    if not items:
+        raise PlanError("пустой список медиа")
+
+    if len(items) > 1:
+        media = []
+        for item in items:
+            ct = item.get("type")
+            if ct not in ALBUM_MEDIA:
+                raise PlanError(f"тип «{ct}» нельзя отправить в альбоме")
+            if not item.get("file_id"):
+                raise PlanError(f"у элемента альбома «{ct}» нет file_id")
+            media.append({"type": ct, "file_id": item["file_id"]})
+        if len(media) > 10:
+            raise PlanError("в альбоме больше 10 элементов")
+        if len({ALBUM_FAMILY[item["type"]] for item in media}) > 1:
+            raise PlanError("документы и аудио нельзя смешивать в альбоме с фото, видео и друг с другом")
+        return {"kind": "album", "media": media, "caption": text}
+
+    ct, fid = items[0].get("type"), items[0].get("file_id")
+    if ct == "text" or not fid:
+        return {"kind": "text", "text": text}
+    if ct not in SINGLE_METHODS:
+        raise PlanError(f"неизвестный тип контента «{ct}»")
+    return {"kind": ct, "file_id": fid, "caption": text}
+
+
+class PreparedPlan:
+    """План с уже собранными аргументами метода: отправка — один вызов без разбора."""
+    __slots__ = ("kind", "method", "kwargs", "has_caption")
+
+    def __init__(self, plan: dict):
+        self.kind = plan["kind"]
+        if self.kind == "text":
+            self.method, self.has_caption = SendMessage, False
+            self.kwargs = {"text": plan["text"]}
+        elif self.kind == "album":
+            self.method, self.has_caption = SendMediaGroup, False
+            self.kwargs = {"media": [
+                ALBUM_MEDIA[item["type"]](media=item["file_id"], caption=plan["caption"] if i == 0 else None)
+                for i, item in enumerate(plan["media"])
+            ]}
+        else:
+            self.method, field, self.has_caption = SINGLE_METHODS[self.kind]
+            self.kwargs = {field: plan["file_id"]}
+            if self.has_caption:
+                self.kwargs["caption"] = plan["caption"]
+
+    async def send(self, bot: Bot, chat_id: int):
+        """Возвращает отправленное сообщение (для альбома — первое)."""
+        result = await bot(self.method(chat_id=chat_id, **self.kwargs))
+        return result[0] if self.kind == "album" else result
+
+    async def preview(self, bot: Bot, chat_id: int, params_text: str, reply_markup=None):
+        # Превью для админа: параметры рассылки — в подписи, если она есть, иначе отдельным сообщением
+        if self.kind == "text":
+            text = self.kwargs["text"] or "(пусто)"
+            await bot.send_message(chat_id, f"{text}\n\n{params_text}", reply_markup=reply_markup)
+        elif self.kind == "album":
+            await bot(self.method(chat_id=chat_id, **self.kwargs))
+            await bot.send_message(chat_id, params_text, reply_markup=reply_markup)
+        elif self.has_caption:
+            kwargs = dict(self.kwargs, caption=f"{self.kwargs['caption']}\n\n{params_text}")
+            await bot(self.method(chat_id=chat_id, reply_markup=reply_markup, **kwargs))
+        else:
+            await bot(self.method(chat_id=chat_id, reply_markup=reply_markup, **self.kwargs))
+            await bot.send_message(chat_id, params_text, reply_markup=reply_markup)
+
+
+class SendPlanCache:
+    """Собранные планы по post_id. Содержимое поста после сохранения не меняется — удалённый пост забывается через forget."""
+
+    def __init__(self, max_size: int = SEND_PLAN_CACHE_SIZE):
+        self.max_size = max_size
+        self._plans: OrderedDict[int, PreparedPlan] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.compiled = 0
+
+    def get(self, post) -> PreparedPlan:
+        """
+        План поста. Посты, сохранённые до появления send_plan, компилируются
+        здесь и получают план в объекте — вызывающий сохранит его коммитом.
+        """
+        key = post.id
+        prepared = self._plans.get(key)
+        if prepared is not None:
+            self.hits += 1
+            self._plans.move_to_end(key)
+            return prepared
+
+        self.misses += 1
+        if post.send_plan is None:
+            post.send_plan = compile_plan(post.content, post.media_file_id)
+            self.compiled += 1
+        prepared = PreparedPlan(post.send_plan)
+        self._plans[key] = prepared
+        while len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+        return prepared
+
+    def forget(self, post_id: int):
+        self._plans.pop(post_id, None)
+
+    def stats(self) -> dict:
+        return {"cached": len(self._plans), "hits": self.hits, "misses": self.misses, "compiled": self.compiled}
+
+
+send_plans = SendPlanCache()
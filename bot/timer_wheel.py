@@ -0,0 +1,150 @@
+# bot/timer_wheel.py
+import asyncio
+import math
+import os
+import time
+from array import array
+
+from aiogram import Bot
+
+from bot.deletion_batcher import deletion_batcher
+
+TIMER_WHEEL_TICK = float(os.getenv("TIMER_WHEEL_TICK", "1"))  # секунды
+RETRY_DELAY = 2  # секунды между повторными попытками
+
+ACTION_DELETE = 0
+ACTION_UNPIN = 1
+
+# Запись в ячейке: due_ms, chat_id, message_id, action, retries — пять int64 подряд
+FIELDS = 5
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров для коротких отложенных действий
+    (удалить предупреждение через 30 секунд, повторить откреп и т.п.).
+
+    Хендлер только кладёт запись в колесо и сразу возвращается; все записи
+    обслуживает одна фоновая задача, которая раз в тик проворачивает колесо.
+    Уровень L покрывает slots ** (L + 1) тиков, при переходе на следующий круг
+    ячейка верхнего уровня раскладывается по нижним.
+    """
+
+    def __init__(self, tick: float = TIMER_WHEEL_TICK, slots: int = 64, levels: int = 4):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels = [[array("q") for _ in range(slots)] for _ in range(levels)]
+        self._tick_no = int(time.time() / tick)
+        self._bot = None
+        self._task = None
+        self._running: set[asyncio.Task] = set()
+        self.depth = 0
+        self.fired = 0
+        self.failed = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def schedule(self, chat_id: int, message_id: int, delay: float, action: int = ACTION_DELETE, retries: int = 0):
+        due = time.time() + delay
+        self._place(int(due * 1000), chat_id, message_id, action, retries, min_tick=self._tick_no + 1)
+        self.depth += 1
+
+    def _place(self, due_ms, chat_id, message_id, action, retries, min_tick):
+        due_tick = max(math.ceil(due_ms / 1000 / self.tick), min_tick)
+        current = self._tick_no
+
+        for level in range(self.levels):
+            span = self.slots ** level
+            if due_tick // span - current // span < self.slots:
+                bucket = self._wheels[level][(due_tick // span) % self.slots]
+                break
+        else:
+            # Дальше горизонта колеса — в последнюю ячейку верхнего уровня, при каскаде разложим заново
+            span = self.slots ** (self.levels - 1)
+            bucket = self._wheels[-1][(current // span + self.slots - 1) % self.slots]
+
+        bucket.extend((due_ms, chat_id, message_id, action, retries))
+
+    def _take(self, level: int, index: int) -> array:
+        bucket = self._wheels[level][index]
+        if bucket:
+            self._wheels[level][index] = array("q")
+        return bucket
+
+    def _advance(self, now: float) -> list:
+        due = []
+        target = int(now / self.tick)
+        while self._tick_no < target:
+            self._tick_no += 1
+            tick_no = self._tick_no
+
+            # Каскад сверху вниз: записи текущего круга переезжают на нижние уровни
+            for level in range(self.levels - 1, 0, -1):
+                span = self.slots ** level
+                if tick_no % span:
+                    continue
+                bucket = self._take(level, (tick_no // span) % self.slots)
+                for i in range(0, len(bucket), FIELDS):
+                    self._place(*bucket[i:i + FIELDS], min_tick=tick_no)
+
+            bucket = self._take(0, tick_no % self.slots)
+            if bucket:
+                due.append(bucket)
+        return due
+
+    async def _loop(self):
+        while True:
+            next_tick_at = (self._tick_no + 1) * self.tick
+            await asyncio.sleep(max(0.0, next_tick_at - time.time()))
+
+            now = time.time()
+            for bucket in self._advance(now):
+                for i in range(0, len(bucket), FIELDS):
+                    due_ms, chat_id, message_id, action, retries = bucket[i:i + FIELDS]
+                    self.depth -= 1
+                    self.fired += 1
+                    self.lag = max(0.0, now - due_ms / 1000)
+                    self.max_lag = max(self.max_lag, self.lag)
+
+                    task = asyncio.create_task(self._execute(chat_id, message_id, action, retries))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+
+    async def _execute(self, chat_id: int, message_id: int, action: int, retries: int):
+        try:
+            if action == ACTION_UNPIN:
+                await self._bot.unpin_chat_message(chat_id=chat_id, message_id=message_id)
+            elif not await deletion_batcher.delete(chat_id, message_id):
+                raise RuntimeError("сообщение не удалено")
+        except Exception as e:
+            if retries > 0:
+                self.schedule(chat_id, message_id, RETRY_DELAY, action, retries - 1)
+            else:
+                self.failed += 1
+                name = "открепить" if action == ACTION_UNPIN else "удалить"
+                print(f"[!] Не удалось {name} сообщение {message_id} в {chat_id}: {e}")
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._tick_no = int(time.time() / self.tick)
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "in_flight": len(self._running),
+            "fired": self.fired,
+            "failed": self.failed,
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+        }
+
+
+timer_wheel = TimerWheel()
@@ -0,0 +1,68 @@
+# bot/webhook.py
+import asyncio
+import os
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес; пусто — setWebhook не вызываем (локальный запуск)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+
+def build_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """
+    aiohttp-приложение, принимающее апдейты на WEBHOOK_PATH. Запросы без верного
+    заголовка X-Telegram-Bot-Api-Secret-Token отклоняются с 401. Telegram получает
+    ответ сразу, апдейт обрабатывается в фоне.
+    """
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    # Старт/остановка приложения вызывают dp.startup / dp.shutdown
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def build_raw_app(route) -> web.Application:
+    """Вебхук супервизора (bot/workers.py): проверяет секрет и отдаёт апдейт в route(dict) без разбора aiogram."""
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401)
+        route(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, allowed_updates: list[str]):
+    await serve(build_app(dp, bot), bot, allowed_updates)
+
+
+async def serve(app: web.Application, bot: Bot, allowed_updates: list[str]):
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET")
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    print(f"Webhook слушает http://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates,
+        )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
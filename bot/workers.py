@@ -0,0 +1,210 @@
+# bot/workers.py
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import aiohttp
+from aiogram import Bot
+
+from bot.cache_bus import cache_bus
+from bot.rate_limiter import rate_governor
+from bot.middlewares.recorder import worker_log_path, UPDATE_LOG, UPDATE_LOG_SALT
+from bot.webhook import build_raw_app, serve
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WORKER_REPORT_INTERVAL = float(os.getenv("WORKER_REPORT_INTERVAL", "60"))  # секунды
+SCHEDULER_WORKER = 0  # только этот воркер ведёт планировщик и фоновые очереди
+POLL_TIMEOUT = 30
+
+
+def update_chat_id(update: dict) -> int:
+    # chat.id из message / callback_query.message / chat_member...; для остального — from.id
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat") or value.get("from") or {}
+        return chat.get("id", 0)
+    return 0
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    return chat_id % workers
+
+
+# --- воркер ---
+
+def worker_main(worker_id: int, workers: int, inbox, outbox):
+    try:
+        asyncio.run(_worker(worker_id, workers, inbox, outbox))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker(worker_id: int, workers: int, inbox, outbox):
+    # Импорт здесь: bot.main импортирует этот модуль. Bot, Dispatcher и middleware
+    # собирает build_app() — по одному на процесс
+    from bot import main
+
+    # Журнал апдейтов — в свой файл: общий файл из нескольких процессов портится
+    app = main.build_app(update_log=worker_log_path(UPDATE_LOG, worker_id) if UPDATE_LOG else "")
+    rate_governor.set_share(workers)
+    cache_bus.attach(worker_id, outbox)
+    # Метрики каждого воркера — на своём порту: METRICS_PORT + номер воркера
+    metrics_port = main.METRICS_PORT + worker_id if main.METRICS_PORT else 0
+    await main.on_startup(app, run_scheduler=worker_id == SCHEDULER_WORKER, metrics_port=metrics_port)
+
+    loop = asyncio.get_running_loop()
+    running: set[asyncio.Task] = set()
+    counters = {"processed": 0, "errors": 0, "busy": 0.0}
+
+    async def process(update: dict):
+        started = time.monotonic()
+        try:
+            await app.dp.feed_raw_update(app.bot, update)
+            counters["processed"] += 1
+        except Exception as e:
+            counters["errors"] += 1
+            print(f"[!] Воркер {worker_id}: ошибка обработки апдейта {update.get('update_id')}: {e}")
+        finally:
+            counters["busy"] += time.monotonic() - started
+
+    async def report():
+        while True:
+            await asyncio.sleep(WORKER_REPORT_INTERVAL)
+            outbox.put(("stats", worker_id, dict(counters, in_flight=len(running))))
+
+    reporter = asyncio.create_task(report())
+    try:
+        while True:
+            message = await loop.run_in_executor(None, inbox.get)
+            if message is None:
+                break
+            if message[0] == "update":
+                # Как и при polling, апдейты обрабатываются задачами; чат целиком живёт в этом процессе
+                task = asyncio.create_task(process(message[1]))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            else:
+                await cache_bus.apply(message[0], message[1])
+    finally:
+        reporter.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        await main.on_shutdown(app)
+        await app.bot.session.close()
+
+
+# --- супервизор ---
+
+class Supervisor:
+    """
+    Принимает апдейты (long polling или вебхук) и раскладывает их по N процессам-воркерам
+    по chat_id, не разбирая их aiogram-ом. Все апдейты одного чата попадают в один воркер,
+    поэтому его кэши (группа, счётчики, статусы участников) остаются верными.
+    Инвалидации кэшей из одного воркера пересылаются остальным.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        ctx = multiprocessing.get_context("spawn")
+        self.outbox = ctx.Queue()
+        self.inboxes = [ctx.Queue() for _ in range(workers)]
+        self.processes = [
+            ctx.Process(target=worker_main, args=(i, workers, self.inboxes[i], self.outbox), name=f"bot-worker-{i}")
+            for i in range(workers)
+        ]
+        self.routed = [0] * workers
+        self._last = [None] * workers  # (время, processed, busy) прошлого отчёта
+
+    def route(self, update: dict):
+        shard = shard_for(update_chat_id(update), self.workers)
+        self.routed[shard] += 1
+        self.inboxes[shard].put(("update", update))
+
+    def _report(self, worker_id: int, counters: dict):
+        now = time.monotonic()
+        last = self._last[worker_id]
+        self._last[worker_id] = (now, counters["processed"], counters["busy"])
+        if last is None:
+            return
+        elapsed = now - last[0]
+        rate = (counters["processed"] - last[1]) / elapsed
+        load = (counters["busy"] - last[2]) / elapsed
+        print(
+            f"[worker {worker_id}] получено {self.routed[worker_id]}, обработано {counters['processed']} "
+            f"({rate:.1f}/с), ошибок {counters['errors']}, в работе {counters['in_flight']}, "
+            f"занятость обработчиков {load:.0%}"
+        )
+
+    async def _read_outbox(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self.outbox.get)
+            if message is None:
+                return
+            if message[0] == "invalidate":
+                _, source, kind, args = message
+                for worker_id, inbox in enumerate(self.inboxes):
+                    if worker_id != source:
+                        inbox.put((kind, args))
+            elif message[0] == "stats":
+                self._report(message[1], message[2])
+
+    async def _poll(self, bot: Bot, allowed_updates: list[str]):
+        # Сырой getUpdates: разбор апдейтов — работа воркеров
+        await bot.delete_webhook()
+        url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+        offset = None
+        async with aiohttp.ClientSession() as http:
+            while True:
+                params = {"timeout": POLL_TIMEOUT, "allowed_updates": json.dumps(allowed_updates)}
+                if offset is not None:
+                    params["offset"] = offset
+                try:
+                    timeout = aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)
+                    async with http.get(url, params=params, timeout=timeout) as response:
+                        data = await response.json()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"[!] Ошибка getUpdates: {e}")
+                    await asyncio.sleep(1)
+                    continue
+
+                if not data.get("ok"):
+                    print(f"[!] getUpdates вернул ошибку: {data.get('description')}")
+                    await asyncio.sleep(data.get("parameters", {}).get("retry_after", 1))
+                    continue
+
+                for update in data["result"]:
+                    offset = update["update_id"] + 1
+                    self.route(update)
+
+    async def run(self, bot: Bot, allowed_updates: list[str], mode: str):
+        # Одна соль на все воркеры — одинаковые подменные id пользователей во всех журналах
+        os.environ["UPDATE_LOG_SALT"] = UPDATE_LOG_SALT
+        for process in self.processes:
+            process.start()
+        print(f"Запущено воркеров: {self.workers}, планировщик в воркере {SCHEDULER_WORKER}")
+
+        reader = asyncio.create_task(self._read_outbox())
+        try:
+            if mode == "webhook":
+                await serve(build_raw_app(self.route), bot, allowed_updates)
+            else:
+                await self._poll(bot, allowed_updates)
+        finally:
+            for inbox in self.inboxes:
+                inbox.put(None)
+            loop = asyncio.get_running_loop()
+            for process in self.processes:
+                await loop.run_in_executor(None, process.join)
+            self.outbox.put(None)
+            await reader
+
+
+async def run_supervisor(bot: Bot, allowed_updates: list[str], mode: str, workers: int = BOT_WORKERS):
+    try:
+        await Supervisor(workers).run(bot, allowed_updates, mode)
+    finally:
+        await bot.session.close()
@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+
+from db.models import Group
+
+
+@dataclass(slots=True)
+class GroupPage:
+    groups: list
+    has_prev: bool
+    has_next: bool
+
+
+def keyset_cursors(items: list, has_prev: bool) -> tuple[str, str, str]:
+    """
+    Курсоры страницы для callback_data: текущая, назад, вперёд.
+    "a" — первая страница, "a<id>" — записи после id, "b<id>" — записи перед id.
+    """
+    if not items:
+        return "a", "a", "a"
+    first, last = items[0].id, items[-1].id
+    current = f"a{first - 1}" if has_prev else "a"
+    return current, f"b{first}", f"a{last}"
+
+
+def page_cursors(page: GroupPage) -> tuple[str, str, str]:
+    return keyset_cursors(page.groups, page.has_prev)
+
+
+def parse_cursor(raw: str) -> tuple:
+    """Курсор -> (after, before). Непонятное (в т.ч. номера страниц со старых кнопок) — первая страница."""
+    direction, value = raw[:1], raw[1:]
+    try:
+        value = int(value) if value else None
+    except ValueError:
+        return None, None
+    if direction == "b" and value is not None:
+        return None, value
+    if direction == "a":
+        return value, None
+    return None, None
+
+
+async def _fetch_page(session, username, size: int, after: Optional[int], before: Optional[int]) -> GroupPage:
+    stmt = select(Group).where(Group.admin_username == username)
+    if before is not None:
+        stmt = stmt.where(Group.id < before).order_by(Group.id.desc())
+    else:
+        if after is not None:
+            stmt = stmt.where(Group.id > after)
+        stmt = stmt.order_by(Group.id)
+
+    # Лишняя строка только показывает, есть ли страница дальше
+    groups = list((await session.execute(stmt.limit(size + 1))).scalars())
+    more = len(groups) > size
+    groups = groups[:size]
+
+    if before is not None:
+        groups.reverse()
+        return GroupPage(groups, has_prev=more, has_next=True)
+    return GroupPage(groups, has_prev=after is not None, has_next=more)
+
+
+async def admin_groups_page(session, username, size: int, cursor: str = "a") -> GroupPage:
+    """
+    Страница групп админа по ключу (admin_username, id) — индекс ix_groups_admin_username_id,
+    читается не больше size + 1 строк.
+    """
+    after, before = parse_cursor(cursor)
+    page = await _fetch_page(session, username, size, after, before)
+    if not page.groups and (after is not None or before is not None):
+        # Группы могли удалить, пока админ листал, — начинаем сначала
+        page = await _fetch_page(session, username, size, None, None)
+    return page
@@ -0,0 +1,73 @@
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import UnblockedUserLimit
+
+limits_table = UnblockedUserLimit.__table__
+
+
+async def consume_quota(session, group_id: int, user_id: int, base_limit=None, username=None):
+    """
+    Засчитывает одно сообщение одним запросом INSERT ... ON CONFLICT ... RETURNING.
+
+    Новая запись создаётся с лимитом группы. Существующая увеличивает used_messages
+    только если лимит ещё не исчерпан (или безлимит) — тогда RETURNING пустой.
+    Возвращает (allowed, max_messages, used_messages, delete_after_minutes).
+    """
+    t = limits_table
+    stmt = insert(t).values(
+        group_id=group_id,
+        user_id=user_id,
+        max_messages=base_limit,
+        used_messages=1 if base_limit else 0,
+        username=username,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.group_id, t.c.user_id],
+        set_={
+            "used_messages": case(
+                (t.c.max_messages.is_(None), t.c.used_messages),
+                else_=func.coalesce(t.c.used_messages, 0) + 1,
+            ),
+            "username": func.coalesce(stmt.excluded.username, t.c.username),
+        },
+        where=or_(
+            t.c.max_messages.is_(None),
+            func.coalesce(t.c.used_messages, 0) < t.c.max_messages,
+        ),
+    ).returning(t.c.max_messages, t.c.used_messages, t.c.delete_after_minutes)
+
+    row = (await session.execute(stmt)).first()
+    if row is None:
+        # Запись есть, лимит исчерпан
+        return False, None, None, None
+
+    max_messages, used, delete_after = row
+    used = used or 0
+    allowed = max_messages is None or 0 < used <= max_messages
+    return allowed, max_messages, used, delete_after
+
+
+async def reset_user_limit(session, group_id: int, user_id: int, max_messages=None, username=None,
+                           can_send=None) -> int:
+    """Создаёт запись или выставляет ей лимит группы. Возвращает used_messages."""
+    t = limits_table
+    stmt = insert(t).values(
+        group_id=group_id,
+        user_id=user_id,
+        max_messages=max_messages,
+        used_messages=0,
+        username=username,
+        can_send=can_send,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.group_id, t.c.user_id],
+        set_={
+            "max_messages": stmt.excluded.max_messages,
+            "username": func.coalesce(stmt.excluded.username, t.c.username),
+            "can_send": stmt.excluded.can_send,
+        },
+    ).returning(t.c.used_messages)
+
+    used = (await session.execute(stmt)).scalar_one()
+    return used or 0
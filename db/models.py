@@ -1,12 +1,12 @@
 from sqlalchemy import (
     Column, BigInteger, Integer, Text, ForeignKey,
-    Enum, Boolean, DateTime, Interval, String
+    Enum, Boolean, DateTime, Interval, String, UniqueConstraint, Index
 )
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import declarative_base
 import enum
 import datetime
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import JSON, JSONB
 
 Base = declarative_base()
 
@@ -20,6 +20,10 @@ class Admin(Base, AsyncAttrs):
 
 class Group(Base, AsyncAttrs):
     __tablename__ = "groups"
+    __table_args__ = (
+        # Список групп админа листается по ключу (admin_username, id)
+        Index("ix_groups_admin_username_id", "admin_username", "id"),
+    )
 
     id = Column(BigInteger, primary_key=True)
     title = Column(Text)
@@ -41,14 +45,19 @@ class MessageSchedule(Base, AsyncAttrs):  # можно удалить в буд
 
 class UnblockedUserLimit(Base, AsyncAttrs):
     __tablename__ = "unblocked_limits"
+    __table_args__ = (
+        # Лимит ведётся отдельно в каждой группе; индекс нужен и для upsert-ов
+        UniqueConstraint("group_id", "user_id", name="uq_unblocked_limits_group_user"),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(BigInteger, unique=True)  # Уникальное поле
+    user_id = Column(BigInteger)
     group_id = Column(BigInteger, ForeignKey("groups.id"))
     max_messages = Column(Integer)  # 0 = без ограничений
     used_messages = Column(Integer, default=0)
     delete_after_minutes = Column(Integer, nullable=True)
     username = Column(Text, nullable=True)
+    can_send = Column(Boolean, nullable=True)  # последние выданные права; None = неизвестно
 
 
 class PostType(str, enum.Enum):
@@ -80,11 +89,74 @@ class ScheduledPost(Base, AsyncAttrs):
     delete_type = Column(Text, default="none")  # none / immediately / after / after_unpin
     delete_after_minutes = Column(Integer, nullable=True)
 
+    # Готовый план отправки (bot/send_plan.py)
+    send_plan = Column(JSONB, nullable=True)
 
-class ScheduledTask(Base):
+    # Когда отправить в следующий раз (по нему планировщик подтягивает ближайшие посты)
+    next_run_at = Column(DateTime, nullable=True, index=True)
+
+
+class PostTarget(Base):  # группы, в которые уходит пост, и итог последней доставки
+    __tablename__ = "post_targets"
+    __table_args__ = (
+        # Запланированные посты группы листаются по ключу (group_id, post_id)
+        Index("ix_post_targets_group_id_post_id", "group_id", "post_id"),
+    )
+
+    post_id = Column(Integer, ForeignKey("scheduled_posts.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(BigInteger, ForeignKey("groups.id", ondelete="CASCADE"), primary_key=True, index=True)
+    last_status = Column(Text, nullable=True)  # ok / failed
+    last_message_id = Column(BigInteger, nullable=True)
+    last_error = Column(Text, nullable=True)
+    last_sent_at = Column(DateTime, nullable=True)
+    sent_count = Column(Integer, nullable=False, default=0, server_default="0")
+    failed_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class ScheduledTask(Base):  # очередь отложенных действий (bot/delayed_actions.py)
     __tablename__ = "scheduled_tasks"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     chat_id = Column(BigInteger, nullable=False)
     message_id = Column(BigInteger, nullable=False)
-    run_at = Column(DateTime, nullable=False)
\ No newline at end of file
+    run_at = Column(DateTime, nullable=False, index=True)
+    action = Column(Text, nullable=False, default="delete", server_default="delete")  # delete / unpin
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class RestrictJob(Base):  # фоновое применение прав к пользователям группы (bot/bulk_restrict.py)
+    __tablename__ = "restrict_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    group_id = Column(BigInteger, nullable=False, index=True)
+    can_send = Column(Boolean, nullable=False)
+    status = Column(Text, nullable=False, default="running")  # running / done / cancelled
+    cursor = Column(BigInteger, nullable=False, default=0)  # последний обработанный user_id
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    progress_chat_id = Column(BigInteger, nullable=True)
+    progress_message_id = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+
+class BackfillCheckpoint(Base):  # прогресс разовых обходов пользователей (bot/allow_sending_media.py)
+    __tablename__ = "backfill_checkpoints"
+
+    name = Column(Text, primary_key=True)  # имя обхода
+    group_id = Column(BigInteger, primary_key=True)
+    cursor = Column(BigInteger, nullable=False, default=0)  # последний обработанный user_id
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    done = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now)
+
+
+class FsmState(Base):  # состояние диалогов админки (bot/fsm_storage.py)
+    __tablename__ = "fsm_states"
+
+    key = Column(Text, primary_key=True)  # bot_id:chat_id:user_id:thread_id:destiny
+    state = Column(Text, nullable=True)
+    data = Column(Text, nullable=False, default="{}")  # компактный JSON
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now, index=True)
@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import defer
+
+from db.groups import keyset_cursors, parse_cursor
+from db.models import ScheduledPost, PostTarget
+
+
+@dataclass(slots=True)
+class PostPage:
+    posts: list
+    has_prev: bool
+    has_next: bool
+
+
+def post_page_cursors(page: PostPage) -> tuple[str, str, str]:
+    return keyset_cursors(page.posts, page.has_prev)
+
+
+async def _fetch_page(session, group_id: int, size: int, after: Optional[int], before: Optional[int],
+                      with_content: bool) -> PostPage:
+    # Посты, которые уходят в эту группу (в т.ч. созданные из другой группы)
+    stmt = (
+        select(ScheduledPost)
+        .join(PostTarget, PostTarget.post_id == ScheduledPost.id)
+        .where(PostTarget.group_id == group_id)
+    )
+    if not with_content:
+        # Для оглавления хватает параметров рассылки — текст и план не читаем
+        stmt = stmt.options(defer(ScheduledPost.content), defer(ScheduledPost.media_file_id),
+                            defer(ScheduledPost.send_plan))
+    if before is not None:
+        stmt = stmt.where(PostTarget.post_id < before).order_by(PostTarget.post_id.desc())
+    else:
+        if after is not None:
+            stmt = stmt.where(PostTarget.post_id > after)
+        stmt = stmt.order_by(PostTarget.post_id)
+
+    posts = list((await session.execute(stmt.limit(size + 1))).scalars())
+    more = len(posts) > size
+    posts = posts[:size]
+
+    if before is not None:
+        posts.reverse()
+        return PostPage(posts, has_prev=more, has_next=True)
+    return PostPage(posts, has_prev=after is not None, has_next=more)
+
+
+async def group_posts_page(session, group_id: int, size: int, cursor: str = "a",
+                           with_content: bool = False) -> PostPage:
+    """
+    Страница запланированных постов группы по ключу (group_id, post_id) —
+    индекс ix_post_targets_group_id_post_id, читается не больше size + 1 строк.
+    with_content=True — вместе с содержимым и планом отправки (для превью).
+    """
+    after, before = parse_cursor(cursor)
+    page = await _fetch_page(session, group_id, size, after, before, with_content)
+    if not page.posts and (after is not None or before is not None):
+        # Посты могли удалить, пока админ листал, — начинаем сначала
+        page = await _fetch_page(session, group_id, size, None, None, with_content)
+    return page
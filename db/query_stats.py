@@ -0,0 +1,112 @@
+# db/query_stats.py
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))   # порог медленного запроса; 0 — не логировать
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))       # запросов на один апдейт; 0 — без проверки
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"  # превышение — исключение (тесты, замеры)
+KEEP_STATEMENTS = 20  # сколько запросов апдейта помнить для отчёта о превышении
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class UpdateQueries:
+    """Запросы, сделанные в рамках одного апдейта (и задач, запущенных из его хендлера)."""
+
+    __slots__ = ("update_id", "handler", "count", "seconds", "statements")
+
+    def __init__(self, update_id: int):
+        self.update_id = update_id
+        self.handler = None
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: list[str] = []
+
+    def describe(self) -> str:
+        return f"апдейт {self.update_id}, {self.handler or 'без хендлера'}"
+
+
+_current: ContextVar[Optional[UpdateQueries]] = ContextVar("update_queries", default=None)
+
+# хендлер -> [апдейтов, запросов, секунд в БД]
+per_handler: dict[str, list] = {}
+
+
+def begin(update_id: int):
+    """Начинает учёт запросов апдейта в текущем контексте. Возвращает токен для finish()."""
+    return _current.set(UpdateQueries(update_id))
+
+
+def tag(handler: str):
+    current = _current.get()
+    if current is not None:
+        current.handler = handler
+
+
+def finish(token) -> UpdateQueries:
+    current = _current.get()
+    _current.reset(token)
+
+    totals = per_handler.get(current.handler)
+    if totals is None:
+        totals = per_handler[current.handler] = [0, 0, 0.0]
+    totals[0] += 1
+    totals[1] += current.count
+    totals[2] += current.seconds
+
+    if QUERY_BUDGET and current.count > QUERY_BUDGET:
+        message = (
+            f"Бюджет запросов превышен: {current.count} > {QUERY_BUDGET} "
+            f"({current.describe()}, {current.seconds * 1000:.1f} мс в БД)"
+        )
+        if QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message + "\n  " + "\n  ".join(current.statements))
+        print(f"[!] {message}")
+    return current
+
+
+def param_shape(parameters, executemany: bool) -> str:
+    # Только типы и количество — значения (тексты, id пользователей) в лог не попадают
+    if executemany:
+        rows = list(parameters or ())
+        return f"{len(rows)} строк x {param_shape(rows[0], False) if rows else '()'}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+
+    current = _current.get()
+    if current is not None:
+        current.count += 1
+        current.seconds += elapsed
+        if len(current.statements) < KEEP_STATEMENTS:
+            current.statements.append(" ".join(statement.split())[:200])
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        where = current.describe() if current is not None else "вне апдейта"
+        print(
+            f"[!] Медленный запрос {elapsed * 1000:.1f} мс ({where}): "
+            f"{' '.join(statement.split())[:500]} параметры: {param_shape(parameters, executemany)}"
+        )
+
+
+def install(engine):
+    """Вешает учёт на движок: счётчик и время запросов текущего апдейта, лог медленных запросов."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
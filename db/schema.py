@@ -0,0 +1,39 @@
+from sqlalchemy import text
+
+# create_all не меняет уже существующие таблицы, поэтому изменения схемы
+# для старых баз применяем здесь. Каждая команда должна быть идемпотентной.
+SCHEMA_UPGRADES = [
+    # unblocked_limits: уникальность (group_id, user_id) вместо глобального user_id
+    "ALTER TABLE unblocked_limits DROP CONSTRAINT IF EXISTS unblocked_limits_user_id_key",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_unblocked_limits_group_user ON unblocked_limits (group_id, user_id)",
+    # scheduled_tasks: очередь отложенных действий
+    "ALTER TABLE scheduled_tasks ADD COLUMN IF NOT EXISTS action TEXT NOT NULL DEFAULT 'delete'",
+    "ALTER TABLE scheduled_tasks ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS ix_scheduled_tasks_run_at ON scheduled_tasks (run_at)",
+    # unblocked_limits: какие права уже выданы (массовое применение пропускает совпадающих)
+    "ALTER TABLE unblocked_limits ADD COLUMN IF NOT EXISTS can_send BOOLEAN",
+    # scheduled_posts: время следующей отправки для планирования в пределах горизонта
+    "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS next_run_at TIMESTAMP WITHOUT TIME ZONE",
+    "CREATE INDEX IF NOT EXISTS ix_scheduled_posts_next_run_at ON scheduled_posts (next_run_at)",
+    "UPDATE scheduled_posts SET next_run_at = scheduled_datetime "
+    "WHERE next_run_at IS NULL AND type = 'datetime'",
+    # Как раньше: интервальная рассылка после старта ждёт один интервал
+    "UPDATE scheduled_posts SET next_run_at = now()::timestamp + interval_minutes * interval '1 minute' "
+    "WHERE next_run_at IS NULL AND type = 'interval'",
+    # scheduled_posts: скомпилированный план отправки (старые посты получат его при первой отправке)
+    "ALTER TABLE scheduled_posts ADD COLUMN IF NOT EXISTS send_plan JSONB",
+    # post_targets: посты, созданные до рассылки в несколько групп, уходят в свою группу.
+    # Только пока таблица пуста (первый запуск после обновления): новый пост всегда получает
+    # хотя бы одну группу, а группы, убранные админом, не должны возвращаться после рестарта
+    "INSERT INTO post_targets (post_id, group_id) SELECT id, group_id FROM scheduled_posts "
+    "WHERE group_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM post_targets) ON CONFLICT DO NOTHING",
+    # groups: постраничный список групп админа
+    "CREATE INDEX IF NOT EXISTS ix_groups_admin_username_id ON groups (admin_username, id)",
+    # post_targets: постраничный список запланированных постов группы
+    "CREATE INDEX IF NOT EXISTS ix_post_targets_group_id_post_id ON post_targets (group_id, post_id)",
+]
+
+
+async def upgrade_schema(conn):
+    for statement in SCHEMA_UPGRADES:
+        await conn.execute(text(statement))
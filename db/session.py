@@ -5,7 +5,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Пороги читаются из окружения при импорте — поэтому после load_dotenv
+from db import query_stats
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 engine = create_async_engine(DATABASE_URL, echo=False)
-AsyncSession = async_sessionmaker(engine, expire_on_commit=False)
\ No newline at end of file
+AsyncSession = async_sessionmaker(engine, expire_on_commit=False)
+
+# Учёт запросов по апдейтам и лог медленных запросов (db/query_stats.py)
+query_stats.install(engine)